@@ -1,117 +1,623 @@
+import asyncio
+import hashlib
+import json
 import os
 import yaml
 import time
 import uuid
-from typing import Dict, Any, Optional, List
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Set, Tuple, Callable, AsyncIterator
 from pathlib import Path
 from dotenv import load_dotenv
 
-from langgraph.graph import StateGraph, END
-from state import AgentState, FlowType, ExecutionContext, ValidationResult
-from nodes import SearchNode, LLMNode, MathNode, OutputNode
+import metrics
+import nodes as node_registry
+import tracing
+from state import AgentState, FlowType, ExecutionContext, ValidationResult, NodeResult
+from cache import ResultCache
+from history import HistoryStore
+from flowgraph import FlowPlan, JoinProgress
+from semantic_cache import SemanticCache
+from router import FlowRouter
+from upstream import Cassette, Hedger, RetryPolicy, breaker_for, limiter_for
+
+# Node types available to flows; classes are imported on first use
+NODE_TYPES = ["SearchNode", "LLMNode", "MathNode", "OutputNode", "ReaderNode"]
+
+# Bump when validation rules change so stale cached configs are re-validated
+CONFIG_CACHE_VERSION = 2
+
+# State keys merged by reducer; nodes return only the entries they changed
+MERGED_STATE_KEYS = ("node_results", "validation_results", "cache_status")
+
+# Parsed and validated configs, keyed by a hash of the YAML file
+_config_cache: Dict[str, Dict[str, Any]] = {}
 
 class MultiFlowAgent:
     """Main agent orchestrator for handling multiple dynamic flows"""
     
     def __init__(self, config_path: str = "configs/flows.yaml"):
-        load_dotenv()
+        # Startup breakdown in seconds, in the order steps ran
+        self.timings: Dict[str, float] = {}
+        
+        with self._timed("load .env"):
+            load_dotenv()
+        
+        # Load configuration (parsed and validated once per YAML content)
+        with self._timed("load config"):
+            self.config = self._load_config(config_path)
+            self.flows = self.config["flows"]
+            self.routing_patterns = self.config.get("routing", {}).get("patterns", {})
         
-        # Load configuration
-        self.config = self._load_config(config_path)
-        self.flows = self.config["flows"]
-        self.routing_patterns = self.config.get("routing", {}).get("patterns", {})
+        # Compile routing table once at load time
+        with self._timed("compile router"):
+            self.router = FlowRouter(
+                self.routing_patterns,
+                priorities=self.config.get("routing", {}).get("priorities"),
+                default_flow=FlowType.LLM.value
+            )
+        
+        # Initialize result cache
+        with self._timed("open result cache"):
+            self.cache = self._initialize_cache()
+        
+        # Optional record/replay of upstream traffic (AGENT_CASSETTE)
+        self.cassette = self._initialize_cassette()
+        
+        # Per-request spans, appended to an NDJSON file for `main.py trace`
+        self.tracer = tracing.Tracer(
+            os.getenv("AGENT_TRACE_FILE", "data/traces.ndjson")
+            if os.getenv("AGENT_TRACE", "true").lower() == "true" else None
+        )
+        
+        # Every execution, for `main.py history` and `main.py stats`
+        self.history = (
+            HistoryStore(
+                os.getenv("AGENT_HISTORY_FILE", "data/history.sqlite3"),
+                retention_days=float(os.getenv("AGENT_HISTORY_RETENTION_DAYS", "30"))
+            )
+            if os.getenv("AGENT_HISTORY", "true").lower() == "true" else None
+        )
         
-        # Initialize nodes
-        self.nodes = self._initialize_nodes()
+        # Nodes and graphs are built lazily, when a flow first needs them
+        self.nodes: Dict[str, Any] = {}
+        self.graphs: Dict[str, Any] = {}
         
-        # Build graphs for each flow
-        self.graphs = self._build_graphs()
+        # Node types whose startup() has run; set once the agent is entered
+        self._started: Optional[Set[str]] = None
+        
+        # Branch progress of parallel flows, per request and join node
+        self._joins: Dict[str, Dict[str, JoinProgress]] = {}
+        
+        # Conversation memory, opened when a request first names a session
+        self._sessions: Optional[Any] = None
+    
+    @contextmanager
+    def _timed(self, label: str):
+        """Record how long a startup step takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[label] = self.timings.get(label, 0.0) + time.perf_counter() - start
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
-        """Load YAML configuration"""
+        """Load YAML configuration, reusing a cached parse when the file is unchanged"""
         try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
+            with open(config_path, 'rb') as file:
+                raw = file.read()
         except FileNotFoundError:
             raise FileNotFoundError(f"Configuration file not found: {config_path}")
-        except yaml.YAMLError as e:
-            raise ValueError(f"Invalid YAML configuration: {e}")
-    
-    def _initialize_nodes(self) -> Dict[str, Any]:
-        """Initialize all node instances"""
-        nodes = {}
         
-        # Get API keys
-        google_api_key = os.getenv("GOOGLE_API_KEY")
-        serper_api_key = os.getenv("SERPER_API_KEY")
+        digest = hashlib.sha256(raw + f"\0v{CONFIG_CACHE_VERSION}".encode()).hexdigest()
         
-        if not google_api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable is required")
-        if not serper_api_key:
-            raise ValueError("SERPER_API_KEY environment variable is required")
+        # Same process: reuse the parsed config as-is
+        if digest in _config_cache:
+            return _config_cache[digest]
         
-        # Initialize nodes
-        nodes["SearchNode"] = SearchNode(serper_api_key)
-        nodes["LLMNode"] = LLMNode(google_api_key)
-        nodes["MathNode"] = MathNode()
-        nodes["OutputNode"] = OutputNode()
+        # Previous process: JSON parses far faster than YAML
+        cache_file = Path(os.getenv("AGENT_CACHE_DIR", ".cache")) / "config" / f"{digest}.json"
+        try:
+            config = json.loads(cache_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            config = None
         
-        return nodes
+        if config is None:
+            try:
+                config = yaml.safe_load(raw)
+            except yaml.YAMLError as e:
+                raise ValueError(f"Invalid YAML configuration: {e}")
+            self._validate_config(config)
+            self._write_config_cache(cache_file, config)
+        
+        _config_cache[digest] = config
+        return config
     
-    def _build_graphs(self) -> Dict[str, StateGraph]:
-        """Build LangGraph workflows for each flow"""
-        graphs = {}
+    @staticmethod
+    def _write_config_cache(cache_file: Path, config: Dict[str, Any]):
+        """Persist a validated config; caching is best-effort"""
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps(config), encoding="utf-8")
+            os.replace(tmp_file, cache_file)
+        except (OSError, TypeError, ValueError):
+            pass
+    
+    @staticmethod
+    def _validate_config(config: Dict[str, Any]):
+        """Check flow definitions without building any nodes"""
+        if not isinstance(config, dict) or not isinstance(config.get("flows"), dict):
+            raise ValueError("Configuration must define a 'flows' mapping")
         
-        for flow_name, flow_config in self.flows.items():
-            graph = StateGraph(AgentState)
+        for flow_name, flow_config in config["flows"].items():
+            flow_nodes = flow_config.get("nodes") or []
+            if not flow_nodes:
+                raise ValueError(f"Flow '{flow_name}' has no nodes")
             
-            # Add nodes to graph
-            for node_config in flow_config["nodes"]:
-                node_name = node_config["name"]
-                node_type = node_config["type"]
-                
-                if node_type in self.nodes:
-                    node_instance = self.nodes[node_type]
-                    graph.add_node(node_name, node_instance.execute)
-                else:
-                    raise ValueError(f"Unknown node type: {node_type}")
+            for node_config in flow_nodes:
+                if node_config["type"] not in NODE_TYPES:
+                    raise ValueError(f"Unknown node type: {node_config['type']}")
+            # Checks references, cycles and parallel branch/join structure
+            FlowPlan(flow_name, flow_config)
             
-            # Add edges
-            for node_config in flow_config["nodes"]:
-                node_name = node_config["name"]
-                next_node = node_config.get("next")
-                
-                if next_node:
-                    graph.add_edge(node_name, next_node)
-                else:
-                    graph.add_edge(node_name, END)
+            fallback = flow_config.get("fallback")
+            if fallback is not None:
+                if fallback == flow_name or fallback not in config["flows"]:
+                    raise ValueError(f"Flow '{flow_name}' has an invalid fallback flow: {fallback}")
+                if config["flows"][fallback].get("fallback"):
+                    raise ValueError(f"Fallback flow '{fallback}' cannot itself have a fallback")
+    
+    def _initialize_cache(self) -> ResultCache:
+        """Initialize the tiered result cache from config and environment"""
+        cache_config = self.config.get("cache", {}) or {}
+        
+        # Per-flow TTLs, overridable with <FLOW>_CACHE_TTL (e.g. SEARCH_CACHE_TTL)
+        ttls = {}
+        for flow_name, flow_config in self.flows.items():
+            ttl = (flow_config.get("cache") or {}).get("ttl", 0)
+            ttls[flow_name] = float(os.getenv(f"{flow_name.upper()}_CACHE_TTL", ttl))
+        
+        return ResultCache(
+            path=cache_config.get("path", "data/cache.sqlite3"),
+            memory_entries=cache_config.get("memory_entries", 1024),
+            disk_entries=cache_config.get("disk_entries", 100000),
+            ttls=ttls,
+            enabled=cache_config.get("enabled", False),
+            stale_for=float(cache_config.get("stale_for", 0))
+        )
+    
+    def _initialize_semantic_cache(self) -> Optional[SemanticCache]:
+        """Initialize the near-duplicate prompt cache for LLMNode, if enabled"""
+        semantic_config = (self.config.get("cache", {}) or {}).get("semantic", {}) or {}
+        if not semantic_config.get("enabled", False):
+            return None
+        
+        return SemanticCache(
+            threshold=float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", semantic_config.get("threshold", 0.95))),
+            path=semantic_config.get("path", "data/semantic_cache.json"),
+            max_entries=semantic_config.get("max_entries", 5000),
+            max_prompt_chars=semantic_config.get("max_prompt_chars", 2000)
+        )
+    
+    @property
+    def sessions(self) -> Any:
+        """Session memory from the sessions section of flows.yaml, opened on first use"""
+        if self._sessions is None:
+            from sessions import SessionMemory, SQLiteCheckpointer
             
-            # Set entry point (first node)
-            first_node = flow_config["nodes"][0]["name"]
-            graph.set_entry_point(first_node)
+            session_config = self.config.get("sessions") or {}
+            self._sessions = SessionMemory(
+                SQLiteCheckpointer(session_config.get("path", "data/sessions.sqlite3")),
+                # Folding calls Gemini; without it SessionMemory keeps a shorter extractive summary
+                summarize=lambda summary, turns, max_tokens: self.get_node("LLMNode").summarize(summary, turns, max_tokens),
+                keep_turns=session_config.get("keep_turns", 4),
+                turn_tokens=session_config.get("turn_tokens", 400),
+                summary_tokens=session_config.get("summary_tokens", 300)
+            )
+        return self._sessions
+    
+    @staticmethod
+    def _initialize_cassette() -> Optional[Cassette]:
+        """Record or replay upstream traffic when AGENT_CASSETTE is set"""
+        path = os.getenv("AGENT_CASSETTE")
+        if not path:
+            return None
+        return Cassette(
+            path,
+            mode=os.getenv("AGENT_CASSETTE_MODE", "replay").lower(),
+            speed=float(os.getenv("AGENT_CASSETTE_SPEED", "1"))
+        )
+    
+    def _upstream_policies(self, upstream: str) -> Dict[str, Any]:
+        """Retry, hedging, limiter and circuit breaker settings for one upstream from the upstreams section of flows.yaml"""
+        upstream_config = (self.config.get("upstreams") or {}).get(upstream) or {}
+        max_retries = os.getenv("AGENT_MAX_RETRIES")
+        return {
+            "retry": RetryPolicy.from_config(
+                upstream_config.get("retry"),
+                max_retries=int(max_retries) if max_retries else None
+            ),
+            "hedge": Hedger.from_config(upstream_config.get("hedge")),
+            "limiter": limiter_for(upstream, upstream_config.get("limits")),
+            "breaker": breaker_for(upstream, upstream_config.get("breaker"))
+        }
+    
+    def _require_env(self, name: str) -> str:
+        value = os.getenv(name)
+        if not value and self.cassette is not None and self.cassette.replaying:
+            # Replays never reach the network, so no real credentials are needed
+            return "replay"
+        if not value:
+            raise ValueError(f"{name} environment variable is required")
+        return value
+    
+    def _create_node(self, node_type: str, node_class: type) -> Any:
+        """Construct a node, reading only the settings that node needs"""
+        if node_type == "SearchNode":
+            return node_class(
+                self._require_env("SERPER_API_KEY"),
+                timeout=float(os.getenv("AGENT_TIMEOUT", "30")),
+                http2=os.getenv("SEARCH_HTTP2", "false").lower() == "true",
+                max_connections=int(os.getenv("SEARCH_POOL_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("SEARCH_POOL_MAX_KEEPALIVE", "10")),
+                keepalive_expiry=float(os.getenv("SEARCH_POOL_KEEPALIVE_EXPIRY", "30")),
+                prewarm=os.getenv("SEARCH_PREWARM", "false").lower() == "true",
+                base_url=os.getenv("SERPER_BASE_URL", "https://google.serper.dev/search"),
+                cassette=self.cassette,
+                **self._upstream_policies("serper")
+            )
+        if node_type == "LLMNode":
+            return node_class(
+                self._require_env("GOOGLE_API_KEY"),
+                semantic_cache=self._initialize_semantic_cache(),
+                cassette=self.cassette,
+                max_input_tokens=int(os.getenv("LLM_MAX_INPUT_TOKENS", "8192")),
+                max_output_tokens=int(os.getenv("LLM_MAX_TOKENS", "2048")),
+                **self._upstream_policies("gemini")
+            )
+        if node_type == "MathNode":
+            return node_class(
+                max_operands=int(os.getenv("MATH_MAX_OPERANDS", "1000000")),
+                data_dir=os.getenv("MATH_DATA_DIR", "data")
+            )
+        if node_type == "ReaderNode":
+            return node_class(
+                max_pages=int(os.getenv("READER_MAX_PAGES", "5")),
+                page_timeout=float(os.getenv("READER_PAGE_TIMEOUT", "5")),
+                max_page_bytes=int(os.getenv("READER_MAX_PAGE_BYTES", "1000000")),
+                max_chunks=int(os.getenv("READER_MAX_CHUNKS", "6")),
+                max_connections=int(os.getenv("READER_POOL_MAX_CONNECTIONS", "20")),
+                cassette=self.cassette
+            )
+        return node_class()
+    
+    def get_node(self, node_type: str) -> Any:
+        """Return the shared node instance, importing and building it on first use"""
+        node = self.nodes.get(node_type)
+        if node is None:
+            with self._timed(f"import {node_type}"):
+                node_class = getattr(node_registry, node_type)
+            with self._timed(f"construct {node_type}"):
+                node = self._create_node(node_type, node_class)
+            self.nodes[node_type] = node
+        return node
+    
+    def warm(self) -> Dict[str, str]:
+        """Compile every flow graph and build every node whose credentials are configured
+        
+        Returns the node types that could not be built, with the reason.
+        """
+        for flow_name in self.flows:
+            self.get_graph(flow_name)
+        
+        skipped = {}
+        for node_type in NODE_TYPES:
+            try:
+                self.get_node(node_type)
+            except ValueError as e:
+                skipped[node_type] = str(e)
+        return skipped
+    
+    def upstream_status(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit breaker and limiter state of each upstream used by a built node"""
+        status = {}
+        for node in self.nodes.values():
+            breaker = getattr(node, "breaker", None)
+            if breaker is not None:
+                status[breaker.name] = {**node.limiter.stats(), **breaker.stats()}
+        return status
+    
+    @staticmethod
+    def _circuit_open(node: Any) -> bool:
+        breaker = getattr(node, "breaker", None)
+        return breaker is not None and breaker.degraded
+    
+    async def startup(self):
+        """Open long-lived node resources such as pooled HTTP clients
+        
+        Nodes built later, when a flow first needs them, are started before
+        their first run.
+        """
+        if self._started is None:
+            self._started = set()
+        for node_type, node in list(self.nodes.items()):
+            await self._start_node(node_type, node)
+    
+    async def _start_node(self, node_type: str, node: Any):
+        if self._started is None or node_type in self._started:
+            return
+        self._started.add(node_type)
+        if hasattr(node, "startup"):
+            await node.startup()
+    
+    async def shutdown(self):
+        """Release long-lived node resources"""
+        self._started = None
+        if self._sessions is not None:
+            # Pending summaries may still need the LLM node
+            await self._sessions.close()
+        for node in list(self.nodes.values()):
+            if hasattr(node, "shutdown"):
+                await node.shutdown()
+        if self.cassette is not None:
+            self.cassette.close()
+        await asyncio.to_thread(self.tracer.close)
+        if self.history is not None:
+            await asyncio.to_thread(self.history.close)
+    
+    async def __aenter__(self) -> "MultiFlowAgent":
+        await self.startup()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.shutdown()
+    
+    def get_graph(self, flow_name: str) -> Any:
+        """Return the compiled graph for a flow, compiling it on first use"""
+        graph = self.graphs.get(flow_name)
+        if graph is None:
+            if flow_name not in self.flows:
+                raise ValueError(f"Flow not defined in configuration: {flow_name}")
+            with self._timed("import langgraph"), tracing.span("import langgraph"):
+                import langgraph.graph  # noqa: F401
+            with self._timed(f"compile graph {flow_name}"), tracing.span("compile graph", flow=flow_name):
+                graph = self._build_graph(flow_name, self.flows[flow_name])
+            self.graphs[flow_name] = graph
+        return graph
+    
+    def _build_graph(self, flow_name: str, flow_config: Dict[str, Any]) -> Any:
+        """Build the LangGraph workflow for one flow"""
+        from langgraph.graph import StateGraph, START, END
+        
+        plan = FlowPlan(flow_name, flow_config)
+        graph = StateGraph(AgentState)
+        
+        # Add nodes to graph; node instances are resolved when they first run
+        for node_config in flow_config["nodes"]:
+            node_name = node_config["name"]
+            node_type = node_config["type"]
             
-            graphs[flow_name] = graph.compile()
+            if node_type in NODE_TYPES:
+                graph.add_node(node_name, self._wrap_node(flow_name, node_name, node_type, plan))
+            else:
+                raise ValueError(f"Unknown node type: {node_type}")
+        
+        # Add edges; several successors run concurrently in the same step
+        for node_name in plan.order:
+            successors = plan.successors[node_name]
+            for next_node in successors:
+                if next_node not in plan.joins:
+                    graph.add_edge(node_name, next_node)
+            if not successors:
+                graph.add_edge(node_name, END)
+        
+        # A join runs once all of its predecessors have returned
+        for join_name in plan.joins:
+            graph.add_edge(plan.predecessors[join_name], join_name)
+        
+        # Entry points (the first node unless the flow lists `entry`)
+        for entry in plan.entry:
+            graph.add_edge(START, entry)
         
-        return graphs
+        return graph.compile()
+    
+    def _wrap_node(self, flow_name: str, node_name: str, node_type: str, plan: FlowPlan) -> Callable:
+        """Resolve a node lazily and route it through the result cache when enabled
+        
+        The node works on a copy of the state and the wrapper returns only what
+        it changed, so parallel branches never overwrite each other's results.
+        """
+        branch = plan.branches.get(node_name)
+        
+        async def run_node(state: AgentState, node_span: Any) -> AgentState:
+            node = self.get_node(node_type)
+            await self._start_node(node_type, node)
+            if not getattr(node, "cacheable", False) or self.cache.ttl_for(flow_name) <= 0:
+                return await node.execute(state)
+            state = await self._execute_cached(flow_name, node_name, node, state)
+            node_span.set(cache=state["cache_status"].get(node_name))
+            return state
+        
+        async def execute_node(state: AgentState) -> Dict[str, Any]:
+            start = time.perf_counter()
+            status = "error"
+            try:
+                with metrics.NODES_IN_FLIGHT.track(flow=flow_name, node=node_name), \
+                        tracing.span(f"node {node_name}", node_type=node_type) as node_span:
+                    working = self._working_copy(state)
+                    flow_id = state["execution_context"].flow_id
+                    
+                    if node_name in plan.joins:
+                        progress = self._join_progress(flow_id, plan, node_name)
+                        node_span.set(branches_succeeded=len(progress.succeeded), branches_cancelled=len(progress.cancelled))
+                        working["error_message"] = working["error_message"] or progress.error()
+                    
+                    if working["error_message"] and plan.successors[node_name]:
+                        # An earlier step failed; only the final node runs, to report it
+                        status = "skipped"
+                        node_span.set(skipped=True)
+                        return {}
+                    
+                    if branch is None:
+                        working = await run_node(working, node_span)
+                    else:
+                        progress = self._join_progress(flow_id, plan, branch[0])
+                        if not progress.is_open(branch[1]):
+                            # An earlier node on this branch failed, or the join no longer needs it
+                            status = "skipped"
+                            node_span.set(skipped=True)
+                            return {}
+                        if progress.racing:
+                            working = await self._race(progress, run_node(working, node_span))
+                            if working is None:
+                                status = "cancelled"
+                                progress.cancelled.append(branch[1])
+                                node_span.set(cancelled=True)
+                                return {}
+                        else:
+                            working = await run_node(working, node_span)
+                    
+                    result = working["node_results"].get(node_name)
+                    status = "success" if result is None or result.success else "error"
+                    if status == "error":
+                        tracing.mark_error(result.error)
+                    if branch is not None:
+                        if status == "error":
+                            progress.finish(branch[1], result.error)
+                        elif plan.is_tail(node_name):
+                            progress.finish(branch[1])
+                return self._state_update(state, working, on_branch=branch is not None)
+            finally:
+                metrics.NODE_LATENCY.observe(time.perf_counter() - start, flow=flow_name, node=node_name)
+                metrics.NODE_EXECUTIONS.inc(flow=flow_name, node=node_name, status=status)
+        
+        return execute_node
+    
+    @staticmethod
+    def _working_copy(state: AgentState) -> AgentState:
+        """Shallow copy of the state with private copies of the merged maps"""
+        working = dict(state)
+        for key in MERGED_STATE_KEYS:
+            working[key] = dict(state[key])
+        return working
+    
+    @staticmethod
+    def _state_update(before: AgentState, after: AgentState, on_branch: bool) -> Dict[str, Any]:
+        """The keys (and merged-map entries) a node changed"""
+        update: Dict[str, Any] = {}
+        for key, value in after.items():
+            if key in MERGED_STATE_KEYS:
+                changed = {name: entry for name, entry in value.items() if before[key].get(name) is not entry}
+                if changed:
+                    update[key] = changed
+            elif value is not before.get(key):
+                update[key] = value
+        if on_branch:
+            # Branch outcomes reach the state through the join, which may tolerate failures
+            update.pop("error_message", None)
+            update.pop("current_node", None)
+        return update
+    
+    def _join_progress(self, flow_id: str, plan: FlowPlan, join_name: str) -> JoinProgress:
+        joins = self._joins.setdefault(flow_id, {})
+        progress = joins.get(join_name)
+        if progress is None:
+            progress = joins[join_name] = JoinProgress(len(plan.predecessors[join_name]), plan.joins[join_name])
+        return progress
+    
+    @staticmethod
+    async def _race(progress: JoinProgress, run: Any) -> Optional[AgentState]:
+        """Run a branch node until it finishes or the join has enough other branches; None when cancelled"""
+        task = asyncio.ensure_future(run)
+        satisfied = asyncio.ensure_future(progress.satisfied.wait())
+        try:
+            await asyncio.wait({task, satisfied}, return_when=asyncio.FIRST_COMPLETED)
+            if task.done():
+                return task.result()
+        finally:
+            satisfied.cancel()
+            if not task.done():
+                task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return None
+    
+    async def _execute_cached(self, flow_name: str, node_name: str, node: Any, state: AgentState) -> AgentState:
+        """Serve a node's results from the cache, or run it and store them"""
+        start_time = time.time()
+        cache_input = state["parsed_input"]
+        if state.get("conversation") and getattr(node, "uses_conversation", False):
+            # The same question means something else later in a conversation
+            cache_input = {**cache_input, "conversation": state["conversation"]}
+        key = self.cache.make_key(flow_name, node_name, cache_input)
+        
+        with tracing.span("cache lookup"):
+            cached = await self.cache.get(key)
+        if cached is not None:
+            value, tier = cached
+            self._restore_cached(state, value, start_time)
+            state["cache_status"][node_name] = f"hit ({tier})"
+            return state
+        
+        previous = dict(state["node_results"])
+        state = await node.execute(state)
+        state["cache_status"][node_name] = "miss"
+        
+        # Only cache results this node produced, and only if all succeeded
+        produced = {
+            key_: result
+            for key_, result in state["node_results"].items()
+            if previous.get(key_) is not result
+        }
+        if produced and all(result.success for result in produced.values()):
+            with tracing.span("cache store"):
+                await self.cache.set(
+                    key, flow_name, {key_: result.data for key_, result in produced.items()}
+                )
+        elif self._circuit_open(node):
+            # The upstream is down: an expired answer beats an error
+            with tracing.span("stale cache lookup") as stale_span:
+                stale = await self.cache.get_stale(key)
+                stale_span.set(hit=stale is not None)
+            if stale is not None:
+                value, age = stale
+                self._restore_cached(state, value, start_time)
+                state["error_message"] = None
+                state["cache_status"][node_name] = f"stale ({age:.0f}s past TTL, circuit open)"
+        
+        return state
+    
+    @staticmethod
+    def _restore_cached(state: AgentState, value: Dict[str, Any], start_time: float):
+        """Put cached node outputs into the state as successful results"""
+        for result_key, data in value.items():
+            state["node_results"][result_key] = NodeResult(
+                success=True,
+                data=data,
+                execution_time=time.time() - start_time,
+                context=state["execution_context"]
+            )
+        state["current_node"] = "output"
     
     def determine_flow(self, user_input: str, explicit_flow: Optional[str] = None) -> FlowType:
         """Determine which flow to use based on input or explicit specification"""
+        return self.route(user_input, explicit_flow)[0]
+    
+    def route(self, user_input: str, explicit_flow: Optional[str] = None) -> Tuple[FlowType, Dict[str, Any]]:
+        """Return the flow to use and the routing details behind the choice"""
         if explicit_flow:
             try:
-                return FlowType(explicit_flow.lower())
+                flow_type = FlowType(explicit_flow.lower())
             except ValueError:
                 raise ValueError(f"Unknown flow type: {explicit_flow}")
+            return flow_type, {"flow_type": flow_type.value, "explicit": True}
         
-        # Auto-detect flow based on patterns
-        user_input_lower = user_input.lower()
-        
-        for flow_type, patterns in self.routing_patterns.items():
-            for pattern in patterns:
-                if pattern.lower() in user_input_lower:
-                    return FlowType(flow_type)
-        
-        # Default to LLM flow if no pattern matches
-        return FlowType.LLM
+        # Auto-detect flow with the compiled router (defaults to LLM flow)
+        decision = self.router.route(user_input)
+        return FlowType(decision.flow), decision.as_dict()
     
     def parse_input(self, user_input: str, flow_type: FlowType) -> Dict[str, Any]:
         """Parse user input based on flow type"""
@@ -121,6 +627,8 @@ class MultiFlowAgent:
             return self._parse_llm_input(user_input)
         elif flow_type == FlowType.MATH:
             return self._parse_math_input(user_input)
+        elif flow_type in (FlowType.RESEARCH, FlowType.READ):
+            return self._parse_research_input(user_input)
         else:
             raise ValueError(f"Unknown flow type: {flow_type}")
     
@@ -145,125 +653,409 @@ class MultiFlowAgent:
             "system_message": "You are a helpful AI assistant."
         }
     
+    def _parse_research_input(self, user_input: str) -> Dict[str, Any]:
+        """Parse input for flows that both search and ask the model (research, read)"""
+        topic = user_input.strip()
+        for pattern in ["research", "look into", "read up on", "read about"]:
+            if topic.lower().startswith(pattern):
+                topic = topic[len(pattern):].strip(" :") or topic
+                break
+        
+        return {
+            **self._parse_search_input(topic),
+            **self._parse_llm_input(topic)
+        }
+    
     def _parse_math_input(self, user_input: str) -> Dict[str, Any]:
         """Parse math-specific input"""
         import re
         
         user_input_clean = user_input.strip()
+        user_input_lower = user_input_clean.lower()
         
-        # Try to parse simple arithmetic expressions like "2+3", "10-5", "4*6", "8/2"
-        # Look for patterns like number operator number
-        arithmetic_pattern = r'(\d+(?:\.\d+)?)\s*([+\-*/×÷])\s*(\d+(?:\.\d+)?)'
-        arithmetic_match = re.search(arithmetic_pattern, user_input_clean)
+        # Arithmetic expressions with precedence, parentheses and functions ("15 + 25 * 3")
+        expression = self._extract_expression(user_input_clean)
+        if expression is not None:
+            return expression
         
-        if arithmetic_match:
-            num1, operator, num2 = arithmetic_match.groups()
-            operands = [float(num1), float(num2)]
-            
-            # Map operators to operation names
-            operator_map = {
-                '+': 'add',
-                '-': 'subtract', 
-                '*': 'multiply',
-                '/': 'divide',
-                '×': 'multiply',
-                '÷': 'divide'
+        # Reductions and vector operations ("mean of data.csv", "[1,2] dot [3,4]")
+        operation = self._detect_math_keyword(user_input_lower)
+        source_match = re.search(r'(\S+\.(?:csv|npy))\b', user_input_clean, re.IGNORECASE)
+        vector_matches = re.findall(r'\[([^\[\]]*)\]', user_input_clean)
+        number = r'-?\d+(?:\.\d+)?(?:e[+-]?\d+)?'
+        
+        if source_match:
+            return {"operation": operation or "sum", "source": source_match.group(1)}
+        if len(vector_matches) == 2:
+            vectors = [[float(n) for n in re.findall(number, v, re.IGNORECASE)] for v in vector_matches]
+            return {"operation": operation or "add", "vectors": vectors}
+        if operation in ("sum", "product", "mean", "min", "max", "variance"):
+            return {
+                "operation": operation,
+                "operands": [float(n) for n in re.findall(number, user_input_clean, re.IGNORECASE)]
             }
-            operation = operator_map.get(operator, 'add')
-            
-        else:
-            # Fallback to word-based detection
-            user_input_lower = user_input.lower()
-            
-            # Detect operation by keywords
-            operation = "add"  # default
-            if any(word in user_input_lower for word in ["add", "plus", "+"]):
-                operation = "add"
-            elif any(word in user_input_lower for word in ["subtract", "minus", "-"]):
-                operation = "subtract"
-            elif any(word in user_input_lower for word in ["multiply", "times", "*", "×"]):
-                operation = "multiply"
-            elif any(word in user_input_lower for word in ["divide", "divided by", "/", "÷"]):
-                operation = "divide"
-            
-            # Extract all positive numbers only (no negative signs)
-            numbers = re.findall(r'\d+(?:\.\d+)?', user_input)
-            operands = [float(n) for n in numbers if n]
-            
-            if len(operands) < 2:
-                # Fallback: default numbers for demo
-                operands = [10, 5]
         
+        # An operator that nothing could parse ("calculate (5-2") is reported by MathNode
+        # rather than falling through to adding up every number
+        if operation is None and re.search(r'[\d)]\s*[-+*/%^×÷−]|[+*/%^×÷(]\s*[\d(.]', user_input_clean):
+            return {"operation": "evaluate", "expression": self._strip_math_prefix(user_input_clean), "variables": {}}
+        
+        # Word problems ("add 5 and 3", "divide 1024 by 32"); numbers are unsigned here
+        # because "minus" already carries the sign
+        numbers = re.findall(r'\d+(?:\.\d+)?', user_input_clean)
         return {
-            "operation": operation,
-            "operands": operands
+            "operation": operation or "add",
+            "operands": [float(n) for n in numbers]
         }
     
+    @staticmethod
+    def _strip_math_prefix(text: str) -> str:
+        """Drop leading commands ("calculate", "what is") and trailing punctuation"""
+        import re
+        
+        text = re.sub(r'^(?:(?:please|calculate|compute|evaluate|solve|what\s+is|what\'s|math)\b\s*:?\s*)+', '', text, flags=re.IGNORECASE)
+        return text.rstrip("?!.= ")
+    
+    @staticmethod
+    def _has_operator(template: Tuple[str, ...]) -> bool:
+        """Whether a template applies a binary operator (a leading minus is only a sign)"""
+        operators = {"+", "-", "*", "/", "%", "^"}
+        return any(
+            token in operators and i > 0 and template[i - 1] not in operators | {"(", ","}
+            for i, token in enumerate(template)
+        )
+    
+    @classmethod
+    def _longest_expression(cls, text: str) -> Optional[Any]:
+        """The longest run of words that parses as an expression with an operator ("6 / 2" in "6 / 2 for me")"""
+        import re
+        from expressions import CONSTANTS, SCALAR_FUNCTIONS, parse
+        
+        # Runs start and end on words holding a number, function or constant, so the
+        # prose around an expression is never parsed; the anchor cap bounds pasted text
+        names = "|".join(sorted([*SCALAR_FUNCTIONS, *CONSTANTS], key=len, reverse=True))
+        anchor = re.compile(rf'\d|^[(\-−]*(?:{names})\b', re.IGNORECASE)
+        words = text.split()
+        anchors = [i for i, word in enumerate(words) if anchor.search(word)][:32]
+        
+        spans = sorted(
+            ((start, end) for start in anchors for end in anchors if end >= start),
+            key=lambda span: span[0] - span[1]
+        )
+        for start, end in spans:
+            try:
+                expression = parse(" ".join(words[start:end + 1]))
+            except ValueError:
+                continue
+            if cls._has_operator(expression.compiled.template):
+                return expression
+        return None
+    
+    @classmethod
+    def _extract_expression(cls, user_input: str) -> Optional[Dict[str, Any]]:
+        """Return an evaluate request if the input is, or contains, an arithmetic expression"""
+        import re
+        from expressions import NUMBER, parse
+        
+        text = user_input
+        bindings: Dict[str, Any] = {}
+        
+        # Trailing variable bindings: "a*x + b where x = 2, a = [1, 2, 3]"
+        binding_clause = re.search(r'\s+(?:where|with|for|given)\s+(.*)$', text, re.IGNORECASE)
+        if binding_clause:
+            pairs = re.findall(
+                r'([A-Za-z][A-Za-z_0-9]*)\s*=\s*(\[[^\]]*\]|-?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)',
+                binding_clause.group(1),
+                re.IGNORECASE
+            )
+            for name, value in pairs:
+                if value.startswith("["):
+                    bindings[name.lower()] = [float(v) for v in re.findall(r'-?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?', value)]
+                else:
+                    bindings[name.lower()] = float(value)
+            if pairs:
+                text = text[:binding_clause.start()]
+        
+        text = cls._strip_math_prefix(text)
+        
+        try:
+            expression = parse(text)
+        except ValueError:
+            # Trailing or surrounding words ("calculate 6 / 2 for me")
+            expression = cls._longest_expression(text)
+            if expression is None:
+                return None
+        
+        # A lone word is not an expression ("calculate tax"); anything with a number or operator is
+        if NUMBER not in expression.compiled.template and len(expression.compiled.template) == 1:
+            return None
+        
+        return {
+            "operation": "evaluate",
+            "expression": expression.text,
+            "variables": bindings
+        }
+    
+    @staticmethod
+    def _detect_math_keyword(user_input_lower: str) -> Optional[str]:
+        """Map reduction and vector keywords to a math operation"""
+        import re
+        
+        keywords = [
+            ("dot", r'\bdot\b'),
+            ("variance", r'\bvariance\b|\bvar\b'),
+            ("mean", r'\bmean\b|\baverage\b|\bavg\b'),
+            ("min", r'\bmin(?:imum)?\b|\bsmallest\b'),
+            ("max", r'\bmax(?:imum)?\b|\blargest\b'),
+            ("product", r'\bproduct\b'),
+            ("sum", r'\bsum\b|\btotal\b'),
+            ("add", r'\badd\b|\bplus\b'),
+            ("subtract", r'\bsubtract\b|\bminus\b'),
+            ("multiply", r'\bmultiply\b|\btimes\b'),
+            ("divide", r'\bdivide\b|\bdivided by\b'),
+        ]
+        for operation, pattern in keywords:
+            if re.search(pattern, user_input_lower):
+                return operation
+        return None
+    
+    def _prepare_state(
+        self,
+        user_input: str,
+        flow_type: Optional[str],
+        stream: bool,
+        metadata: Dict[str, Any],
+        flow_id: str,
+        conversation: Optional[str] = None
+    ) -> AgentState:
+        """Route and parse the input into the initial graph state"""
+        # Determine flow
+        with tracing.span("route") as route_span:
+            determined_flow, routing_decision = self.route(user_input, flow_type)
+            route_span.set(flow=determined_flow.value, explicit=flow_type is not None)
+        
+        # Parse input
+        with tracing.span("parse"):
+            parsed_input = self.parse_input(user_input, determined_flow)
+        
+        # Create execution context
+        context = ExecutionContext(
+            flow_id=flow_id,
+            node_id="start",
+            timestamp=time.time(),
+            metadata=metadata
+        )
+        
+        # Initialize state
+        return {
+            "user_input": user_input,
+            "flow_type": determined_flow,
+            "parsed_input": parsed_input,
+            "current_node": "start",
+            "execution_context": context,
+            "node_results": {},
+            "final_output": None,
+            "error_message": None,
+            "routing_decision": routing_decision,
+            "validation_results": {},
+            "cache_status": {},
+            "stream": stream,
+            "conversation": conversation
+        }
+    
+    def _format_result(self, result_state: AgentState) -> Dict[str, Any]:
+        """Convert the final graph state into the public result dictionary"""
+        node_results = result_state.get("node_results", {})
+        
+        return {
+            "success": result_state.get("error_message") is None,
+            "output": result_state.get("final_output", "No output generated"),
+            "flow_used": result_state["flow_type"].value,
+            "flow_id": result_state["execution_context"].flow_id,
+            "execution_time": sum(
+                result.execution_time 
+                for result in node_results.values()
+            ),
+            "node_results": {
+                name: {
+                    "success": result.success,
+                    "execution_time": result.execution_time,
+                    "error": result.error,
+                    **({
+                        "time_to_first_token": result.time_to_first_token,
+                        "tokens_per_second": result.tokens_per_second
+                    } if result.time_to_first_token is not None else {}),
+                    **({"tokens": result.data["tokens"]} if isinstance(result.data, dict) and "tokens" in result.data else {})
+                }
+                for name, result in node_results.items()
+            },
+            "validation_results": {
+                name: validation.as_dict()
+                for name, validation in result_state.get("validation_results", {}).items()
+            },
+            "cache_status": result_state.get("cache_status", {}),
+            "cache_stats": self.cache.stats.as_dict(),
+            "error": result_state.get("error_message")
+        }
+    
+    @staticmethod
+    def _finish_trace(root: Any, flow_name: str, result: Dict[str, Any]):
+        root.set(flow=flow_name, success=result["success"])
+        if not result["success"]:
+            root.fail(result.get("error"))
+    
+    def _record_flow(self, user_input: str, flow_name: str, result: Dict[str, Any], start: float):
+        duration = time.perf_counter() - start
+        metrics.FLOW_LATENCY.observe(duration, flow=flow_name)
+        metrics.FLOW_REQUESTS.inc(flow=flow_name, status="success" if result["success"] else "error")
+        if self.history is not None:
+            self.history.record(user_input, flow_name, result, duration)
+    
+    @staticmethod
+    def _failure(error: Exception, flow_type: Optional[str], flow_id: str) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "output": f"Agent execution failed: {str(error)}",
+            "error": str(error),
+            "flow_used": flow_type or "unknown",
+            "flow_id": flow_id
+        }
+    
+    def _fallback_flow(self, flow_name: str, result: Dict[str, Any]) -> Optional[str]:
+        """The configured fallback for a failed flow, if it failed while one of its upstreams is down"""
+        fallback = (self.flows.get(flow_name) or {}).get("fallback")
+        if result["success"] or not fallback:
+            return None
+        for node_config in self.flows[flow_name]["nodes"]:
+            node = self.nodes.get(node_config["type"])
+            if node is not None and self._circuit_open(node):
+                return fallback
+        return None
+    
+    async def _conversation(self, session_id: Optional[str]) -> Optional[str]:
+        """The session's summary and recent turns as prompt context"""
+        if session_id is None:
+            return None
+        with tracing.span("load session") as session_span:
+            conversation = await self.sessions.context(session_id)
+            session_span.set(chars=len(conversation or ""))
+        return conversation
+    
+    @staticmethod
+    def _answer(result_state: AgentState) -> Optional[str]:
+        """What the assistant said: the model's own text when an LLM answered, else the formatted output"""
+        llm = result_state.get("node_results", {}).get("llm")
+        if llm is not None and llm.success and isinstance(llm.data, dict):
+            return llm.data.get("response")
+        return result_state.get("final_output")
+    
+    def _remember(self, session_id: Optional[str], user_input: str, result: Dict[str, Any], answer: Optional[str]):
+        """Record a successful turn in the session; failed turns leave the memory unchanged"""
+        if session_id is not None and result["success"] and answer:
+            self.sessions.remember(session_id, user_input, answer)
+    
+    @staticmethod
+    def _mark_fallback(result: Dict[str, Any], flow_name: str, failed: Dict[str, Any]):
+        result["fallback_from"] = {"flow": flow_name, "error": failed.get("error")}
+    
     async def execute(
         self, 
         user_input: str, 
         flow_type: Optional[str] = None,
+        session_id: Optional[str] = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """Execute the agent with given input"""
-        try:
-            # Determine flow
-            determined_flow = self.determine_flow(user_input, flow_type)
-            
-            # Parse input
-            parsed_input = self.parse_input(user_input, determined_flow)
-            
-            # Create execution context
-            context = ExecutionContext(
-                flow_id=str(uuid.uuid4()),
-                node_id="start",
-                timestamp=time.time(),
-                metadata=kwargs
-            )
-            
-            # Initialize state
-            initial_state: AgentState = {
-                "user_input": user_input,
-                "flow_type": determined_flow,
-                "parsed_input": parsed_input,
-                "current_node": "start",
-                "execution_context": context,
-                "node_results": {},
-                "final_output": None,
-                "error_message": None,
-                "routing_decision": {"flow_type": determined_flow.value},
-                "validation_results": {}
-            }
-            
-            # Execute flow
-            graph = self.graphs[determined_flow.value]
-            result_state = await graph.ainvoke(initial_state)
+        """Execute the agent with given input, in the context of a session when session_id is given"""
+        start = time.perf_counter()
+        flow_name = flow_type or "unknown"
+        flow_id = str(uuid.uuid4())
+        answer = None
+        if self.cassette is not None:
+            self.cassette.record_request(user_input, flow_type, flow_id)
+        with self.tracer.trace(flow_id, "request", input_chars=len(user_input)) as root:
+            try:
+                conversation = await self._conversation(session_id)
+                initial_state = self._prepare_state(user_input, flow_type, False, kwargs, flow_id, conversation)
+                flow_name = initial_state["flow_type"].value
+                
+                # Execute flow
+                graph = self.get_graph(flow_name)
+                with metrics.FLOWS_IN_FLIGHT.track(flow=flow_name), tracing.span("graph"):
+                    try:
+                        result_state = await graph.ainvoke(initial_state)
+                    finally:
+                        self._joins.pop(flow_id, None)
+                
+                # Format response
+                result = self._format_result(result_state)
+                answer = self._answer(result_state)
+                
+            except Exception as e:
+                result = self._failure(e, flow_type, flow_id)
             
-            # Format response
-            return {
-                "success": result_state.get("error_message") is None,
-                "output": result_state.get("final_output", "No output generated"),
-                "flow_used": determined_flow.value,
-                "execution_time": sum(
-                    result.execution_time 
-                    for result in result_state.get("node_results", {}).values()
-                ),
-                "node_results": {
-                    name: {
-                        "success": result.success,
-                        "execution_time": result.execution_time,
-                        "error": result.error
-                    }
-                    for name, result in result_state.get("node_results", {}).items()
-                },
-                "validation_results": result_state.get("validation_results", {}),
-                "error": result_state.get("error_message")
-            }
+            self._finish_trace(root, flow_name, result)
+        
+        self._record_flow(user_input, flow_name, result, start)
+        
+        fallback = self._fallback_flow(flow_name, result)
+        if fallback is not None:
+            fallback_result = await self.execute(user_input, fallback, session_id, **kwargs)
+            self._mark_fallback(fallback_result, flow_name, result)
+            return fallback_result
+        self._remember(session_id, user_input, result, answer)
+        return result
+    
+    async def execute_stream(
+        self,
+        user_input: str,
+        flow_type: Optional[str] = None,
+        session_id: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Execute the agent, yielding token events and finally the result
+        
+        Yields {"type": "token", "node": ..., "text": ...} as nodes stream output,
+        then a single {"type": "result", "result": {...}} event.
+        """
+        start = time.perf_counter()
+        flow_name = flow_type or "unknown"
+        flow_id = str(uuid.uuid4())
+        answer = None
+        if self.cassette is not None:
+            self.cassette.record_request(user_input, flow_type, flow_id)
+        with self.tracer.trace(flow_id, "request", input_chars=len(user_input), stream=True) as root:
+            try:
+                conversation = await self._conversation(session_id)
+                initial_state = self._prepare_state(user_input, flow_type, True, kwargs, flow_id, conversation)
+                flow_name = initial_state["flow_type"].value
+                graph = self.get_graph(flow_name)
+                
+                result_state = initial_state
+                with metrics.FLOWS_IN_FLIGHT.track(flow=flow_name), tracing.span("graph"):
+                    try:
+                        async for mode, chunk in graph.astream(initial_state, stream_mode=["custom", "values"]):
+                            if mode == "custom":
+                                yield chunk
+                            else:
+                                result_state = chunk
+                    finally:
+                        self._joins.pop(flow_id, None)
+                
+                result = self._format_result(result_state)
+                answer = self._answer(result_state)
+            except Exception as e:
+                result = self._failure(e, flow_type, flow_id)
             
-        except Exception as e:
-            return {
-                "success": False,
-                "output": f"Agent execution failed: {str(e)}",
-                "error": str(e),
-                "flow_used": flow_type or "unknown"
-            }
+            self._finish_trace(root, flow_name, result)
+        
+        self._record_flow(user_input, flow_name, result, start)
+        
+        fallback = self._fallback_flow(flow_name, result)
+        if fallback is not None:
+            async for event in self.execute_stream(user_input, fallback, session_id, **kwargs):
+                if event["type"] == "result":
+                    self._mark_fallback(event["result"], flow_name, result)
+                yield event
+            return
+        self._remember(session_id, user_input, result, answer)
+        yield {"type": "result", "result": result}
@@ -0,0 +1,332 @@
+"""In-process stand-ins for the Serper and Gemini upstreams used by the benchmark suite
+
+The fake Serper endpoint is a real HTTP server on 127.0.0.1, so SearchNode's pooled
+httpx client, JSON encoding and response parsing are all exercised. Its result links
+point back at the same server, which serves HTML pages for ReaderNode. The fake Gemini
+model replaces LLMNode.llm and mimics ainvoke/astream, including usage metadata.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+WORDS = (
+    "agent flow graph node cache latency request response token search result model "
+    "python async stream vector query index page data value system network server client"
+).split()
+
+class Distribution:
+    """A sampled value described by a spec string
+
+    Specs:
+        fixed:50            always 50
+        uniform:20,80       uniformly between 20 and 80
+        normal:50,10        mean 50, standard deviation 10 (clipped at 0)
+        lognormal:50,0.5    median 50, log-space sigma 0.5 (a long right tail)
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, kind: str, params: List[float], rng: Optional[random.Random] = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown distribution '{kind}' (expected one of: {', '.join(self.KINDS)})")
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"Distribution '{kind}' takes {self.KINDS[kind]} parameter(s), got {len(params)}")
+        if any(param < 0 for param in params):
+            raise ValueError(f"Distribution parameters must not be negative: {params}")
+        self.kind = kind
+        self.params = params
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def parse(cls, spec: str, rng: Optional[random.Random] = None) -> "Distribution":
+        kind, _, raw = spec.partition(":")
+        if not raw:
+            # A bare number means a fixed value
+            kind, raw = "fixed", kind
+        try:
+            params = [float(part) for part in raw.split(",")]
+        except ValueError:
+            raise ValueError(f"Invalid distribution spec: {spec!r}")
+        return cls(kind.strip().lower(), params, rng)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            low, high = sorted(self.params)
+            return self.rng.uniform(low, high)
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(*self.params))
+        median, sigma = self.params
+        if median == 0:
+            return 0.0
+        return self.rng.lognormvariate(0.0, sigma) * median
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(f'{param:g}' for param in self.params)}"
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, words)))
+
+class FakeSerper:
+    """Minimal HTTP/1.1 server answering POST /search like google.serper.dev
+
+    latency_ms is sampled per request; snippet_chars sets the size of each organic result.
+    A fraction error_rate of requests is answered with 503 Service Unavailable, and
+    requests beyond capacity concurrent ones get an immediate 429 Too Many Requests.
+    GET /page/... returns an HTML page of page_bytes after page_latency_ms, written
+    in PAGE_WRITE-sized pieces so readers see it arrive incrementally.
+    """
+
+    PAGE_WRITE = 16384
+
+    def __init__(
+        self,
+        latency_ms: Distribution,
+        snippet_chars: Distribution,
+        rng: Optional[random.Random] = None,
+        error_rate: float = 0.0,
+        capacity: Optional[int] = None,
+        page_latency_ms: Optional[Distribution] = None,
+        page_bytes: Optional[Distribution] = None
+    ):
+        self.latency_ms = latency_ms
+        self.snippet_chars = snippet_chars
+        self.rng = rng or random.Random()
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.page_latency_ms = page_latency_ms or Distribution("fixed", [0.0])
+        self.page_bytes = page_bytes or Distribution("fixed", [20000.0])
+        self.requests = 0
+        self.pages = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Page text is assembled from a fixed pool so serving pages costs little CPU
+        self._paragraphs = [f"<p>{_text(self.rng, 60)}.</p>\n".encode("utf-8") for _ in range(64)]
+
+    @property
+    def origin(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.origin}/search"
+
+    async def start(self) -> "FakeSerper":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeSerper":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def _results(self, query: str, count: int) -> Dict[str, Any]:
+        organic = []
+        for position in range(1, count + 1):
+            chars = int(self.snippet_chars.sample())
+            organic.append({
+                "title": f"{query.title()} - result {position}",
+                "link": f"{self.origin}/page/{position}/{query.replace(' ', '-')}",
+                "snippet": _text(self.rng, chars // 6)[:max(chars, 1)],
+                "position": position
+            })
+        return {"searchParameters": {"q": query, "num": count}, "organic": organic}
+
+    def _page(self, path: str) -> bytes:
+        """An HTML page with boilerplate around paragraphs that mention the path's words"""
+        topic = " ".join(path.split("/")[3:]).replace("-", " ")
+        size = max(1024, int(self.page_bytes.sample()))
+        parts = [
+            f"<!DOCTYPE html><html><head><title>{topic.title()}</title>"
+            "<script>var analytics = {};</script><style>p { margin: 0 }</style></head><body>"
+            "<nav><a href='/'>Home</a> <a href='/docs'>Docs</a></nav><article>"
+            f"<h1>{topic.title()}</h1><p>This page is about {topic} and related topics in some detail.</p>".encode("utf-8")
+        ]
+        length = len(parts[0])
+        while length < size:
+            paragraph = self.rng.choice(self._paragraphs)
+            parts.append(paragraph)
+            length += len(paragraph)
+        parts.append(b"</article><footer>Copyright example.com</footer></body></html>")
+        return b"".join(parts)
+
+    async def _write_page(self, writer: asyncio.StreamWriter, path: str):
+        self.pages += 1
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.page_latency_ms.sample() / 1000)
+        finally:
+            self.in_flight -= 1
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            payload = b"<html><body>fake outage</body></html>"
+            writer.write(
+                b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/html\r\n"
+                b"Content-Length: %d\r\nConnection: keep-alive\r\n\r\n%s" % (len(payload), payload)
+            )
+            await writer.drain()
+            return
+        body = self._page(path)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+            b"Content-Length: %d\r\nConnection: keep-alive\r\n\r\n" % len(body)
+        )
+        for offset in range(0, len(body), self.PAGE_WRITE):
+            writer.write(body[offset:offset + self.PAGE_WRITE])
+            await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, path = (lines[0].split(" ") + [""])[:2]
+                length = 0
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = await reader.readexactly(length)
+                if method == "GET" and path.startswith("/page/"):
+                    await self._write_page(writer, path)
+                    continue
+                body = json.loads(body or b"{}")
+
+                self.requests += 1
+                if self.capacity is not None and self.in_flight >= self.capacity:
+                    self.rejected += 1
+                    status, payload = b"429 Too Many Requests", b'{"message": "fake rate limit"}'
+                    writer.write(
+                        b"HTTP/1.1 %s\r\nContent-Type: application/json\r\n"
+                        b"Content-Length: %d\r\nConnection: keep-alive\r\n\r\n%s" % (status, len(payload), payload)
+                    )
+                    await writer.drain()
+                    continue
+
+                self.in_flight += 1
+                try:
+                    await asyncio.sleep(self.latency_ms.sample() / 1000)
+                finally:
+                    self.in_flight -= 1
+                if self.rng.random() < self.error_rate:
+                    self.errors += 1
+                    status, payload = b"503 Service Unavailable", b'{"message": "fake outage"}'
+                else:
+                    status = b"200 OK"
+                    payload = json.dumps(self._results(str(body.get("q", "")), int(body.get("num", 5)))).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 %s\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\nConnection: keep-alive\r\n\r\n%s" % (status, len(payload), payload)
+                )
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+class FakeUpstreamError(RuntimeError):
+    """Injected upstream failure carrying an HTTP status code"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+class FakeGemini:
+    """Drop-in for ChatGoogleGenerativeAI's ainvoke/astream
+
+    latency_ms is the time to the first token; the rest of the response_words
+    arrive at tokens_per_second. A fraction error_rate of calls fails with a 503
+    after the first-token latency, and calls beyond capacity concurrent ones fail
+    at once with a 429.
+    """
+
+    def __init__(
+        self,
+        latency_ms: Distribution,
+        response_words: Distribution,
+        tokens_per_second: float = 250.0,
+        rng: Optional[random.Random] = None,
+        error_rate: float = 0.0,
+        capacity: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.response_words = response_words
+        self.tokens_per_second = tokens_per_second
+        self.rng = rng or random.Random()
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    def _admit(self):
+        if self.capacity is not None and self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise FakeUpstreamError("429 Too Many Requests (fake rate limit)", 429)
+
+    def _plan(self, messages: List[Any]) -> Dict[str, Any]:
+        self.requests += 1
+        words = max(1, int(self.response_words.sample()))
+        prompt_words = sum(len(str(getattr(message, "content", message)).split()) for message in messages)
+        return {
+            "first_token": self.latency_ms.sample() / 1000,
+            "words": _text(self.rng, words).split(" "),
+            "usage": {"input_tokens": prompt_words, "output_tokens": words, "total_tokens": prompt_words + words}
+        }
+
+    def _maybe_fail(self):
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise FakeUpstreamError("503 Service Unavailable (fake outage)", 503)
+
+    async def ainvoke(self, messages: List[Any], **kwargs: Any) -> AIMessage:
+        self._admit()
+        plan = self._plan(messages)
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(plan["first_token"])
+            self._maybe_fail()
+            await asyncio.sleep(len(plan["words"]) / self.tokens_per_second)
+        finally:
+            self.in_flight -= 1
+        return AIMessage(content=" ".join(plan["words"]), usage_metadata=plan["usage"])
+
+    async def astream(self, messages: List[Any], **kwargs: Any) -> AsyncIterator[AIMessageChunk]:
+        self._admit()
+        plan = self._plan(messages)
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(plan["first_token"])
+            self._maybe_fail()
+            started = time.perf_counter()
+            for i, word in enumerate(plan["words"]):
+                # Sleep to the word's scheduled time so timer overhead does not accumulate
+                delay = started + i / self.tokens_per_second - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                last = i == len(plan["words"]) - 1
+                yield AIMessageChunk(
+                    content=word if i == 0 else " " + word,
+                    usage_metadata=plan["usage"] if last else None
+                )
+        finally:
+            self.in_flight -= 1
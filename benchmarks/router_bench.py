@@ -0,0 +1,68 @@
+"""Micro-benchmark: compiled FlowRouter vs the original nested substring loop
+
+Run with: python -m benchmarks.router_bench
+"""
+import random
+import string
+import timeit
+from pathlib import Path
+from typing import Any, Dict, List
+
+import yaml
+
+from router import FlowRouter
+
+def legacy_route(patterns: Dict[str, List[Any]], user_input: str) -> str:
+    """Original determine_flow routing: first substring hit in dict order (priorities ignored)"""
+    user_input_lower = user_input.lower()
+    for flow_type, flow_patterns in patterns.items():
+        for spec in flow_patterns:
+            pattern = spec["pattern"] if isinstance(spec, dict) else spec
+            if pattern.lower() in user_input_lower:
+                return flow_type
+    return "llm"
+
+def synthetic_patterns(base: Dict[str, List[str]], extra_per_flow: int, rng: random.Random) -> Dict[str, List[str]]:
+    """Pad the real routing table with random multi-word phrases"""
+    patterns = {flow: list(items) for flow, items in base.items()}
+    for flow in patterns:
+        for _ in range(extra_per_flow):
+            words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(2)]
+            patterns[flow].append(" ".join(words))
+    return patterns
+
+def synthetic_input(rng: random.Random, words: int) -> str:
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(words))
+
+def bench(label: str, patterns: Dict[str, List[str]], inputs: List[str], number: int):
+    router = FlowRouter(patterns)
+    legacy = timeit.timeit(lambda: [legacy_route(patterns, text) for text in inputs], number=number)
+    compiled = timeit.timeit(lambda: [router.route(text) for text in inputs], number=number)
+    calls = number * len(inputs)
+    print(
+        f"{label:<40} legacy {legacy / calls * 1e6:9.2f} us/call   "
+        f"compiled {compiled / calls * 1e6:9.2f} us/call   speedup {legacy / compiled:5.2f}x"
+    )
+
+def main():
+    rng = random.Random(42)
+    config = yaml.safe_load(Path("configs/flows.yaml").read_text())
+    base = config["routing"]["patterns"]
+
+    short_inputs = [
+        "search for latest AI news",
+        "explain quantum computing in simple terms",
+        "calculate 15 + 25 * 3",
+        "tell me a story about dragons",
+    ]
+    long_inputs = [synthetic_input(rng, 400) for _ in range(4)]
+
+    print(f"{'scenario':<40} (per route call)")
+    for extra in (0, 100, 1000):
+        patterns = synthetic_patterns(base, extra, rng)
+        total = sum(len(p) for p in patterns.values())
+        bench(f"{total:>5} patterns, short inputs", patterns, short_inputs, number=200)
+        bench(f"{total:>5} patterns, ~2.5KB pasted inputs", patterns, long_inputs, number=20)
+
+if __name__ == "__main__":
+    main()
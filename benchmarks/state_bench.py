@@ -0,0 +1,131 @@
+"""Micro-benchmark: per-request CPU and memory of graph state objects
+
+Run with: python -m benchmarks.state_bench
+
+Compares the pydantic models the nodes used to build with the slotted
+classes in state.py, then measures whole requests where no upstream time
+hides the framework: the math flow, and LLM flow requests served from the
+result cache.
+"""
+import asyncio
+import gc
+import os
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+import state
+import tracing
+
+class PydanticContext(BaseModel):
+    """ExecutionContext as it was before the hot path moved to slotted classes"""
+    flow_id: str
+    node_id: str
+    timestamp: float
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+
+class PydanticValidation(BaseModel):
+    is_valid: bool
+    errors: List[str] = Field(default_factory=list)
+    warnings: List[str] = Field(default_factory=list)
+
+class PydanticResult(BaseModel):
+    success: bool
+    data: Any = None
+    error: Optional[str] = None
+    execution_time: float = 0.0
+    context: Optional[PydanticContext] = None
+    time_to_first_token: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+
+def request_objects(context_class: type, validation_class: type, result_class: type) -> List[Any]:
+    """The state objects one two-node request allocates (a node plus output)"""
+    context = context_class(flow_id="bench", node_id="start", timestamp=time.time(), metadata={})
+    return [
+        context,
+        validation_class(is_valid=True, errors=[], warnings=[]),
+        result_class(success=True, data={"result": 14.0, "expression": "2+3*4"}, execution_time=0.001, context=context),
+        result_class(success=True, data="🧮 Result: 14.0", execution_time=0.0001, context=context)
+    ]
+
+def retained_bytes(build: Callable[[], Any], count: int = 10000) -> float:
+    """Average bytes kept alive per build() result"""
+    gc.collect()
+    tracemalloc.start()
+    kept = [build() for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size / count
+
+def compare_objects(number: int = 20000):
+    print(f"{'state objects per request':<32} {'us/request':>12} {'bytes kept':>12}")
+    variants = [
+        ("pydantic models", lambda: request_objects(PydanticContext, PydanticValidation, PydanticResult)),
+        ("slotted classes (state.py)", lambda: request_objects(state.ExecutionContext, state.ValidationResult, state.NodeResult))
+    ]
+    for label, build in variants:
+        seconds = timeit.timeit(build, number=number)
+        print(f"{label:<32} {seconds / number * 1e6:12.2f} {retained_bytes(build):12.0f}")
+
+async def measure(agent: Any, user_input: str, flow: str, requests: int) -> Dict[str, float]:
+    """CPU time and median peak traced memory per request, after warming the flow up"""
+    for _ in range(20):
+        await agent.execute(user_input, flow)
+
+    # Best of several batches, since other processes only ever add CPU time
+    batches = []
+    for _ in range(5):
+        gc.collect()
+        cpu = time.process_time()
+        for _ in range(requests // 5):
+            result = await agent.execute(user_input, flow)
+        batches.append((time.process_time() - cpu) / (requests // 5))
+        if not result["success"]:
+            raise RuntimeError(f"{flow} request failed: {result['error']}")
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(requests, 200)):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await agent.execute(user_input, flow)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    peaks.sort()
+    return {"cpu_us": min(batches) * 1e6, "peak_kib": peaks[len(peaks) // 2] / 1024}
+
+async def compare_requests(requests: int = 2000):
+    from agent import MultiFlowAgent
+    from benchmarks.fakes import Distribution, FakeGemini
+    from cache import ResultCache
+
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    agent = MultiFlowAgent()
+    agent.tracer = tracing.Tracer(path=None)
+    agent.history = None
+    llm = agent.get_node("LLMNode")
+    llm.llm = FakeGemini(Distribution("fixed", [0]), Distribution("fixed", [50]), tokens_per_second=1e9)
+    llm.semantic_cache = None
+
+    with tempfile.TemporaryDirectory() as directory:
+        agent.cache = ResultCache(path=os.path.join(directory, "cache.sqlite3"), ttls={"llm": 3600, "math": 0}, enabled=True)
+        print(f"\n{'whole request':<32} {'CPU us':>12} {'peak KiB':>12}")
+        for label, user_input, flow in (
+            ("math flow", "calculate 15 + 25 * 3", "math"),
+            ("llm flow, result cache hit", "explain the result cache", "llm")
+        ):
+            stats = await measure(agent, user_input, flow, requests)
+            print(f"{label:<32} {stats['cpu_us']:12.1f} {stats['peak_kib']:12.1f}")
+        agent.cache.close()
+
+def main():
+    compare_objects()
+    asyncio.run(compare_requests())
+
+if __name__ == "__main__":
+    main()
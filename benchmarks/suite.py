@@ -0,0 +1,307 @@
+"""End-to-end benchmark of every flow in flows.yaml against fake upstreams
+
+Run with: python main.py bench
+
+Each flow is driven through MultiFlowAgent.execute at a fixed concurrency while
+SearchNode talks to benchmarks.fakes.FakeSerper (which also serves the result pages
+ReaderNode fetches) and LLMNode to FakeGemini. Request
+spans are collected in memory; time spent outside "upstream *" spans is reported as
+framework overhead, so regressions in routing, parsing, graph execution or output
+formatting show up even when upstream latency dominates the total.
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import tracing
+from benchmarks.fakes import Distribution, FakeGemini, FakeSerper
+
+if TYPE_CHECKING:
+    from agent import MultiFlowAgent
+
+RESULT_VERSION = 1
+
+# Used for flows that do not declare benchmark.inputs in flows.yaml; {i} is the request number
+DEFAULT_INPUTS = ["benchmark request {i}"]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Exact percentile with linear interpolation between closest ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """Mean and p50/p95/p99 of millisecond samples"""
+    summary = {"mean": round(sum(values) / len(values), 3) if values else None}
+    for q in QUANTILES:
+        value = percentile(values, q)
+        summary[f"p{int(q * 100)}"] = None if value is None else round(value, 3)
+    return summary
+
+class SpanCollector:
+    """Tracer sink that breaks each finished trace into total, upstream and per-node time"""
+
+    def __init__(self):
+        self.traces: Dict[str, Dict[str, Any]] = {}
+
+    def __call__(self, spans: List[Dict[str, Any]]):
+        by_id = {span["span_id"]: span for span in spans}
+        root = next(span for span in spans if span["parent_id"] is None)
+
+        def upstream_ms(span_id: str) -> float:
+            # Wall time covered by upstream calls nested anywhere below the given
+            # span; calls overlapping in parallel branches are counted once
+            intervals = []
+            for span in spans:
+                if not span["name"].startswith("upstream "):
+                    continue
+                parent = span["parent_id"]
+                while parent is not None and parent != span_id:
+                    parent = by_id[parent]["parent_id"] if parent in by_id else None
+                if parent == span_id:
+                    intervals.append((span["start_ms"], span["start_ms"] + span["duration_ms"]))
+            total = 0.0
+            covered_until = float("-inf")
+            for begin, end in sorted(intervals):
+                if end > covered_until:
+                    total += end - max(begin, covered_until)
+                    covered_until = end
+            return total
+
+        nodes = {}
+        for span in spans:
+            if span["name"].startswith("node "):
+                waiting = upstream_ms(span["span_id"])
+                nodes[span["name"][5:]] = {"duration_ms": span["duration_ms"], "overhead_ms": span["duration_ms"] - waiting}
+
+        waiting = upstream_ms(root["span_id"])
+        self.traces[root["trace_id"]] = {
+            "duration_ms": root["duration_ms"],
+            "upstream_ms": waiting,
+            "overhead_ms": root["duration_ms"] - waiting,
+            "nodes": nodes
+        }
+
+def flow_inputs(flow_config: Dict[str, Any]) -> List[str]:
+    """Input templates for a flow, from its benchmark.inputs entry in flows.yaml"""
+    return list((flow_config.get("benchmark") or {}).get("inputs") or DEFAULT_INPUTS)
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+class BenchmarkSuite:
+    """Runs the configured flows against fake upstreams and aggregates the results"""
+
+    def __init__(
+        self,
+        agent: "MultiFlowAgent",
+        requests: int = 100,
+        concurrency: int = 10,
+        warmup: int = 5,
+        search_latency: str = "lognormal:80,0.4",
+        search_payload: str = "lognormal:160,0.5",
+        llm_latency: str = "lognormal:400,0.5",
+        llm_payload: str = "lognormal:120,0.6",
+        page_latency: str = "lognormal:150,0.5",
+        page_size: str = "lognormal:60000,0.6",
+        stream: bool = False,
+        error_rate: float = 0.0,
+        capacity: Optional[int] = None,
+        seed: int = 42
+    ):
+        if requests < 1 or concurrency < 1 or warmup < 0:
+            raise ValueError("requests and concurrency must be positive and warmup not negative")
+        if not 0 <= error_rate <= 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.agent = agent
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.stream = stream
+        self.seed = seed
+
+        rng = random.Random(seed)
+        self.settings = {
+            "requests": requests,
+            "concurrency": concurrency,
+            "warmup": warmup,
+            "stream": stream,
+            "error_rate": error_rate,
+            "upstream_capacity": capacity,
+            "seed": seed,
+            "search_latency_ms": search_latency,
+            "search_snippet_chars": search_payload,
+            "llm_latency_ms": llm_latency,
+            "llm_response_words": llm_payload,
+            "page_latency_ms": page_latency,
+            "page_bytes": page_size
+        }
+        self.serper = FakeSerper(
+            Distribution.parse(search_latency, rng), Distribution.parse(search_payload, rng), rng, error_rate, capacity,
+            page_latency_ms=Distribution.parse(page_latency, rng), page_bytes=Distribution.parse(page_size, rng)
+        )
+        self.gemini = FakeGemini(
+            Distribution.parse(llm_latency, rng), Distribution.parse(llm_payload, rng), rng=rng, error_rate=error_rate, capacity=capacity
+        )
+        self.collector = SpanCollector()
+
+    def _install_fakes(self):
+        """Point the agent's upstream nodes at the fakes and turn off result caching"""
+        os.environ.setdefault("SERPER_API_KEY", "benchmark")
+        os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+        search = self.agent.get_node("SearchNode")
+        search.base_url = self.serper.url
+        llm = self.agent.get_node("LLMNode")
+        llm.llm = self.gemini
+        llm.semantic_cache = None
+
+        # Every request must reach the nodes, so no result caching; benchmark runs stay out of the history
+        self.agent.cache.ttls = {}
+        self.agent.history = None
+        self.agent.tracer = tracing.Tracer(path=None, sink=self.collector)
+
+    async def _execute(self, user_input: str, flow: str) -> Dict[str, Any]:
+        if not self.stream:
+            return await self.agent.execute(user_input, flow)
+        result: Dict[str, Any] = {}
+        async for event in self.agent.execute_stream(user_input, flow):
+            if event["type"] == "result":
+                result = event["result"]
+        return result
+
+    async def _run_flow(self, flow: str, templates: List[str]) -> Dict[str, Any]:
+        limit = asyncio.Semaphore(self.concurrency)
+        outcomes: List[Dict[str, Any]] = []
+
+        async def one(i: int, record: bool):
+            async with limit:
+                result = await self._execute(templates[i % len(templates)].format(i=i), flow)
+            if record:
+                outcomes.append(result)
+
+        await asyncio.gather(*(one(i, False) for i in range(self.warmup)))
+        self.collector.traces.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one(self.warmup + i, True) for i in range(self.requests)))
+        elapsed = time.perf_counter() - start
+
+        errors = [result.get("error") for result in outcomes if not result.get("success")]
+        traces = [self.collector.traces.pop(result["flow_id"]) for result in outcomes if result.get("flow_id") in self.collector.traces]
+
+        node_names: List[str] = []
+        for trace in traces:
+            node_names.extend(name for name in trace["nodes"] if name not in node_names)
+        nodes = {
+            name: {
+                "latency_ms": summarize([trace["nodes"][name]["duration_ms"] for trace in traces if name in trace["nodes"]]),
+                "overhead_ms": summarize([trace["nodes"][name]["overhead_ms"] for trace in traces if name in trace["nodes"]])
+            }
+            for name in node_names
+        }
+
+        return {
+            "requests": len(outcomes),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(outcomes) / elapsed, 2) if elapsed > 0 else None,
+            "latency_ms": summarize([trace["duration_ms"] for trace in traces]),
+            "upstream_ms": summarize([trace["upstream_ms"] for trace in traces]),
+            "overhead_ms": summarize([trace["overhead_ms"] for trace in traces]),
+            "nodes": nodes
+        }
+
+    async def run(self, flows: Optional[List[str]] = None, progress: Any = None) -> Dict[str, Any]:
+        """Benchmark the given flows (default: all configured) and return the result document"""
+        flows = flows or list(self.agent.flows)
+        unknown = [flow for flow in flows if flow not in self.agent.flows]
+        if unknown:
+            raise ValueError(f"Unknown flow(s): {', '.join(unknown)}")
+
+        results = {}
+        async with self.serper:
+            self._install_fakes()
+            async with self.agent:
+                for flow in flows:
+                    if progress is not None:
+                        progress(flow)
+                    results[flow] = await self._run_flow(flow, flow_inputs(self.agent.flows[flow]))
+
+        return {
+            "version": RESULT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": self.settings,
+            "flows": results
+        }
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1, min_delta_ms: float = 0.5) -> List[Dict[str, Any]]:
+    """List metrics that got worse by more than threshold (relative) between two result documents
+
+    Latency and overhead regressions smaller than min_delta_ms are ignored as noise.
+    """
+    regressions = []
+
+    def check(flow: str, metric: str, before: Optional[float], after: Optional[float], higher_is_worse: bool = True, absolute: float = min_delta_ms):
+        if before is None or after is None:
+            return
+        delta = after - before if higher_is_worse else before - after
+        if delta <= absolute or before == 0 or delta / before <= threshold:
+            return
+        regressions.append({
+            "flow": flow,
+            "metric": metric,
+            "before": before,
+            "after": after,
+            "change": round((after - before) / before, 4)
+        })
+
+    for flow, now in current.get("flows", {}).items():
+        then = previous.get("flows", {}).get(flow)
+        if then is None:
+            continue
+        for quantile in ("p50", "p95", "p99"):
+            check(flow, f"latency {quantile}", then["latency_ms"].get(quantile), now["latency_ms"].get(quantile))
+            check(flow, f"overhead {quantile}", then["overhead_ms"].get(quantile), now["overhead_ms"].get(quantile))
+        check(flow, "throughput", then.get("throughput_rps"), now.get("throughput_rps"), higher_is_worse=False, absolute=0.0)
+        if now.get("errors", 0) > then.get("errors", 0):
+            regressions.append({"flow": flow, "metric": "errors", "before": then.get("errors", 0), "after": now["errors"], "change": None})
+        for node, stats in now.get("nodes", {}).items():
+            before = (then.get("nodes", {}).get(node) or {}).get("overhead_ms", {})
+            check(flow, f"node {node} overhead p50", before.get("p50"), stats["overhead_ms"].get("p50"))
+
+    return regressions
+
+def load_result(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as file:
+        result = json.load(file)
+    if result.get("version") != RESULT_VERSION:
+        raise ValueError(f"{path} is not a benchmark result (version {result.get('version')!r}, expected {RESULT_VERSION})")
+    return result
+
+def write_result(path: str, result: Dict[str, Any]):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+        file.write("\n")
@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# Flows whose inputs are matched case-insensitively (search engines ignore case)
+CASE_INSENSITIVE_FLOWS = {"search"}
+
+class CacheStats:
+    """Hit/miss/eviction counters for the result cache"""
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "writes": self.writes,
+            "evictions": self.evictions
+        }
+
+class LRUCache:
+    """In-memory LRU tier with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str, now: float) -> Optional[Any]:
+        """Return a live entry and mark it as recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, expires_at: float) -> int:
+        """Store an entry, returning the number of entries evicted"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache:
+    """Persistent SQLite tier shared across process restarts"""
+
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int = 100000, stale_for: float = 0.0):
+        self.path = path
+        self.max_entries = max_entries
+        # Expired entries are kept this long to serve while an upstream is down
+        self.stale_for = stale_for
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                flow TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created ON cache (created_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, expires_at) for a key, including expired entries"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, flow: str, value: Any, expires_at: float) -> int:
+        """Store an entry, returning the number of entries pruned"""
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, flow, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, flow, payload, time.time(), expires_at)
+            )
+            self._conn.commit()
+            self._writes_since_prune += 1
+
+            if self._writes_since_prune < self.PRUNE_INTERVAL:
+                return 0
+            self._writes_since_prune = 0
+
+        return self.prune()
+
+    def prune(self) -> int:
+        """Drop entries past their stale window and the oldest entries beyond capacity"""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM cache WHERE expires_at <= ?", (time.time() - self.stale_for,)
+            ).rowcount
+            removed += self._conn.execute(
+                """
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResultCache:
+    """Two-tier (memory LRU + SQLite) cache for node outputs"""
+
+    def __init__(
+        self,
+        path: Optional[str] = "data/cache.sqlite3",
+        memory_entries: int = 1024,
+        disk_entries: int = 100000,
+        ttls: Optional[Dict[str, float]] = None,
+        enabled: bool = True,
+        stale_for: float = 0.0
+    ):
+        self.enabled = enabled
+        self.ttls = ttls or {}
+        self.stale_for = stale_for
+        self.memory = LRUCache(memory_entries)
+        self.disk = SQLiteCache(path, disk_entries, stale_for) if enabled and path else None
+        self.stats = CacheStats()
+
+    def ttl_for(self, flow: str) -> float:
+        """Return the TTL in seconds for a flow (0 disables caching)"""
+        if not self.enabled:
+            return 0
+        return float(self.ttls.get(flow, 0) or 0)
+
+    @staticmethod
+    def _normalize(value: Any, casefold: bool) -> Any:
+        """Normalize inputs so trivially different requests share a key"""
+        if isinstance(value, str):
+            value = " ".join(value.split())
+            return value.casefold() if casefold else value
+        if isinstance(value, dict):
+            return {k: ResultCache._normalize(v, casefold) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [ResultCache._normalize(v, casefold) for v in value]
+        return value
+
+    def make_key(self, flow: str, node: str, parsed_input: Dict[str, Any]) -> str:
+        """Build a stable key from flow, node and normalized parsed input"""
+        normalized = self._normalize(parsed_input, flow in CASE_INSENSITIVE_FLOWS)
+        raw = json.dumps([flow, node, normalized], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Tuple[Any, str]]:
+        """Look up a key in memory, then on disk; returns (value, tier)"""
+        now = time.time()
+        value = self.memory.get(key, now)
+        if value is not None:
+            self.stats.memory_hits += 1
+            return value, "memory"
+
+        if self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None and entry[1] > now:
+                value, expires_at = entry
+                # Promote disk hits so the next lookup stays in memory
+                self.stats.evictions += self.memory.set(key, value, expires_at)
+                self.stats.disk_hits += 1
+                return value, "disk"
+
+        self.stats.misses += 1
+        return None
+
+    async def get_stale(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Look up an entry on disk even if it has expired; returns (value, seconds past expiry)"""
+        if self.disk is None:
+            return None
+        entry = await asyncio.to_thread(self.disk.get, key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        age = max(0.0, time.time() - expires_at)
+        if age > self.stale_for:
+            return None
+        self.stats.stale_hits += 1
+        return value, age
+
+    async def set(self, key: str, flow: str, value: Any):
+        """Store a value in both tiers using the flow's TTL"""
+        ttl = self.ttl_for(flow)
+        if ttl <= 0:
+            return
+
+        expires_at = time.time() + ttl
+        self.stats.evictions += self.memory.set(key, value, expires_at)
+        self.stats.writes += 1
+
+        if self.disk is not None:
+            try:
+                self.stats.evictions += await asyncio.to_thread(
+                    self.disk.set, key, flow, value, expires_at
+                )
+            except (TypeError, ValueError):
+                # Values that are not JSON serializable stay memory-only
+                pass
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,295 @@
+import functools
+import keyword
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Numbers, identifiers and operators; "**" is accepted as an alias for "^"
+TOKEN = re.compile(
+    r"\s*(?:"
+    r"(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    r"|(?P<name>[A-Za-z_][A-Za-z_0-9]*)"
+    r"|(?P<op>\*\*|[-+*/%^(),])"
+    r")"
+)
+
+SYMBOLS = {"×": "*", "÷": "/", "−": "-"}
+
+# Literal numbers are lifted out of the expression so "2 + 3" and "7 + 11"
+# share one compiled template
+NUMBER = "#"
+
+def _checked_pow(base: float, exponent: float) -> float:
+    try:
+        return math.pow(base, exponent)
+    except OverflowError:
+        raise ValueError("Result is too large")
+
+SCALAR_FUNCTIONS: Dict[str, Callable] = {
+    "sqrt": math.sqrt,
+    "abs": abs,
+    "exp": math.exp,
+    "ln": math.log,
+    "log": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "round": round,
+    "min": min,
+    "max": max,
+    "pow": _checked_pow,
+}
+
+ARRAY_FUNCTIONS: Dict[str, Callable] = {
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "exp": np.exp,
+    "ln": np.log,
+    "log": np.log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "round": np.round,
+    "min": lambda *args: functools.reduce(np.minimum, args),
+    "max": lambda *args: functools.reduce(np.maximum, args),
+    "pow": np.power,
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+
+class ExpressionError(ValueError):
+    """Raised for expressions that cannot be parsed or evaluated"""
+
+def tokenize(text: str) -> Tuple[Tuple[str, ...], List[float]]:
+    """Split an expression into a number-free template and its literal numbers"""
+    for symbol, replacement in SYMBOLS.items():
+        text = text.replace(symbol, replacement)
+
+    template: List[str] = []
+    numbers: List[float] = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ExpressionError(f"Unexpected character {text[position:].lstrip()[:1]!r} in expression")
+        position = match.end()
+
+        if match.group("number") is not None:
+            template.append(NUMBER)
+            numbers.append(float(match.group("number")))
+        elif match.group("name") is not None:
+            template.append(match.group("name").lower())
+        else:
+            template.append("^" if match.group("op") == "**" else match.group("op"))
+
+    if not template:
+        raise ExpressionError("Expression is empty")
+    return tuple(template), numbers
+
+class _Parser:
+    """Recursive-descent parser emitting fully parenthesized Python source
+
+    Grammar (lowest to highest precedence):
+        expr  := term (("+" | "-") term)*
+        term  := unary (("*" | "/" | "%") unary)*
+        unary := ("-" | "+") unary | power
+        power := atom ("^" unary)?        right associative, binds tighter than unary minus
+        atom  := NUMBER | CONSTANT | VARIABLE | FUNCTION "(" expr ("," expr)* ")" | "(" expr ")"
+    """
+
+    def __init__(self, template: Tuple[str, ...]):
+        self.tokens = template
+        self.position = 0
+        self.numbers = 0
+        self.variables: List[str] = []
+        self.functions: List[str] = []
+
+    def parse(self) -> str:
+        source = self._expr()
+        if self.position != len(self.tokens):
+            raise ExpressionError(f"Unexpected {self._describe(self.tokens[self.position])} in expression")
+        return source
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise ExpressionError("Expression ended unexpectedly")
+        self.position += 1
+        return token
+
+    def _expect(self, token: str):
+        if self._peek() != token:
+            found = self._peek()
+            raise ExpressionError(f"Expected '{token}' but found {self._describe(found) if found else 'end of expression'}")
+        self.position += 1
+
+    @staticmethod
+    def _describe(token: str) -> str:
+        return "number" if token == NUMBER else f"'{token}'"
+
+    def _expr(self) -> str:
+        source = self._term()
+        while self._peek() in ("+", "-"):
+            operator = self._take()
+            source = f"({source} {operator} {self._term()})"
+        return source
+
+    def _term(self) -> str:
+        source = self._unary()
+        while self._peek() in ("*", "/", "%"):
+            operator = self._take()
+            source = f"({source} {operator} {self._unary()})"
+        return source
+
+    def _unary(self) -> str:
+        if self._peek() in ("-", "+"):
+            operator = self._take()
+            return f"({operator}{self._unary()})"
+        return self._power()
+
+    def _power(self) -> str:
+        base = self._atom()
+        if self._peek() == "^":
+            self._take()
+            return f"_pow({base}, {self._unary()})"
+        return base
+
+    def _atom(self) -> str:
+        token = self._take()
+
+        if token == NUMBER:
+            self.numbers += 1
+            return f"_{self.numbers - 1}"
+
+        if token == "(":
+            source = self._expr()
+            self._expect(")")
+            return source
+
+        if token in SCALAR_FUNCTIONS and self._peek() == "(":
+            self._take()
+            args = [self._expr()]
+            while self._peek() == ",":
+                self._take()
+                args.append(self._expr())
+            self._expect(")")
+            if token not in self.functions:
+                self.functions.append(token)
+            return f"_fn_{token}({', '.join(args)})"
+
+        if token in CONSTANTS:
+            return f"_const_{token}"
+
+        if token[0].isalpha() and not keyword.iskeyword(token):
+            if token in SCALAR_FUNCTIONS:
+                raise ExpressionError(f"Function '{token}' must be called with parentheses")
+            if token not in self.variables:
+                self.variables.append(token)
+            return token
+
+        raise ExpressionError(f"Unexpected {self._describe(token)} in expression")
+
+class CompiledExpression:
+    """A parsed expression template, evaluable against numbers and variable bindings"""
+
+    def __init__(self, template: Tuple[str, ...]):
+        parser = _Parser(template)
+        body = parser.parse()
+
+        self.template = template
+        self.variables = tuple(parser.variables)
+        self.functions = tuple(parser.functions)
+        self.number_count = parser.numbers
+
+        # The source is generated only from validated tokens: numbered literal slots,
+        # whitelisted functions/constants and checked identifiers
+        params = ", ".join([f"_{i}" for i in range(self.number_count)] + list(self.variables))
+        self.source = f"lambda {params}: {body}"
+        self._code = compile(self.source, "<expression>", "eval")
+        self._scalar = self._bind(SCALAR_FUNCTIONS, _checked_pow)
+        self._array: Optional[Callable] = None
+
+    def _bind(self, functions: Dict[str, Callable], power: Callable) -> Callable:
+        namespace: Dict[str, Any] = {"__builtins__": {}, "_pow": power}
+        namespace.update({f"_fn_{name}": functions[name] for name in self.functions})
+        namespace.update({f"_const_{name}": value for name, value in CONSTANTS.items()})
+        return eval(self._code, namespace)
+
+    def _arguments(self, numbers: List[float], bindings: Dict[str, Any]) -> List[Any]:
+        missing = [name for name in self.variables if name not in bindings]
+        if missing:
+            raise ExpressionError(f"Unbound variables: {', '.join(missing)}")
+        return [*numbers, *(bindings[name] for name in self.variables)]
+
+    def evaluate(self, numbers: List[float], bindings: Optional[Dict[str, float]] = None) -> float:
+        """Evaluate with scalar bindings"""
+        args = self._arguments(numbers, bindings or {})
+        try:
+            return float(self._scalar(*args))
+        except ZeroDivisionError:
+            raise ExpressionError("Division by zero is not allowed")
+        except OverflowError:
+            raise ExpressionError("Result is too large")
+        except ExpressionError:
+            raise
+        except (ValueError, TypeError) as e:
+            raise ExpressionError(f"Math error: {e}")
+
+    def evaluate_array(self, numbers: List[float], bindings: Dict[str, Any]) -> np.ndarray:
+        """Evaluate once over array bindings (element-wise, with broadcasting)"""
+        if self._array is None:
+            self._array = self._bind(ARRAY_FUNCTIONS, np.power)
+        args = self._arguments(numbers, {name: np.asarray(value, dtype=np.float64) for name, value in bindings.items()})
+        with np.errstate(divide="raise", invalid="raise", over="raise"):
+            try:
+                return np.asarray(self._array(*args), dtype=np.float64)
+            except FloatingPointError as e:
+                raise ExpressionError(f"Math error: {e}")
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(template: Tuple[str, ...]) -> CompiledExpression:
+    """Compile a number-free template once; repeated shapes are served from the cache"""
+    return CompiledExpression(template)
+
+class Expression:
+    """A compiled template together with the literal numbers of one input"""
+
+    def __init__(self, text: str):
+        template, self.numbers = tokenize(text)
+        self.text = " ".join(text.split())
+        self.compiled = compile_template(template)
+
+    @property
+    def variables(self) -> Tuple[str, ...]:
+        return self.compiled.variables
+
+    def evaluate(self, bindings: Optional[Dict[str, Any]] = None) -> Any:
+        """Evaluate against scalar bindings, or element-wise when any binding is a list"""
+        bindings = bindings or {}
+        if any(isinstance(value, (list, tuple, np.ndarray)) for value in bindings.values()):
+            return self.compiled.evaluate_array(self.numbers, bindings).tolist()
+        return self.compiled.evaluate(self.numbers, bindings)
+
+def parse(text: str) -> Expression:
+    """Parse an expression, reusing the compiled form of any previously seen template"""
+    return Expression(text)
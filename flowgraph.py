@@ -0,0 +1,137 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+def _names(value: Any) -> List[str]:
+    """A `next`/`entry` value as a list of node names"""
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+class FlowPlan:
+    """Topology of one flow from flows.yaml, validated as a DAG
+
+    A node's `next` (and the flow's `entry`) may name one node or a list of
+    nodes that run concurrently. A node reached from several nodes is a join:
+    it runs once every incoming branch has finished, or with `join: N` once N
+    branches have succeeded, cancelling the rest. Each parallel branch is a
+    chain of nodes that ends at its join.
+    """
+
+    def __init__(self, flow_name: str, flow_config: Dict[str, Any]):
+        nodes = flow_config.get("nodes") or []
+        if not nodes:
+            raise ValueError(f"Flow '{flow_name}' has no nodes")
+        self.flow_name = flow_name
+        self.order = [node_config["name"] for node_config in nodes]
+        if len(set(self.order)) != len(self.order):
+            raise ValueError(f"Flow '{flow_name}' has duplicate node names")
+
+        self.successors = {node_config["name"]: _names(node_config.get("next")) for node_config in nodes}
+        self.entry = _names(flow_config.get("entry")) or [self.order[0]]
+        for name in self.entry + [successor for targets in self.successors.values() for successor in targets]:
+            if name not in self.successors:
+                raise ValueError(f"Flow '{flow_name}' references unknown node: {name}")
+
+        self.predecessors: Dict[str, List[str]] = {name: [] for name in self.order}
+        for name, targets in self.successors.items():
+            for target in targets:
+                self.predecessors[target].append(name)
+        self._check_acyclic()
+
+        # Join node -> number of branches that must succeed before it runs
+        self.joins: Dict[str, int] = {}
+        for node_config in nodes:
+            name = node_config["name"]
+            incoming = len(self.predecessors[name])
+            join = node_config.get("join", "all")
+            if incoming < 2:
+                if "join" in node_config:
+                    raise ValueError(f"Node '{name}' in flow '{flow_name}' has a join setting but only one predecessor")
+                continue
+            if join == "all":
+                self.joins[name] = incoming
+            elif isinstance(join, int) and 1 <= join <= incoming:
+                self.joins[name] = join
+            else:
+                raise ValueError(f"Node '{name}' in flow '{flow_name}': join must be 'all' or 1..{incoming}, got {join!r}")
+
+        # Node on a parallel branch -> (join it leads to, first node of the branch)
+        self.branches: Dict[str, Tuple[str, str]] = {}
+        forks = [self.entry] if len(self.entry) > 1 else []
+        forks.extend(targets for targets in self.successors.values() if len(targets) > 1)
+        for heads in forks:
+            joins = {self._walk_branch(head) for head in heads}
+            if len(joins) > 1:
+                raise ValueError(f"Parallel branches {heads} in flow '{flow_name}' must meet at one join node")
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Flow '{self.flow_name}' has a cycle through node '{name}'")
+            visiting.add(name)
+            for successor in self.successors[name]:
+                visit(successor)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.order:
+            visit(name)
+
+    def _walk_branch(self, head: str) -> str:
+        """Mark the chain starting at head as one branch and return the join it reaches"""
+        members = []
+        name = head
+        while name not in self.joins:
+            targets = self.successors[name]
+            if len(targets) != 1:
+                raise ValueError(
+                    f"Parallel branch starting at '{head}' in flow '{self.flow_name}' must be a chain ending at a join node"
+                )
+            members.append(name)
+            name = targets[0]
+        for member in members:
+            self.branches[member] = (name, head)
+        return name
+
+    def is_tail(self, name: str) -> bool:
+        """Whether the node is the last one on its branch"""
+        return name in self.branches and self.successors[name] == [self.branches[name][0]]
+
+class JoinProgress:
+    """Per-request outcome of the branches feeding one join node"""
+
+    def __init__(self, branches: int, required: int):
+        self.branches = branches
+        self.required = required
+        self.succeeded: List[str] = []
+        self.errors: Dict[str, str] = {}
+        self.cancelled: List[str] = []
+        self.satisfied = asyncio.Event()
+
+    @property
+    def racing(self) -> bool:
+        """Whether slower branches are cancelled once enough have succeeded"""
+        return self.required < self.branches
+
+    def is_open(self, head: str) -> bool:
+        """Whether nodes on the given branch should still run"""
+        return not self.satisfied.is_set() and head not in self.errors
+
+    def finish(self, head: str, error: Optional[str] = None):
+        if error is not None:
+            self.errors[head] = error
+            return
+        self.succeeded.append(head)
+        if len(self.succeeded) >= self.required:
+            self.satisfied.set()
+
+    def error(self) -> Optional[str]:
+        """Why the join cannot proceed, or None when enough branches succeeded"""
+        if len(self.succeeded) >= self.required:
+            return None
+        details = "; ".join(f"{head}: {error}" for head, error in self.errors.items())
+        return f"{len(self.succeeded)} of {self.required} required branches succeeded" + (f" ({details})" if details else "")
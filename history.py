@@ -0,0 +1,291 @@
+import atexit
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS executions (
+        flow_id TEXT PRIMARY KEY,
+        started_at REAL NOT NULL,
+        flow TEXT NOT NULL,
+        success INTEGER NOT NULL,
+        duration_ms REAL NOT NULL,
+        input TEXT NOT NULL,
+        error TEXT,
+        cache TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS node_runs (
+        flow_id TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        flow TEXT NOT NULL,
+        node TEXT NOT NULL,
+        success INTEGER NOT NULL,
+        duration_ms REAL NOT NULL,
+        cache_status TEXT,
+        error TEXT
+    )
+    """,
+    # The time indexes cover window_stats, so it never reads the tables
+    "CREATE INDEX IF NOT EXISTS idx_executions_time ON executions (started_at, flow, success, duration_ms)",
+    "CREATE INDEX IF NOT EXISTS idx_executions_flow ON executions (flow, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_executions_outcome ON executions (success, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_node_runs_time ON node_runs (started_at, flow, node, success, duration_ms)",
+    "CREATE INDEX IF NOT EXISTS idx_node_runs_flow ON node_runs (flow, node, started_at)"
+]
+
+DURATION = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhdw])$")
+UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_duration(text: str) -> float:
+    """Seconds in a duration such as 90s, 15m, 6h, 7d or 2w"""
+    match = DURATION.match(text.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid duration {text!r} (use e.g. 30m, 6h, 7d)")
+    seconds = float(match.group(1)) * UNIT_SECONDS[match.group(2)]
+    if seconds <= 0:
+        raise ValueError(f"Duration {text!r} must be longer than zero")
+    return seconds
+
+def connect(path: str) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+class HistoryStore:
+    """Durable record of every execution in SQLite, written in batches off the request path
+
+    record() only queues a row. A writer thread commits queued rows in one
+    transaction once batch_size are waiting or flush_interval has passed, and
+    drops rows older than retention_days. When the queue is full, rows are
+    dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(
+        self,
+        path: str = "data/history.sqlite3",
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        max_input_chars: int = 2000,
+        retention_days: float = 30.0
+    ):
+        if batch_size < 1 or flush_interval <= 0 or max_queue < 1:
+            raise ValueError("batch_size, flush_interval and max_queue must be positive")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_input_chars = max_input_chars
+        self.retention = retention_days * 86400
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Tuple[Any, ...]]]" = queue.Queue(maxsize=max_queue)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def record(self, user_input: str, flow: str, result: Dict[str, Any], duration: float):
+        """Queue one finished execution; duration is its wall time in seconds"""
+        cache_status = result.get("cache_status") or {}
+        nodes = [
+            (name, details.get("success", False), details.get("execution_time") or 0.0, cache_status.get(name), details.get("error"))
+            for name, details in (result.get("node_results") or {}).items()
+        ]
+        row = (
+            result.get("flow_id"), time.time() - duration, flow, bool(result.get("success")), duration * 1000,
+            user_input[:self.max_input_chars], result.get("error"), cache_status, nodes
+        )
+        self._start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._writer.start()
+                # Flush what is queued even if the process exits without close()
+                atexit.register(self.close)
+
+    def _run(self):
+        conn = connect(self.path)
+        self._prune(conn)
+        pruned_at = time.monotonic()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            if batch:
+                try:
+                    self._write(conn, batch)
+                except sqlite3.Error as e:
+                    # Keep the writer alive; a locked or full disk may recover
+                    self.dropped += len(batch)
+                    warnings.warn(f"Writing {len(batch)} history rows to {self.path} failed: {e}")
+            if time.monotonic() - pruned_at > 3600:
+                self._prune(conn)
+                pruned_at = time.monotonic()
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: List[Tuple[Any, ...]]):
+        executions, node_runs = [], []
+        for flow_id, started_at, flow, success, duration_ms, user_input, error, cache_status, nodes in batch:
+            executions.append((flow_id, started_at, flow, int(success), duration_ms, user_input, error, json.dumps(cache_status)))
+            node_runs.extend(
+                (flow_id, started_at, flow, name, int(node_success), execution_time * 1000, status, node_error)
+                for name, node_success, execution_time, status, node_error in nodes
+            )
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO executions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", executions)
+            conn.executemany("INSERT INTO node_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", node_runs)
+        self.written += len(batch)
+
+    def _prune(self, conn: sqlite3.Connection):
+        if self.retention <= 0:
+            return
+        cutoff = time.time() - self.retention
+        try:
+            with conn:
+                conn.execute("DELETE FROM executions WHERE started_at < ?", (cutoff,))
+                conn.execute("DELETE FROM node_runs WHERE started_at < ?", (cutoff,))
+        except sqlite3.Error as e:
+            warnings.warn(f"Pruning history in {self.path} failed: {e}")
+
+    def close(self, timeout: float = 5.0):
+        """Write everything queued and stop the writer, waiting at most timeout seconds"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is None or not writer.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        writer.join(timeout)
+
+def recent(
+    path: str,
+    limit: int = 20,
+    flow: Optional[str] = None,
+    errors_only: bool = False,
+    since: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Newest executions first, with their node runs"""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("started_at >= ?")
+        params.append(since)
+    if flow:
+        clauses.append("flow = ?")
+        params.append(flow)
+    if errors_only:
+        clauses.append("success = 0")
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = connect(path)
+    try:
+        conn.row_factory = sqlite3.Row
+        rows = [dict(row) for row in conn.execute(
+            f"SELECT * FROM executions{where} ORDER BY started_at DESC LIMIT ?", params + [limit]
+        )]
+        if rows:
+            placeholders = ",".join("?" * len(rows))
+            nodes: Dict[str, List[Dict[str, Any]]] = {}
+            for node in conn.execute(
+                f"SELECT * FROM node_runs WHERE flow_id IN ({placeholders}) ORDER BY rowid", [row["flow_id"] for row in rows]
+            ):
+                nodes.setdefault(node["flow_id"], []).append(dict(node))
+            for row in rows:
+                row["success"] = bool(row["success"])
+                row["cache"] = json.loads(row["cache"])
+                row["nodes"] = nodes.get(row["flow_id"], [])
+    finally:
+        conn.close()
+    return rows
+
+PERCENTILES = {"p50_ms": 0.5, "p95_ms": 0.95, "p99_ms": 0.99}
+
+def window_stats(
+    path: str,
+    window: float,
+    since: float,
+    flow: Optional[str] = None,
+    by_node: bool = False
+) -> List[Dict[str, Any]]:
+    """Request count, error rate and latency percentiles per time window and flow (or flow and node)"""
+    if window <= 0:
+        raise ValueError("window must be positive")
+    table, group = ("node_runs", "flow, node") if by_node else ("executions", "flow")
+    where = "started_at >= :since" + (" AND flow = :flow" if flow else "")
+    # Percentiles interpolate between two ranks, so only those rows leave SQLite
+    ranks = " OR ".join(
+        f"rank IN (CAST((n - 1) * {q} AS INTEGER), MIN(CAST((n - 1) * {q} AS INTEGER) + 1, n - 1))"
+        for q in PERCENTILES.values()
+    )
+    query = f"""
+        SELECT bucket, {group}, n, errors, mean_ms, rank, duration_ms FROM (
+            SELECT CAST(started_at / :window AS INTEGER) AS bucket, {group}, duration_ms,
+                ROW_NUMBER() OVER (by_group ORDER BY duration_ms) - 1 AS rank,
+                COUNT(*) OVER by_group AS n,
+                SUM(success = 0) OVER by_group AS errors,
+                AVG(duration_ms) OVER by_group AS mean_ms
+            FROM {table} WHERE {where}
+            -- Windows are aligned to multiples of their length since the epoch
+            WINDOW by_group AS (PARTITION BY CAST(started_at / :window AS INTEGER), {group})
+        ) WHERE {ranks}
+    """
+
+    groups: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    conn = connect(path)
+    try:
+        for *key, requests, errors, mean_ms, rank, duration_ms in conn.execute(
+            query, {"window": window, "since": since, "flow": flow}
+        ):
+            entry = groups.setdefault(tuple(key), {"requests": requests, "errors": errors, "mean_ms": mean_ms, "ranks": {}})
+            entry["ranks"][rank] = duration_ms
+    finally:
+        conn.close()
+
+    stats = []
+    for (bucket, *names), entry in sorted(groups.items()):
+        requests, values = entry["requests"], entry["ranks"]
+        row = {
+            "window_start": bucket * window,
+            "name": " / ".join(names),
+            "requests": requests,
+            "errors": entry["errors"],
+            "error_rate": entry["errors"] / requests,
+            "mean_ms": entry["mean_ms"]
+        }
+        for key, q in PERCENTILES.items():
+            position = (requests - 1) * q
+            lower = int(position)
+            upper = min(lower + 1, requests - 1)
+            row[key] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        stats.append(row)
+    return stats
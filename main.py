@@ -1,7 +1,14 @@
+import time
+
+_CLI_START = time.perf_counter()
+
 import asyncio
+import atexit
+import json
 import os
+import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import typer
 from rich.console import Console
@@ -9,7 +16,11 @@ from rich.panel import Panel
 from rich.text import Text
 from rich.table import Table
 
-from agent import MultiFlowAgent
+if TYPE_CHECKING:
+    from agent import MultiFlowAgent
+
+# Startup breakdown shown by --timings (agent steps are merged in at exit)
+startup_timings: Dict[str, float] = {"import cli (typer, rich)": time.perf_counter() - _CLI_START}
 
 app = typer.Typer(
     name="multi-flow-agent",
@@ -18,11 +29,60 @@ app = typer.Typer(
 )
 
 console = Console()
+err_console = Console(stderr=True)
 
 # Global agent instance
-agent: Optional[MultiFlowAgent] = None
+agent: Optional["MultiFlowAgent"] = None
+
+@app.callback()
+def main_options(
+    timings: bool = typer.Option(False, "--timings", help="Print a startup time breakdown on exit"),
+    dump_metrics: bool = typer.Option(False, "--dump-metrics", help="Print this process's metrics (Prometheus format) on exit"),
+    record: Optional[str] = typer.Option(None, "--record", help="Record every Serper/Gemini call to this cassette (.ndjson or .ndjson.gz)"),
+    replay: Optional[str] = typer.Option(None, "--replay", help="Answer Serper/Gemini calls from this cassette instead of the network"),
+    replay_speed: float = typer.Option(1.0, "--replay-speed", min=0, help="Replay timing: 1 = recorded latency, 10 = ten times faster, 0 = no delay"),
+):
+    """A production-grade multi-flow AI agent system"""
+    if timings:
+        atexit.register(show_timings)
+    if dump_metrics:
+        atexit.register(show_metrics_dump)
+    if record and replay:
+        raise typer.BadParameter("--record and --replay cannot be combined")
+    if record or replay:
+        # Read by MultiFlowAgent when it is created
+        os.environ["AGENT_CASSETTE"] = record or replay
+        os.environ["AGENT_CASSETTE_MODE"] = "record" if record else "replay"
+        os.environ["AGENT_CASSETTE_SPEED"] = str(replay_speed)
+
+def show_metrics_dump():
+    """Print the in-process metrics registry to stderr"""
+    import metrics
+    sys.stderr.write(metrics.REGISTRY.render())
 
-def initialize_agent():
+def show_timings():
+    """Print where startup time went"""
+    table = Table(title="Startup Timings")
+    table.add_column("Step", style="cyan")
+    table.add_column("Time", style="yellow", justify="right")
+    
+    steps = dict(startup_timings)
+    if agent is not None:
+        steps.update(agent.timings)
+    for step, seconds in steps.items():
+        table.add_row(step, f"{seconds * 1000:.1f} ms")
+    table.add_row("[bold]total wall time[/bold]", f"[bold]{(time.perf_counter() - _CLI_START) * 1000:.1f} ms[/bold]")
+    
+    err_console.print(table)
+
+def load_agent_class() -> type:
+    """Import the agent module on demand (it pulls in config and state models)"""
+    start = time.perf_counter()
+    from agent import MultiFlowAgent
+    startup_timings.setdefault("import agent", time.perf_counter() - start)
+    return MultiFlowAgent
+
+def initialize_agent(quiet: bool = False):
     """Initialize the agent with configuration"""
     global agent
     if agent is None:
@@ -33,17 +93,128 @@ def initialize_agent():
             raise typer.Exit(1)
         
         try:
-            agent = MultiFlowAgent(str(config_path))
-            console.print("[green]✓ Agent initialized successfully[/green]")
+            agent = load_agent_class()(str(config_path))
+            if not quiet:
+                console.print("[green]✓ Agent initialized successfully[/green]")
         except Exception as e:
             console.print(f"[red]Error initializing agent: {e}[/red]")
             raise typer.Exit(1)
 
+async def _with_agent(coro, export_metrics: bool = False, warm: bool = False):
+    """Run a coroutine with the agent's long-lived resources open
+    
+    Long-running commands pass warm=True to build every node up front, so
+    pooled clients are open (and pre-warmed) before the first request.
+    """
+    exporter = await start_metrics_exporter() if export_metrics else None
+    try:
+        if warm:
+            agent.warm()
+        async with agent:
+            return await coro
+    finally:
+        if exporter is not None:
+            exporter.close()
+
+async def start_metrics_exporter(skip_port: Optional[int] = None):
+    """Serve /metrics on METRICS_PORT when ENABLE_METRICS is set (long-running commands only)"""
+    if os.getenv("ENABLE_METRICS", "false").lower() != "true":
+        return None
+    port = int(os.getenv("METRICS_PORT", "8080"))
+    if port == skip_port:
+        return None
+    
+    import metrics
+    host = os.getenv("METRICS_HOST", "127.0.0.1")
+    try:
+        exporter = await metrics.start_exporter(host, port)
+    except OSError as e:
+        err_console.print(f"[yellow]Metrics exporter disabled: cannot bind {host}:{port} ({e.strerror})[/yellow]")
+        return None
+    err_console.print(f"[dim]Metrics on http://{host}:{port}/metrics[/dim]")
+    return exporter
+
+async def stream_to_console(
+    user_input: str, flow: Optional[str], status=None, session_id: Optional[str] = None
+) -> Tuple[Dict[str, Any], bool]:
+    """Render streamed tokens live; returns the final result and whether anything streamed"""
+    streamed = False
+    result: Dict[str, Any] = {}
+    
+    async for event in agent.execute_stream(user_input, flow, session_id):
+        if event["type"] == "token":
+            if not streamed:
+                if status is not None:
+                    status.stop()
+                console.print("🤖 AI Response:", style="bold green")
+                streamed = True
+            console.print(event["text"], end="", markup=False, highlight=False, soft_wrap=True)
+        elif event["type"] == "result":
+            result = event["result"]
+    
+    if streamed:
+        console.print()
+    elif status is not None:
+        status.stop()
+    return result, streamed
+
+def show_stream_summary(result: Dict[str, Any]):
+    """Print flow and streaming speed after a streamed response"""
+    parts = [f"✅ Flow: {result['flow_used']}"]
+    for details in result.get("node_results", {}).values():
+        if details.get("time_to_first_token") is not None:
+            parts.append(f"first token {details['time_to_first_token']:.2f}s")
+            if details.get("tokens_per_second"):
+                parts.append(f"{details['tokens_per_second']:.1f} tokens/s")
+    console.print(" | ".join(parts), style="dim")
+
+def show_fallback_notice(result: Dict[str, Any]):
+    """Say when a result came from a fallback flow because an upstream was down"""
+    fallback = result.get("fallback_from")
+    if fallback:
+        console.print(
+            f"⚠️  Flow '{fallback['flow']}' failed fast ({fallback['error']}); answered with '{result['flow_used']}' instead",
+            style="yellow", highlight=False
+        )
+
+def show_upstreams(upstreams: Dict[str, Dict[str, Any]], target=None):
+    """Table of circuit breaker and limiter state per upstream"""
+    table = Table(title="Upstreams")
+    table.add_column("Upstream", style="cyan")
+    table.add_column("Circuit")
+    table.add_column("Failures", justify="right")
+    table.add_column("Opens", justify="right")
+    table.add_column("Rejected", justify="right")
+    table.add_column("Probe in", justify="right")
+    table.add_column("Limit", style="yellow", justify="right")
+    table.add_column("Waiting", justify="right")
+    
+    styles = {"closed": "green", "half_open": "yellow", "open": "red"}
+    reasons = []
+    for name, upstream in sorted(upstreams.items()):
+        state = upstream["state"]
+        table.add_row(
+            name,
+            f"[{styles.get(state, 'white')}]{state.replace('_', '-')}[/]",
+            f"{upstream['recent_failures']}/{upstream['recent_calls']}",
+            str(upstream["opens"]),
+            str(upstream["rejected"]),
+            f"{upstream['retry_in']:.1f}s" if state == "open" else "-",
+            str(upstream.get("concurrency_limit", "-")),
+            str(upstream.get("waiting", "-"))
+        )
+        if upstream.get("reason"):
+            reasons.append(f"{name}: opened after {upstream['reason']}")
+    (target or console).print(table)
+    for reason in reasons:
+        (target or console).print(reason, style="dim", highlight=False)
+
 @app.command()
 def run(
     input_text: str = typer.Argument(..., help="Input text to process"),
     flow: Optional[str] = typer.Option(None, "--flow", "-f", help="Explicit flow type (search/llm/math)"),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Show detailed execution info"),
+    stream: bool = typer.Option(False, "--stream", "-s", help="Render LLM tokens live as they are generated"),
 ):
     """Run the agent with the given input"""
     initialize_agent()
@@ -54,15 +225,22 @@ def run(
     ))
     
     # Execute agent
-    result = asyncio.run(agent.execute(input_text, flow))
+    if stream:
+        result, streamed = asyncio.run(_with_agent(stream_to_console(input_text, flow)))
+    else:
+        result, streamed = asyncio.run(_with_agent(agent.execute(input_text, flow))), False
     
     # Display results
+    show_fallback_notice(result)
     if result["success"]:
-        console.print(Panel(
-            result["output"],
-            title=f"✅ Result (Flow: {result['flow_used']})",
-            border_style="green"
-        ))
+        if streamed:
+            show_stream_summary(result)
+        else:
+            console.print(Panel(
+                result["output"],
+                title=f"✅ Result (Flow: {result['flow_used']})",
+                border_style="green"
+            ))
         
         if verbose:
             # Show execution details
@@ -71,9 +249,24 @@ def run(
             table.add_column("Value", style="white")
             
             table.add_row("Flow Used", result["flow_used"])
+            table.add_row("Flow ID", f"{result.get('flow_id', '-')} (main.py trace <id>)")
             table.add_row("Total Execution Time", f"{result.get('execution_time', 0):.3f}s")
             table.add_row("Nodes Executed", str(len(result.get('node_results', {}))))
             
+            for name, details in result.get("node_results", {}).items():
+                if details.get("time_to_first_token") is not None:
+                    table.add_row(f"Time to First Token ({name})", f"{details['time_to_first_token']:.3f}s")
+                    if details.get("tokens_per_second"):
+                        table.add_row(f"Tokens/sec ({name})", f"{details['tokens_per_second']:.1f}")
+            
+            cache_stats = result.get("cache_stats")
+            if cache_stats:
+                table.add_row(
+                    "Cache Hits / Misses / Evictions",
+                    f"{cache_stats['hits']} ({cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk)"
+                    f" / {cache_stats['misses']} / {cache_stats['evictions']}"
+                )
+            
             console.print(table)
             
             # Show node results
@@ -82,10 +275,12 @@ def run(
                 node_table.add_column("Node", style="cyan")
                 node_table.add_column("Status", style="white")
                 node_table.add_column("Time", style="yellow")
+                node_table.add_column("Cache", style="magenta")
                 
+                cache_status = result.get("cache_status", {})
                 for name, details in result["node_results"].items():
                     status = "✅ Success" if details["success"] else f"❌ Error: {details.get('error', 'Unknown')}"
-                    node_table.add_row(name, status, f"{details['execution_time']:.3f}s")
+                    node_table.add_row(name, status, f"{details['execution_time']:.3f}s", cache_status.get(name, "-"))
                 
                 console.print(node_table)
     else:
@@ -95,27 +290,63 @@ def run(
             border_style="red"
         ))
 
+async def read_line() -> str:
+    """Read a line from stdin without blocking the event loop, so background work such as session summaries keeps running"""
+    import threading
+    
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+    
+    def read():
+        try:
+            text = input()
+        except BaseException as e:
+            # Bind e now: the name is cleared when the except block ends
+            loop.call_soon_threadsafe(lambda error=e: line.done() or line.set_exception(error))
+        else:
+            loop.call_soon_threadsafe(lambda: line.done() or line.set_result(text))
+    
+    # A daemon thread, so a prompt left waiting never holds up exit
+    threading.Thread(target=read, daemon=True).start()
+    return await line
+
+def show_memory(memory: Dict[str, Any], session_id: str):
+    """Print what the session remembers"""
+    console.print(Panel(
+        (f"[bold]Summary[/bold] ({memory['folded']} earlier turns)\n{memory['summary']}\n\n" if memory["summary"] else "")
+        + f"[bold]Recent turns kept verbatim:[/bold] {len(memory['turns'])}",
+        title=f"🧠 Session {session_id}"
+    ))
+
 @app.command()
-def interactive():
+def interactive(
+    stream: bool = typer.Option(False, "--stream", "-s", help="Render LLM tokens live as they are generated"),
+    session: Optional[str] = typer.Option(None, "--session", help="Resume the session with this ID"),
+    memory: bool = typer.Option(True, "--memory/--no-memory", help="Give each request the conversation so far"),
+):
     """Run the agent in interactive mode"""
     initialize_agent()
     
     console.print(Panel(
         "[bold green]Multi-Flow AI Agent - Interactive Mode[/bold green]\n"
-        "Available flows: search, llm, math\n"
+        f"Available flows: {', '.join(agent.flows)}\n"
         "Type 'help' for commands, 'quit' to exit",
         title="Interactive Mode"
     ))
     
     async def run_interactive():
         """Async interactive loop"""
-        import sys
+        session_id = (session or agent.sessions.new_id()) if memory else None
+        if session_id is not None:
+            remembered = await agent.sessions.load(session_id)
+            turns = remembered["folded"] + len(remembered["turns"])
+            resumed = f", resumed after {turns} turns" if turns else ""
+            console.print(f"[dim]Session {session_id}{resumed}[/dim]")
         
         while True:
             try:
-                # Use standard input instead of typer.prompt for better async compatibility
                 console.print("\n🤖 Enter your request: ", end="")
-                user_input = input().strip()
+                user_input = (await read_line()).strip()
                 
                 if user_input.lower() in ['quit', 'exit', 'q']:
                     console.print("[yellow]Goodbye![/yellow]")
@@ -123,6 +354,15 @@ def interactive():
                 elif user_input.lower() == 'help':
                     show_help()
                     continue
+                elif user_input.lower() == 'status':
+                    show_upstreams(agent.upstream_status())
+                    continue
+                elif user_input.lower() == 'memory':
+                    if session_id is None:
+                        console.print("[yellow]Session memory is off (--no-memory)[/yellow]")
+                    else:
+                        show_memory(await agent.sessions.load(session_id), session_id)
+                    continue
                 elif user_input.lower().startswith('flow:'):
                     # Parse explicit flow specification
                     parts = user_input.split(':', 1)
@@ -137,11 +377,20 @@ def interactive():
                     actual_input = user_input
                 
                 # Execute request
-                with console.status("[bold green]Processing..."):
-                    result = await agent.execute(actual_input, flow_type)
+                streamed = False
+                if stream:
+                    status = console.status("[bold green]Processing...")
+                    status.start()
+                    result, streamed = await stream_to_console(actual_input, flow_type, status, session_id)
+                else:
+                    with console.status("[bold green]Processing..."):
+                        result = await agent.execute(actual_input, flow_type, session_id)
                 
                 # Display result
-                if result["success"]:
+                show_fallback_notice(result)
+                if result["success"] and streamed:
+                    show_stream_summary(result)
+                elif result["success"]:
                     console.print(Panel(
                         result["output"],
                         title=f"✅ Result (Flow: {result['flow_used']})",
@@ -154,26 +403,30 @@ def interactive():
                         border_style="red"
                     ))
                     
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
                 console.print("\n[yellow]Goodbye![/yellow]")
                 break
             except Exception as e:
                 console.print(f"[red]Error: {e}[/red]")
+        
+        if session_id is not None:
+            console.print(f"[dim]Resume this conversation with: python main.py interactive --session {session_id}[/dim]")
     
     # Run the async interactive loop
-    asyncio.run(run_interactive())
+    asyncio.run(_with_agent(run_interactive(), export_metrics=True, warm=True))
 
 def show_help():
     """Show help information"""
-    help_text = """
+    flow_types = "\n".join(f"• {name} - {config.get('description', '')}" for name, config in agent.flows.items())
+    help_text = f"""
 [bold cyan]Available Commands:[/bold cyan]
 • help - Show this help message
+• status - Show upstream circuit breaker and limiter state
+• memory - Show what this session remembers (summary and recent turns)
 • quit/exit/q - Exit interactive mode
 
 [bold cyan]Flow Types:[/bold cyan]
-• search - Web search using Serper API
-• llm - Chat with Google Gemini
-• math - Mathematical calculations
+{flow_types}
 
 [bold cyan]Usage Examples:[/bold cyan]
 • "search for latest AI news"
@@ -220,7 +473,7 @@ def validate_config():
         raise typer.Exit(1)
     
     try:
-        agent = MultiFlowAgent(str(config_path))
+        agent = load_agent_class()(str(config_path))
         console.print("[green]✅ Configuration is valid[/green]")
         
         # Show summary
@@ -228,9 +481,14 @@ def validate_config():
         table.add_column("Property", style="cyan")
         table.add_column("Value", style="white")
         
+        node_types = {
+            node_config["type"]
+            for flow_config in agent.flows.values()
+            for node_config in flow_config["nodes"]
+        }
         table.add_row("Flows", str(len(agent.flows)))
-        table.add_row("Nodes Initialized", str(len(agent.nodes)))
-        table.add_row("Graphs Built", str(len(agent.graphs)))
+        table.add_row("Node Types Used", ", ".join(sorted(node_types)))
+        table.add_row("Routing Patterns", str(agent.router.pattern_count))
         
         console.print(table)
         
@@ -332,7 +590,575 @@ def test(
                     console.print(f"[red]❌ Failed: {str(e)}[/red]")
     
     # Run all tests in a single event loop
-    asyncio.run(run_tests())
+    asyncio.run(_with_agent(run_tests()))
+
+def _parse_batch_line(line: str, default_flow: Optional[str]) -> Tuple[Optional[str], str, Optional[str]]:
+    """Parse one JSONL batch line into (id, input, flow)"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError:
+        # Plain text lines are treated as bare inputs
+        return None, line, default_flow
+
+    if isinstance(request, str):
+        return None, request, default_flow
+    if not isinstance(request, dict):
+        # Lines such as 42, true or null are plain text that happens to parse as JSON
+        return None, line, default_flow
+    if not isinstance(request.get("input"), str):
+        raise ValueError("Batch request object must have an 'input' field")
+
+    return request.get("id"), request["input"], request.get("flow") or default_flow
+
+@app.command()
+def batch(
+    input_file: str = typer.Option("-", "--input", "-i", help="JSONL file with requests ('-' for stdin)"),
+    output_file: str = typer.Option("-", "--output", "-o", help="JSONL file for results ('-' for stdout)"),
+    concurrency: int = typer.Option(16, "--concurrency", "-c", min=1, help="Maximum number of requests in flight"),
+    ordered: bool = typer.Option(False, "--ordered/--unordered", help="Emit results in input order instead of completion order"),
+    flow: Optional[str] = typer.Option(None, "--flow", "-f", help="Default flow for requests that do not specify one"),
+):
+    """Run many requests concurrently from a JSONL file or stdin"""
+    from state import json_default
+    initialize_agent(quiet=True)
+
+    if input_file != "-" and not Path(input_file).exists():
+        err_console.print(f"[red]Input file not found: {input_file}[/red]")
+        raise typer.Exit(1)
+
+    source = sys.stdin if input_file == "-" else open(input_file, "r", encoding="utf-8")
+    sink = sys.stdout if output_file == "-" else open(output_file, "w", encoding="utf-8")
+
+    stats = {"total": 0, "succeeded": 0, "failed": 0}
+
+    async def run_batch():
+        """Feed requests to a bounded pool of workers sharing one event loop"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        pending: Dict[int, str] = {}
+        next_index = 0
+
+        def emit(index: int, record: Dict[str, Any]):
+            """Write a result line, buffering out-of-order results when ordered"""
+            nonlocal next_index
+            line = json.dumps(record, default=json_default, ensure_ascii=False)
+
+            if not ordered:
+                sink.write(line + "\n")
+                sink.flush()
+                return
+
+            pending[index] = line
+            while next_index in pending:
+                sink.write(pending.pop(next_index) + "\n")
+                next_index += 1
+            sink.flush()
+
+        async def worker():
+            """Execute queued requests until the producer signals completion"""
+            while True:
+                item = await queue.get()
+                if item is None:
+                    queue.task_done()
+                    return
+
+                index, line = item
+                try:
+                    request_id, user_input, request_flow = _parse_batch_line(line, flow)
+                    result = await agent.execute(user_input, request_flow)
+                except Exception as e:
+                    request_id = None
+                    result = {
+                        "success": False,
+                        "output": f"Invalid batch request: {str(e)}",
+                        "error": str(e),
+                        "flow_used": "unknown"
+                    }
+
+                stats["succeeded" if result.get("success") else "failed"] += 1
+                emit(index, {"index": index, "id": request_id, **result})
+                queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+        # Read lazily so huge inputs never sit fully in memory
+        index = 0
+        while True:
+            line = await asyncio.to_thread(source.readline)
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            await queue.put((index, line))
+            index += 1
+        stats["total"] = index
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    start_time = time.perf_counter()
+    try:
+        asyncio.run(_with_agent(run_batch(), export_metrics=True, warm=True))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    elapsed = time.perf_counter() - start_time
+
+    upstream_status = agent.upstream_status()
+    if any(upstream["opens"] or upstream["state"] != "closed" for upstream in upstream_status.values()):
+        show_upstreams(upstream_status, err_console)
+
+    throughput = stats["total"] / elapsed if elapsed > 0 else 0.0
+    err_console.print(
+        f"[green]✅ Processed {stats['total']} requests[/green] "
+        f"({stats['succeeded']} succeeded, {stats['failed']} failed) "
+        f"in {elapsed:.2f}s - {throughput:.1f} req/s"
+    )
+
+@app.command()
+def serve(
+    host: str = typer.Option(os.getenv("AGENT_SERVER_HOST", "127.0.0.1"), "--host", help="Interface to bind the HTTP listener to"),
+    port: int = typer.Option(int(os.getenv("AGENT_SERVER_PORT", "8080")), "--port", "-p", help="HTTP port (0 disables TCP)"),
+    socket_path: Optional[str] = typer.Option(os.getenv("AGENT_SERVER_SOCKET"), "--socket", help="Also listen on this Unix domain socket"),
+    concurrency: int = typer.Option(64, "--concurrency", "-c", min=1, help="Maximum number of requests executing at once"),
+    warm: bool = typer.Option(True, "--warm/--no-warm", help="Compile graphs and build nodes before accepting requests"),
+):
+    """Keep a warm agent in memory and serve requests over HTTP"""
+    initialize_agent()
+    from server import AgentServer
+    
+    server = AgentServer(
+        agent,
+        host=host,
+        port=port or None,
+        socket_path=socket_path,
+        max_concurrency=concurrency,
+        log=lambda message: console.print(f"[dim]{message}[/dim]")
+    )
+    
+    async def run_server():
+        # /metrics is always served on the agent port; a separate exporter only when configured elsewhere
+        exporter = await start_metrics_exporter(skip_port=port)
+        try:
+            await server.run(warm=warm)
+        finally:
+            if exporter is not None:
+                exporter.close()
+    
+    try:
+        asyncio.run(run_server())
+    except (OSError, ValueError) as e:
+        console.print(f"[red]Error starting server: {e}[/red]")
+        raise typer.Exit(1)
+    
+    console.print(f"[green]✅ Served {server.requests} requests ({server.failures} failed)[/green]")
+
+@app.command("metrics")
+def show_metrics(
+    url: Optional[str] = typer.Option(None, "--url", help="Metrics endpoint (default: http://127.0.0.1:$METRICS_PORT/metrics)"),
+    raw: bool = typer.Option(False, "--raw", help="Print the Prometheus text instead of a latency summary"),
+):
+    """Fetch metrics from a running agent and summarize latency percentiles"""
+    import urllib.request
+    import metrics
+    
+    url = url or f"http://127.0.0.1:{os.getenv('METRICS_PORT', '8080')}/metrics"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            text = response.read().decode("utf-8")
+    except OSError as e:
+        console.print(f"[red]Could not fetch metrics from {url}: {e}[/red]")
+        console.print("Start a long-running agent with ENABLE_METRICS=true (or `main.py serve`) first.")
+        raise typer.Exit(1)
+    
+    if raw:
+        console.print(text, markup=False, highlight=False, end="")
+        return
+    
+    table = Table(title=f"Latency ({url})")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Labels")
+    table.add_column("Count", justify="right")
+    for column in ("Mean", "p50", "p95", "p99"):
+        table.add_column(column, style="yellow", justify="right")
+    
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+    
+    for row in metrics.summarize(text):
+        labels = ",".join(f"{k}={v}" for k, v in row["labels"].items())
+        table.add_row(
+            row["metric"].replace("agent_", "").replace("_seconds", ""),
+            labels, str(row["count"]), ms(row["mean"]), ms(row["p50"]), ms(row["p95"]), ms(row["p99"])
+        )
+    console.print(table)
+    
+    counters = [
+        line for line in text.splitlines()
+        if line.startswith(("agent_flow_requests_total", "agent_upstream_responses_total", "agent_upstream_circuit_state", "agent_upstream_rejected_total"))
+    ]
+    if counters:
+        console.print("\n".join(counters), markup=False, highlight=False)
+
+@app.command()
+def upstreams(
+    url: Optional[str] = typer.Option(None, "--url", help="Health endpoint of a running server (default: http://127.0.0.1:$AGENT_SERVER_PORT/healthz)"),
+):
+    """Show circuit breaker and limiter state of a running server's upstreams"""
+    import urllib.request
+    
+    url = url or f"http://127.0.0.1:{os.getenv('AGENT_SERVER_PORT', '8080')}/healthz"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            health = json.loads(response.read().decode("utf-8"))
+    except (OSError, ValueError) as e:
+        console.print(f"[red]Could not fetch health from {url}: {e}[/red]")
+        console.print("Start the agent with `main.py serve` first (interactive mode shows the same table with 'status').")
+        raise typer.Exit(1)
+    
+    if not health.get("upstreams"):
+        console.print("[yellow]No upstream has been called yet[/yellow]")
+        return
+    show_upstreams(health["upstreams"])
+    if health.get("status") == "degraded":
+        raise typer.Exit(2)
+
+@app.command()
+def trace(
+    flow_id: Optional[str] = typer.Argument(None, help="Flow id (or a unique prefix); defaults to the most recent request"),
+    trace_file: str = typer.Option(os.getenv("AGENT_TRACE_FILE", "data/traces.ndjson"), "--file", help="NDJSON trace file"),
+    attributes: bool = typer.Option(False, "--attributes", "-a", help="Show span attributes"),
+):
+    """Show a request's spans as a waterfall"""
+    import tracing
+    
+    flow_id = flow_id or tracing.last_trace_id(trace_file)
+    if not flow_id:
+        console.print(f"[yellow]No traces recorded in {trace_file}[/yellow]")
+        raise typer.Exit(1)
+    
+    try:
+        spans = tracing.load_trace(trace_file, flow_id)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    if not spans:
+        console.print(f"[red]No trace found for flow id {flow_id}[/red]")
+        raise typer.Exit(1)
+    
+    # Depth-first order so children sit under their parent
+    children: Dict[Optional[str], list] = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+    ordered = []
+    def visit(parent_id: Optional[str], depth: int):
+        for span in children.get(parent_id, []):
+            ordered.append((depth, span))
+            visit(span["span_id"], depth + 1)
+    visit(None, 0)
+    
+    total = max(span["start_ms"] + span["duration_ms"] for span in spans) or 1.0
+    width = 30
+    
+    table = Table(title=f"Trace {spans[0]['trace_id']}")
+    table.add_column("Span", style="cyan", no_wrap=True)
+    table.add_column("Start", justify="right", no_wrap=True)
+    table.add_column("Duration", style="yellow", justify="right", no_wrap=True)
+    table.add_column("Timeline", no_wrap=True)
+    
+    for depth, span in ordered:
+        offset = min(int(span["start_ms"] / total * width), width - 1)
+        length = max(1, int(round(span["duration_ms"] / total * width)))
+        color = "red" if span["status"] == "error" else "green"
+        bar = " " * offset + f"[{color}]" + "█" * min(length, width - offset) + f"[/{color}]"
+        table.add_row(
+            "  " * depth + span["name"],
+            f"{span['start_ms']:.1f} ms",
+            f"{span['duration_ms']:.1f} ms",
+            bar
+        )
+    
+    console.print(table)
+    
+    if attributes:
+        for depth, span in ordered:
+            if span["attributes"]:
+                details = ", ".join(f"{k}={v}" for k, v in span["attributes"].items())
+                console.print(f"[cyan]{span['name']}[/cyan]: {details}", highlight=False)
+
+def _history_file(path: str) -> str:
+    """The history database, exiting when nothing has been recorded yet"""
+    if not Path(path).exists():
+        console.print(f"[yellow]No history recorded in {path} (set AGENT_HISTORY=true and run some requests)[/yellow]")
+        raise typer.Exit(1)
+    return path
+
+@app.command("history")
+def show_history(
+    limit: int = typer.Option(20, "--limit", "-n", min=1, help="Number of executions to show"),
+    flow: Optional[str] = typer.Option(None, "--flow", "-f", help="Only this flow"),
+    errors: bool = typer.Option(False, "--errors", help="Only failed executions"),
+    since: Optional[str] = typer.Option(None, "--since", help="Only executions in this period, e.g. 6h or 7d"),
+    nodes: bool = typer.Option(False, "--nodes", help="Show per-node timings and cache status"),
+    history_file: str = typer.Option(os.getenv("AGENT_HISTORY_FILE", "data/history.sqlite3"), "--file", help="History database"),
+):
+    """List recent executions from the history store"""
+    import history
+    
+    try:
+        start = time.time() - history.parse_duration(since) if since else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    rows = history.recent(_history_file(history_file), limit=limit, flow=flow, errors_only=errors, since=start)
+    if not rows:
+        console.print("[yellow]No matching executions[/yellow]")
+        return
+    
+    table = Table(title=f"Execution History ({history_file})")
+    table.add_column("Time", style="dim", no_wrap=True, min_width=14)
+    table.add_column("Flow ID", style="dim", no_wrap=True, min_width=8)
+    table.add_column("Flow", style="cyan", no_wrap=True, min_width=6)
+    table.add_column("ms", style="yellow", justify="right", no_wrap=True, min_width=7)
+    table.add_column("Input", overflow="ellipsis", no_wrap=True)
+    table.add_column("Result", overflow="ellipsis", no_wrap=True)
+    for row in rows:
+        table.add_row(
+            time.strftime("%m-%d %H:%M:%S", time.localtime(row["started_at"])),
+            row["flow_id"][:8], row["flow"], f"{row['duration_ms']:.1f}", row["input"],
+            "✅" if row["success"] else f"[red]❌ {row['error'] or ''}[/red]"
+        )
+        if nodes:
+            for node in row["nodes"]:
+                result = "✅" if node["success"] else f"[red]❌ {node['error'] or ''}[/red]"
+                cache = f" [magenta]{node['cache_status']}[/magenta]" if node["cache_status"] else ""
+                table.add_row("", "", f"  {node['node']}", f"{node['duration_ms']:.2f}", "", result + cache)
+    console.print(table)
+
+@app.command("stats")
+def show_stats(
+    window: str = typer.Option("1h", "--window", "-w", help="Window length, e.g. 15m, 1h, 1d"),
+    since: str = typer.Option("24h", "--since", help="How far back to look, e.g. 24h or 7d"),
+    flow: Optional[str] = typer.Option(None, "--flow", "-f", help="Only this flow"),
+    nodes: bool = typer.Option(False, "--nodes", help="Break down by node instead of by flow"),
+    history_file: str = typer.Option(os.getenv("AGENT_HISTORY_FILE", "data/history.sqlite3"), "--file", help="History database"),
+):
+    """Latency percentiles and error rates per time window from the history store"""
+    import history
+    
+    try:
+        window_seconds = history.parse_duration(window)
+        start = time.time() - history.parse_duration(since)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    stats = history.window_stats(_history_file(history_file), window_seconds, start, flow=flow, by_node=nodes)
+    if not stats:
+        console.print(f"[yellow]No executions in the last {since}[/yellow]")
+        return
+    
+    table = Table(title=f"Execution Stats per {window} (last {since})")
+    table.add_column("Window", style="dim", no_wrap=True)
+    table.add_column("Flow / Node" if nodes else "Flow", style="cyan", no_wrap=True)
+    table.add_column("Requests", justify="right", min_width=5)
+    table.add_column("Errors", justify="right", min_width=6)
+    for column in ("Mean ms", "p50 ms", "p95 ms", "p99 ms"):
+        table.add_column(column, style="yellow", justify="right", no_wrap=True)
+    
+    day_or_more = window_seconds >= 86400
+    for row in stats:
+        started = time.strftime("%Y-%m-%d" if day_or_more else "%m-%d %H:%M", time.localtime(row["window_start"]))
+        error_rate = f"{row['error_rate']:.1%}"
+        table.add_row(
+            started, row["name"], str(row["requests"]),
+            f"[red]{error_rate}[/red]" if row["errors"] else error_rate,
+            *(f"{row[key]:.1f}" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms"))
+        )
+    console.print(table)
+
+@app.command("replay")
+def replay_traffic(
+    cassette_path: str = typer.Argument(..., help="Cassette recorded with --record"),
+    speed: float = typer.Option(1.0, "--speed", min=0, help="1 = recorded arrival times and latencies, 10 = ten times faster, 0 = as fast as possible"),
+    concurrency: int = typer.Option(0, "--concurrency", "-c", min=0, help="Cap on requests in flight (0 = as recorded)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the result and semantic caches so every request reaches the cassette"),
+):
+    """Re-run recorded traffic with upstream responses served from a cassette"""
+    os.environ["AGENT_CASSETTE"] = cassette_path
+    os.environ["AGENT_CASSETTE_MODE"] = "replay"
+    os.environ["AGENT_CASSETTE_SPEED"] = str(speed)
+    initialize_agent(quiet=True)
+    from benchmarks.suite import summarize
+    
+    cassette = agent.cassette
+    if not cassette.requests:
+        console.print(f"[yellow]{cassette_path} holds no recorded requests[/yellow]")
+        raise typer.Exit(1)
+    if no_cache:
+        agent.cache.ttls = {}
+    
+    console.print(f"[dim]Replaying {len(cassette.requests)} requests at {'full speed' if speed == 0 else f'{speed:g}x'}...[/dim]")
+    
+    async def run_replay():
+        if no_cache and "LLMNode" in agent.nodes:
+            agent.nodes["LLMNode"].semantic_cache = None
+        limit = asyncio.Semaphore(concurrency) if concurrency else None
+        start = time.perf_counter()
+        
+        async def one(request: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+            if speed > 0:
+                await asyncio.sleep(max(0.0, request["start"] / speed - (time.perf_counter() - start)))
+            if limit is not None:
+                await limit.acquire()
+            try:
+                began = time.perf_counter()
+                result = await agent.execute(request["input"], request.get("flow"))
+                return result, (time.perf_counter() - began) * 1000
+            finally:
+                if limit is not None:
+                    limit.release()
+        
+        outcomes = await asyncio.gather(*(one(request) for request in cassette.requests))
+        return outcomes, time.perf_counter() - start
+    
+    # Measure a warm agent, as production traffic would see it
+    outcomes, elapsed = asyncio.run(_with_agent(run_replay(), warm=True))
+    
+    table = Table(title=f"Replay of {cassette_path} (ms)")
+    table.add_column("Flow", style="cyan")
+    table.add_column("Requests", justify="right")
+    table.add_column("Errors", justify="right")
+    for column in ("Mean", "p50", "p95", "p99"):
+        table.add_column(column, style="yellow", justify="right")
+    
+    by_flow: Dict[str, list] = {}
+    for result, duration in outcomes:
+        by_flow.setdefault(result.get("flow_used") or "unknown", []).append((result, duration))
+    for flow, rows in sorted(by_flow.items()):
+        stats = summarize([duration for _, duration in rows])
+        errors = sum(1 for result, _ in rows if not result.get("success"))
+        table.add_row(flow, str(len(rows)), str(errors), *(f"{stats[key]:.1f}" for key in ("mean", "p50", "p95", "p99")))
+    console.print(table)
+    
+    stats = cassette.stats()
+    console.print(
+        f"[green]✅ {len(outcomes)} requests in {elapsed:.2f}s; {stats['replayed']} upstream calls replayed, "
+        f"{stats['misses']} not found in the cassette[/green]"
+    )
+
+@app.command()
+def bench(
+    flows: Optional[List[str]] = typer.Option(None, "--flow", "-f", help="Flow to benchmark (repeatable; default: every flow in flows.yaml)"),
+    requests: int = typer.Option(100, "--requests", "-n", min=1, help="Measured requests per flow"),
+    concurrency: int = typer.Option(10, "--concurrency", "-c", min=1, help="Requests in flight at once"),
+    warmup: int = typer.Option(5, "--warmup", min=0, help="Unmeasured requests per flow before timing starts"),
+    search_latency: str = typer.Option("lognormal:80,0.4", "--search-latency", help="Fake Serper latency in ms (fixed:N, uniform:A,B, normal:MEAN,SD, lognormal:MEDIAN,SIGMA)"),
+    search_payload: str = typer.Option("lognormal:160,0.5", "--search-payload", help="Fake Serper snippet size in characters (same spec format)"),
+    llm_latency: str = typer.Option("lognormal:400,0.5", "--llm-latency", help="Fake Gemini time to first token in ms"),
+    llm_payload: str = typer.Option("lognormal:120,0.6", "--llm-payload", help="Fake Gemini response length in words"),
+    page_latency: str = typer.Option("lognormal:150,0.5", "--page-latency", help="Fake result page time to first byte in ms (read flow)"),
+    page_size: str = typer.Option("lognormal:60000,0.6", "--page-size", help="Fake result page size in bytes (read flow)"),
+    stream: bool = typer.Option(False, "--stream", "-s", help="Drive flows through the streaming API"),
+    error_rate: float = typer.Option(0.0, "--error-rate", min=0, max=1, help="Fraction of fake upstream calls that fail with 503"),
+    capacity: Optional[int] = typer.Option(None, "--upstream-capacity", min=1, help="Fake upstreams answer 429 beyond this many concurrent calls"),
+    seed: int = typer.Option(42, "--seed", help="Random seed for the fake upstreams"),
+    output: str = typer.Option("data/bench/latest.json", "--output", "-o", help="Where to write the JSON results"),
+    compare_to: Optional[str] = typer.Option(None, "--compare", help="Previous result file to check for regressions"),
+    threshold: float = typer.Option(0.1, "--threshold", help="Relative slowdown that counts as a regression"),
+):
+    """Benchmark every flow end-to-end against in-process fake upstreams"""
+    initialize_agent(quiet=True)
+    from benchmarks import suite
+    
+    try:
+        previous = suite.load_result(compare_to) if compare_to else None
+        runner = suite.BenchmarkSuite(
+            agent,
+            requests=requests,
+            concurrency=concurrency,
+            warmup=warmup,
+            search_latency=search_latency,
+            search_payload=search_payload,
+            llm_latency=llm_latency,
+            llm_payload=llm_payload,
+            page_latency=page_latency,
+            page_size=page_size,
+            stream=stream,
+            error_rate=error_rate,
+            capacity=capacity,
+            seed=seed
+        )
+    except (OSError, ValueError) as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    
+    def progress(flow: str):
+        console.print(f"[dim]Benchmarking {flow}: {requests} requests at concurrency {concurrency}...[/dim]")
+    
+    try:
+        result = asyncio.run(runner.run(flows, progress))
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    suite.write_result(output, result)
+    
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.2f}"
+    
+    table = Table(title="Flow Benchmark (ms)")
+    table.add_column("Flow", style="cyan")
+    table.add_column("Req/s", style="green", justify="right")
+    table.add_column("Errors", justify="right")
+    for column in ("p50", "p95", "p99"):
+        table.add_column(column, style="yellow", justify="right")
+    table.add_column("Overhead p50", style="magenta", justify="right")
+    table.add_column("Overhead p99", style="magenta", justify="right")
+    for flow, stats in result["flows"].items():
+        latency, overhead = stats["latency_ms"], stats["overhead_ms"]
+        table.add_row(
+            flow, f"{stats['throughput_rps']:.1f}", str(stats["errors"]),
+            ms(latency["p50"]), ms(latency["p95"]), ms(latency["p99"]), ms(overhead["p50"]), ms(overhead["p99"])
+        )
+    console.print(table)
+    
+    nodes = Table(title="Per-Node Time (ms, overhead excludes upstream calls)")
+    nodes.add_column("Flow", style="cyan")
+    nodes.add_column("Node")
+    nodes.add_column("p50", style="yellow", justify="right")
+    nodes.add_column("Overhead p50", style="magenta", justify="right")
+    nodes.add_column("Overhead p95", style="magenta", justify="right")
+    for flow, stats in result["flows"].items():
+        for node, node_stats in stats["nodes"].items():
+            nodes.add_row(flow, node, ms(node_stats["latency_ms"]["p50"]), ms(node_stats["overhead_ms"]["p50"]), ms(node_stats["overhead_ms"]["p95"]))
+    console.print(nodes)
+    
+    for flow, stats in result["flows"].items():
+        if stats["first_error"]:
+            console.print(f"[red]{flow}: {stats['errors']} failed, e.g. {stats['first_error']}[/red]")
+    console.print(f"[green]✅ Results written to {output}[/green]")
+    
+    if previous is None:
+        return
+    regressions = suite.compare(previous, result, threshold=threshold)
+    if not regressions:
+        console.print(f"[green]No regressions beyond {threshold:.0%} against {compare_to}[/green]")
+        return
+    
+    table = Table(title=f"Regressions against {compare_to}")
+    table.add_column("Flow", style="cyan")
+    table.add_column("Metric")
+    table.add_column("Before", justify="right")
+    table.add_column("After", justify="right")
+    table.add_column("Change", style="red", justify="right")
+    for regression in regressions:
+        change = regression["change"]
+        table.add_row(
+            regression["flow"], regression["metric"], str(regression["before"]), str(regression["after"]),
+            "-" if change is None else f"{change:+.0%}"
+        )
+    console.print(table)
+    raise typer.Exit(1)
 
 @app.command()
 def visualize(
@@ -361,23 +1187,32 @@ def visualize(
             # Create a directed graph
             G = nx.DiGraph()
             
-            # Add nodes from flow configuration
+            # Add nodes from flow configuration, one level per step (parallel branches share a level)
+            from flowgraph import FlowPlan
+            plan = FlowPlan(flow_name, flow_config)
+            levels_by_node = {name: 0 for name in plan.entry}
+            for _ in plan.order:  # enough passes to settle the longest path
+                for node_name in plan.order:
+                    for successor in plan.successors[node_name]:
+                        levels_by_node[successor] = max(levels_by_node.get(successor, 0), levels_by_node.get(node_name, 0) + 1)
+            
             nodes = flow_config.get("nodes", [])
-            for i, node_config in enumerate(nodes):
+            for node_config in nodes:
                 node_name = node_config["name"]
                 node_type = node_config["type"]
-                G.add_node(node_name, type=node_type, order=i)
+                G.add_node(node_name, type=node_type, order=levels_by_node.get(node_name, 0))
             
             # Add edges from flow configuration
             for node_config in nodes:
                 node_name = node_config["name"]
-                next_node = node_config.get("next")
-                if next_node:
-                    G.add_edge(node_name, next_node)
+                next_nodes = plan.successors[node_name]
+                if next_nodes:
+                    for next_node in next_nodes:
+                        G.add_edge(node_name, next_node)
                 else:
                     # Add END node if not exists
                     if "END" not in G.nodes():
-                        G.add_node("END", type="end", order=len(nodes))
+                        G.add_node("END", type="end", order=max(levels_by_node.values()) + 1)
                     G.add_edge(node_name, "END")
             
             # Create the visualization
@@ -407,6 +1242,7 @@ def visualize(
                 "LLMNode": "#4ECDC4",     # Teal
                 "MathNode": "#45B7D1",    # Blue
                 "OutputNode": "#96CEB4",  # Green
+                "ReaderNode": "#F4A261",  # Orange
                 "end": "#DDA0DD"          # Purple
             }
             
@@ -0,0 +1,308 @@
+import asyncio
+import bisect
+import math
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import tracing
+
+# Latency buckets in seconds, from cache hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Base class for a labelled metric family"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        self.values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels: Any) -> Iterator[None]:
+        """Count the enclosed block as in flight"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last is +Inf), sum, count]
+        self.values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def quantile(self, q: float, **labels: Any) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within buckets (as PromQL does)"""
+        entry = self.values.get(self._key(labels))
+        if entry is None or entry[2] == 0:
+            return None
+        return bucket_quantile(q, self.buckets, entry[0])
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def bucket_quantile(q: float, buckets: Tuple[float, ...], counts: List[int]) -> Optional[float]:
+    """Quantile from non-cumulative bucket counts (last count is the +Inf bucket)"""
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets + (math.inf,), counts):
+        if count and cumulative + count >= rank:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound if bound != math.inf else lower
+    return lower
+
+class Registry:
+    """Collection of metric families rendered together"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Run a callback before each render, e.g. to copy stats into gauges"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format (0.0.4)"""
+        for collector in self.collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+FLOW_LATENCY = REGISTRY.histogram("agent_flow_duration_seconds", "End-to-end flow execution time", ("flow",))
+FLOW_REQUESTS = REGISTRY.counter("agent_flow_requests_total", "Flow executions by outcome", ("flow", "status"))
+FLOWS_IN_FLIGHT = REGISTRY.gauge("agent_flows_in_flight", "Flow executions currently running", ("flow",))
+
+NODE_LATENCY = REGISTRY.histogram("agent_node_duration_seconds", "Node execution time (including cache lookups)", ("flow", "node"))
+NODE_EXECUTIONS = REGISTRY.counter("agent_node_executions_total", "Node executions by outcome", ("flow", "node", "status"))
+NODES_IN_FLIGHT = REGISTRY.gauge("agent_nodes_in_flight", "Node executions currently running", ("flow", "node"))
+
+UPSTREAM_LATENCY = REGISTRY.histogram("agent_upstream_duration_seconds", "Upstream API call time", ("upstream",))
+UPSTREAM_RESPONSES = REGISTRY.counter("agent_upstream_responses_total", "Upstream API responses by HTTP status ('error' when no response)", ("upstream", "status"))
+UPSTREAM_RETRIES = REGISTRY.counter("agent_upstream_retries_total", "Upstream calls retried, by the status that triggered the retry", ("upstream", "status"))
+UPSTREAM_HEDGES = REGISTRY.counter("agent_upstream_hedges_total", "Hedged upstream requests ('sent', and 'won' when the hedge answered first)", ("upstream", "outcome"))
+UPSTREAM_THROTTLE = REGISTRY.histogram("agent_upstream_throttle_seconds", "Time upstream calls waited for the rate or concurrency limiter", ("upstream",))
+UPSTREAM_CONCURRENCY_LIMIT = REGISTRY.gauge("agent_upstream_concurrency_limit", "Current adaptive concurrency limit per upstream", ("upstream",))
+UPSTREAM_WAITING = REGISTRY.gauge("agent_upstream_waiting", "Upstream calls queued for a concurrency slot", ("upstream",))
+UPSTREAM_CIRCUIT_STATE = REGISTRY.gauge("agent_upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)", ("upstream",))
+UPSTREAM_CIRCUIT_TRANSITIONS = REGISTRY.counter("agent_upstream_circuit_transitions_total", "Circuit breaker state changes, by the state entered", ("upstream", "state"))
+UPSTREAM_REJECTED = REGISTRY.counter("agent_upstream_rejected_total", "Upstream calls failed fast because the circuit was open", ("upstream",))
+
+LLM_TOKENS = REGISTRY.counter("agent_llm_tokens_total", "Model tokens by direction (input/output), as reported by the provider or estimated", ("model", "direction"))
+LLM_COMPACTIONS = REGISTRY.counter("agent_llm_prompt_compactions_total", "Prompts compacted to fit the input token budget", ("model",))
+
+def upstream_status(error: BaseException) -> str:
+    """Best-effort HTTP status for an upstream exception"""
+    response = getattr(error, "response", None)
+    for candidate in (getattr(response, "status_code", None), getattr(error, "status_code", None), getattr(error, "code", None)):
+        if isinstance(candidate, int):
+            return str(candidate)
+    return "error"
+
+@contextmanager
+def track_upstream(upstream: str) -> Iterator[Dict[str, Any]]:
+    """Time and trace an upstream call; set ["status"] inside the block, exceptions are classified automatically"""
+    outcome: Dict[str, Any] = {"status": "200"}
+    start = time.perf_counter()
+    with tracing.span(f"upstream {upstream}") as upstream_span:
+        try:
+            yield outcome
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                outcome["status"] = upstream_status(e)
+            else:
+                outcome["status"] = "cancelled"
+            raise
+        finally:
+            upstream_span.set(http_status=str(outcome["status"]))
+            UPSTREAM_LATENCY.observe(time.perf_counter() - start, upstream=upstream)
+            UPSTREAM_RESPONSES.inc(upstream=upstream, status=str(outcome["status"]))
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+def summarize(text: str) -> List[Dict[str, Any]]:
+    """Reduce exposition text to one row per histogram series with count, mean and p50/p95/p99"""
+    series: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, Any]] = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line.strip())
+        if not match or line.startswith("#"):
+            continue
+        name, raw_labels, value = match.groups()
+        labels = dict(LABEL.findall(raw_labels or ""))
+
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix):
+                base = name[:-len(suffix)]
+                break
+        else:
+            continue
+
+        le = labels.pop("le", None)
+        entry = series.setdefault((base, tuple(sorted(labels.items()))), {"buckets": [], "sum": 0.0, "count": 0})
+        if suffix == "_bucket":
+            entry["buckets"].append((math.inf if le == "+Inf" else float(le), float(value)))
+        elif suffix == "_sum":
+            entry["sum"] = float(value)
+        else:
+            entry["count"] = int(float(value))
+
+    rows = []
+    for (name, labels), entry in sorted(series.items()):
+        cumulative = sorted(entry["buckets"])
+        bounds = tuple(bound for bound, _ in cumulative if bound != math.inf)
+        counts, previous = [], 0.0
+        for _, total in cumulative:
+            counts.append(int(total - previous))
+            previous = total
+        rows.append({
+            "metric": name,
+            "labels": dict(labels),
+            "count": entry["count"],
+            "mean": entry["sum"] / entry["count"] if entry["count"] else None,
+            **{f"p{int(q * 100)}": bucket_quantile(q, bounds, counts) for q in (0.5, 0.95, 0.99)}
+        })
+    return rows
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode("latin-1").split(" ")
+        if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", REGISTRY.render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"Not found: try /metrics\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def start_exporter(host: str, port: int) -> asyncio.AbstractServer:
+    """Serve GET /metrics on its own port for the lifetime of the event loop"""
+    return await asyncio.start_server(_serve_metrics, host, port)
@@ -1,6 +1,21 @@
-from .search_node import SearchNode
-from .llm_node import LLMNode
-from .math_node import MathNode
-from .output_node import OutputNode
+import importlib
 
-__all__ = ["SearchNode", "LLMNode", "MathNode", "OutputNode"]
\ No newline at end of file
+# Node classes are imported on first access so that flows which never use a
+# node do not pay for its dependencies (e.g. langchain for LLMNode)
+_NODE_MODULES = {
+    "SearchNode": ".search_node",
+    "LLMNode": ".llm_node",
+    "MathNode": ".math_node",
+    "OutputNode": ".output_node",
+    "ReaderNode": ".reader_node",
+}
+
+__all__ = ["SearchNode", "LLMNode", "MathNode", "OutputNode", "ReaderNode"]
+
+def __getattr__(name):
+    if name in _NODE_MODULES:
+        module = importlib.import_module(_NODE_MODULES[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,17 +1,245 @@
 import time
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage
+from langchain.schema import AIMessage, HumanMessage
 from state import AgentState, NodeResult, ValidationResult
+from tracing import span
+from semantic_cache import SemanticCache
+from metrics import LLM_COMPACTIONS, LLM_TOKENS, track_upstream
+from tokens import TokenCounter, usage_tokens
+from upstream import Cassette, CircuitBreaker, Hedger, RetryPolicy, SingleFlight, UpstreamLimiter
 
 class LLMNode:
     """Node for calling Google Gemini LLM"""
     
-    def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash-lite"):
+    cacheable = True
+    # Answers depend on the session's conversation, so it is part of the cache key
+    uses_conversation = True
+    
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gemini-2.0-flash-lite",
+        semantic_cache: Optional[SemanticCache] = None,
+        cassette: Optional[Cassette] = None,
+        retry: Optional[RetryPolicy] = None,
+        hedge: Optional[Hedger] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_input_tokens: int = 8192,
+        max_output_tokens: int = 2048
+    ):
+        if max_input_tokens < 1 or max_output_tokens < 1:
+            raise ValueError("max_input_tokens and max_output_tokens must be positive")
         self.llm = ChatGoogleGenerativeAI(
             google_api_key=api_key,
             model=model_name,
-            temperature=0.7
+            temperature=0.7,
+            max_output_tokens=max_output_tokens,
+            # One attempt per call: retries are handled by RetryPolicy
+            max_retries=1
         )
+        self.model_name = model_name
+        self.semantic_cache = semantic_cache
+        # Records or replays Gemini traffic when set
+        self.cassette = cassette
+        self.retry = retry or RetryPolicy()
+        self.hedge = hedge
+        # Rate and concurrency limits for Gemini, shared process-wide
+        self.limiter = limiter or UpstreamLimiter("gemini")
+        # Fails fast while Gemini is unhealthy instead of waiting out timeouts
+        self.breaker = breaker or CircuitBreaker("gemini")
+        self._inflight = SingleFlight()
+        # Prompts estimated above the input budget are compacted before the call
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.tokens = TokenCounter()
+    
+    async def shutdown(self):
+        """Persist the semantic cache index"""
+        if self.semantic_cache is not None:
+            await self.semantic_cache.flush()
+    
+    def _cassette_request(self, messages: List[Any]) -> Dict[str, Any]:
+        return {"model": self.model_name, "messages": [str(message.content) for message in messages]}
+    
+    async def _invoke(self, message: Any) -> Any:
+        """Call the model if the circuit is closed and the Gemini limiter admits the request"""
+        async with self.breaker.guard(), self.limiter.slot():
+            return await self._invoke_upstream(message)
+    
+    async def _invoke_upstream(self, message: Any) -> Any:
+        with track_upstream("gemini"):
+            if self.cassette is None:
+                return await self.llm.ainvoke([message])
+            
+            request = self._cassette_request([message])
+            if self.cassette.replaying:
+                interaction = await self.cassette.replay("gemini", request)
+                return AIMessage(**interaction.response)
+            
+            with self.cassette.tape("gemini", request) as tape:
+                response = await self.llm.ainvoke([message])
+                tape["response"] = {"content": response.content, "usage_metadata": getattr(response, "usage_metadata", None)}
+                return response
+    
+    async def _chunks(self, messages: List[Any]) -> AsyncIterator[Tuple[str, Any]]:
+        """(text, usage metadata) chunks from the model, or from the cassette when replaying"""
+        if self.cassette is not None and self.cassette.replaying:
+            async for text in self.cassette.replay_stream("gemini", self._cassette_request(messages)):
+                yield text, None
+            return
+        
+        async for chunk in self.llm.astream(messages):
+            text = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+            yield text, getattr(chunk, "usage_metadata", None)
+    
+    async def _stream_attempt(
+        self, messages: List[Any], writer: Callable[[Any], None], parts: List[str], usage: Dict[str, int]
+    ) -> Optional[float]:
+        """Forward one streamed response to the writer, summing its usage; returns when the first token arrived"""
+        start = time.perf_counter()
+        first_token_at = None
+        recording = self.cassette is not None and self.cassette.recording
+        tape_context = self.cassette.tape("gemini", self._cassette_request(messages)) if recording else nullcontext({})
+        
+        async with self.breaker.guard(), self.limiter.slot():
+            with track_upstream("gemini"), tape_context as tape:
+                chunks = tape.setdefault("chunks", [])
+                async for text, chunk_usage in self._chunks(messages):
+                    # Chunks carry usage deltas, so the sum is the response's usage
+                    for key, value in (chunk_usage or {}).items():
+                        if isinstance(value, int):
+                            usage[key] = usage.get(key, 0) + value
+                    if not text:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(text)
+                    if recording:
+                        chunks.append((time.perf_counter() - start, text))
+                    writer({"type": "token", "node": "llm", "text": text})
+                tape["response"] = {"content": "".join(parts), "usage_metadata": usage or None}
+        return first_token_at
+    
+    async def _stream(self, messages: List[Any]) -> Tuple[str, Dict[str, Optional[float]], Dict[str, int]]:
+        """Stream a response to the graph's custom stream; returns text, timing and usage metadata"""
+        from langgraph.config import get_stream_writer
+        
+        writer = get_stream_writer()
+        start = time.perf_counter()
+        parts: List[str] = []
+        usage: Dict[str, int] = {}
+        
+        # Retry only while nothing has been streamed; later failures would duplicate output
+        retry = 0
+        while True:
+            try:
+                first_token_at = await self._stream_attempt(messages, writer, parts, usage)
+                break
+            except Exception as e:
+                if parts or not await self.retry.pause("gemini", retry, e, start):
+                    raise
+                usage.clear()
+                retry += 1
+        
+        end = time.perf_counter()
+        response_text = "".join(parts)
+        if first_token_at is None:
+            return response_text, {}, usage
+        
+        generation_time = end - first_token_at
+        reported = usage_tokens(usage)
+        tokens = reported[1] if reported is not None else self.tokens.estimate(response_text)
+        return response_text, {
+            "time_to_first_token": first_token_at - start,
+            "tokens_per_second": tokens / generation_time if generation_time > 0 else None
+        }, usage
+    
+    @staticmethod
+    def _grounded_prompt(question: str, grounding: Dict[str, Any]) -> str:
+        """Prompt that asks for an answer from ranked source excerpts, citing them by number"""
+        titles = {source["number"]: source["title"] for source in grounding["sources"]}
+        excerpts = "\n\n".join(
+            f"[{chunk['source']}] {titles.get(chunk['source'], '')}\n{chunk['text']}"
+            for chunk in grounding["chunks"]
+        )
+        return (
+            "Answer the question using only the numbered source excerpts below, and cite "
+            "the sources you use like [1]. If the excerpts do not answer it, say so.\n\n"
+            f"{excerpts}\n\nQuestion: {question}"
+        )
+    
+    def _fit_prompt(
+        self, prompt: str, system_message: str, grounding: Optional[Dict[str, Any]], conversation: Optional[str] = None
+    ) -> Tuple[str, List[Dict[str, Any]], int, Optional[Dict[str, int]]]:
+        """Build the prompt for the model within the input token budget
+        
+        Lower-ranked source excerpts are dropped first, then the middle of the
+        user's text is trimmed. Returns the prompt, the excerpts it kept, its
+        token estimate and, when anything was cut, the estimates before and after.
+        """
+        chunks = list(grounding["chunks"]) if grounding is not None else []
+        
+        def build(text: str) -> str:
+            question = self._grounded_prompt(text, {**grounding, "chunks": chunks}) if grounding is not None else text
+            if conversation:
+                question = f"{conversation}\n\nUser: {question}"
+            elif system_message:
+                question = f"User: {question}"
+            return f"System: {system_message}\n\n{question}" if system_message else question
+        
+        full_prompt = build(prompt)
+        before = tokens = self.tokens.estimate(full_prompt)
+        if tokens <= self.max_input_tokens:
+            return full_prompt, chunks, tokens, None
+        
+        while tokens > self.max_input_tokens and len(chunks) > 1:
+            chunks.pop()
+            full_prompt = build(prompt)
+            tokens = self.tokens.estimate(full_prompt)
+        
+        if tokens > self.max_input_tokens:
+            room = self.max_input_tokens - (tokens - self.tokens.estimate(prompt))
+            if room < 1:
+                raise ValueError(f"System message, conversation and sources alone exceed the {self.max_input_tokens}-token input budget")
+            full_prompt = build(self.tokens.trim_middle(prompt, room))
+            tokens = self.tokens.estimate(full_prompt)
+        
+        dropped = len(grounding["chunks"]) - len(chunks) if grounding is not None else 0
+        return full_prompt, chunks, tokens, {"before": before, "after": tokens, "dropped_excerpts": dropped}
+    
+    def _count_tokens(self, full_prompt: str, estimated: int, response_text: str, usage: Any) -> Dict[str, Any]:
+        """Token counts for one call, from the provider's usage metadata or else local estimates"""
+        reported = usage_tokens(usage)
+        if reported is not None:
+            self.tokens.observe(full_prompt, reported[0])
+            counts = {"input": reported[0], "output": reported[1], "source": "provider"}
+        else:
+            counts = {"input": estimated, "output": self.tokens.estimate(response_text), "source": "estimate"}
+        LLM_TOKENS.inc(counts["input"], model=self.model_name, direction="input")
+        LLM_TOKENS.inc(counts["output"], model=self.model_name, direction="output")
+        return counts
+    
+    async def summarize(self, summary: str, turns: List[Dict[str, str]], max_tokens: int) -> str:
+        """Fold conversation turns into a running summary of about max_tokens"""
+        transcript = "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+        prompt = (
+            "Update the summary of a conversation with the turns below. Keep names, numbers, "
+            "decisions and open questions; drop pleasantries. Reply with the updated summary only, "
+            f"in at most {max_tokens * 3 // 4} words.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{transcript}"
+        )
+        text, _ = await self._complete(prompt, self.tokens.estimate(prompt))
+        return text if isinstance(text, str) else str(text)
+    
+    async def _complete(self, full_prompt: str, estimated: int) -> Tuple[str, Dict[str, Any]]:
+        """One model call with retries and hedging; returns the response text and its token counts"""
+        message = HumanMessage(content=full_prompt)
+        response = await self.retry.run("gemini", lambda: self._invoke(message), self.hedge)
+        usage = getattr(response, "usage_metadata", None)
+        return response.content, self._count_tokens(full_prompt, estimated, response.content, usage)
     
     def validate_input(self, state: AgentState) -> ValidationResult:
         """Validate LLM input"""
@@ -21,8 +249,8 @@ class LLMNode:
         prompt = state["parsed_input"].get("prompt")
         if not prompt or len(prompt.strip()) == 0:
             errors.append("Prompt cannot be empty")
-        elif len(prompt) > 10000:
-            warnings.append("Prompt is very long, response may be truncated")
+        elif self.tokens.estimate(prompt) > self.max_input_tokens:
+            warnings.append(f"Prompt is over the {self.max_input_tokens}-token input budget and will be trimmed")
         
         return ValidationResult(
             is_valid=len(errors) == 0,
@@ -36,7 +264,8 @@ class LLMNode:
         
         try:
             # Validate input
-            validation = self.validate_input(state)
+            with span("validate"):
+                validation = self.validate_input(state)
             state["validation_results"]["llm"] = validation
             
             if not validation.is_valid:
@@ -46,27 +275,73 @@ class LLMNode:
             prompt = state["parsed_input"]["prompt"]
             system_message = state["parsed_input"].get("system_message", "")
             
-            if system_message:
-                full_prompt = f"System: {system_message}\n\nUser: {prompt}"
-            else:
-                full_prompt = prompt
+            # Answer from pages read earlier in the flow, when there are any
+            reader = state["node_results"].get("reader")
+            grounding = reader.data if reader is not None and reader.success else None
+            conversation = state.get("conversation")
             
-            # Execute LLM call
-            message = HumanMessage(content=full_prompt)
-            response = await self.llm.ainvoke([message])
+            # Serve near-duplicate prompts from the semantic cache (grounded answers depend on
+            # the sources, and answers within a session on the conversation so far)
+            match = None
+            shareable = grounding is None and not conversation
+            if self.semantic_cache is not None and shareable:
+                with span("semantic cache lookup") as lookup_span:
+                    match = self.semantic_cache.lookup(prompt, namespace=system_message)
+                    lookup_span.set(hit=match is not None)
+            
+            stream_metrics: Dict[str, Optional[float]] = {}
+            tokens = compaction = None
+            chunks = grounding["chunks"] if grounding is not None else []
+            if match is not None:
+                response_text = match.response
+            else:
+                # Keep the prompt within the input budget before paying for it
+                with span("fit prompt") as fit_span:
+                    full_prompt, chunks, estimated, compaction = self._fit_prompt(prompt, system_message, grounding, conversation)
+                    fit_span.set(tokens=estimated, compacted=compaction is not None)
+                if compaction is not None:
+                    LLM_COMPACTIONS.inc(model=self.model_name)
+                
+                if state.get("stream"):
+                    # Stream tokens through the graph as they are generated
+                    response_text, stream_metrics, usage = await self._stream([HumanMessage(content=full_prompt)])
+                    tokens = self._count_tokens(full_prompt, estimated, response_text, usage)
+                else:
+                    # Execute LLM call, sharing it with identical prompts in flight
+                    response_text, tokens = await self._inflight.do(
+                        full_prompt, lambda: self._complete(full_prompt, estimated)
+                    )
+                    
+                    if self.semantic_cache is not None and shareable:
+                        self.semantic_cache.add(prompt, response_text, namespace=system_message)
+                        if self.semantic_cache.should_flush:
+                            await self.semantic_cache.flush()
             
             # Create result
             execution_time = time.time() - start_time
+            data = {
+                "prompt": prompt,
+                "response": response_text,
+                "model": self.model_name
+            }
+            if tokens is not None:
+                data["tokens"] = tokens
+            if compaction is not None:
+                data["compacted"] = compaction
+            if grounding is not None:
+                data["grounded_on"] = sorted({chunk["source"] for chunk in chunks})
+            if match is not None:
+                data["semantic_match"] = {
+                    "prompt": match.prompt,
+                    "similarity": round(match.similarity, 4)
+                }
+            
             result = NodeResult(
                 success=True,
-                data={
-                    "prompt": prompt,
-                    "response": response.content,
-                    "model": "gemini-2.0-flash-lite",
-                    "tokens_estimated": len(prompt.split()) + len(response.content.split())
-                },
+                data=data,
                 execution_time=execution_time,
-                context=state["execution_context"]
+                context=state["execution_context"],
+                **stream_metrics
             )
             
             state["node_results"]["llm"] = result
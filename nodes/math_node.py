@@ -1,21 +1,56 @@
+import asyncio
 import time
-import operator
-from typing import Dict, Any, Callable
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+import expressions
 from state import AgentState, NodeResult, ValidationResult
+from tracing import span
+
+# Number of operands echoed back in results and expressions for large inputs
+PREVIEW_SIZE = 10
 
 class MathNode:
     """Node for mathematical operations"""
     
-    def __init__(self):
-        self.operations: Dict[str, Callable] = {
-            "add": operator.add,
-            "subtract": operator.sub,
-            "multiply": operator.mul,
-            "divide": operator.truediv,
-            "power": operator.pow,
-            "modulo": operator.mod
+    cacheable = True
+    
+    def __init__(self, max_operands: int = 1000000, data_dir: Optional[str] = "data"):
+        self.max_operands = max_operands
+        # Operand files are only read from inside this directory; None disables them
+        self.data_dir = Path(data_dir).resolve() if data_dir else None
+        
+        # Binary operations fold left over operands, or apply element-wise across two vectors
+        self.operations: Dict[str, np.ufunc] = {
+            "add": np.add,
+            "subtract": np.subtract,
+            "multiply": np.multiply,
+            "divide": np.divide,
+            "power": np.power,
+            "modulo": np.mod
+        }
+        
+        # Reductions collapse all operands into one value
+        self.reductions: Dict[str, Callable[[np.ndarray], Any]] = {
+            "sum": np.sum,
+            "product": np.prod,
+            "mean": np.mean,
+            "min": np.min,
+            "max": np.max,
+            "variance": np.var
+        }
+        
+        # Vector operations take exactly two equal-length vectors
+        self.vector_operations: Dict[str, Callable[[np.ndarray, np.ndarray], Any]] = {
+            "dot": np.dot
         }
     
+    @property
+    def available_operations(self) -> List[str]:
+        return [*self.operations, *self.reductions, *self.vector_operations, "evaluate"]
+    
     def validate_input(self, state: AgentState) -> ValidationResult:
         """Validate math input"""
         errors = []
@@ -26,27 +61,23 @@ class MathNode:
         
         if not operation:
             errors.append("Operation is required")
-        elif operation not in self.operations:
-            errors.append(f"Unsupported operation: {operation}. Available: {list(self.operations.keys())}")
-        
-        # Validate operands
-        operands = parsed.get("operands", [])
-        if len(operands) < 2:
-            errors.append("At least 2 operands are required")
+        elif operation not in self.available_operations:
+            errors.append(f"Unsupported operation: {operation}. Available: {self.available_operations}")
         
-        for i, operand in enumerate(operands):
+        if operation == "evaluate":
+            errors.extend(self._validate_expression(parsed))
+        elif parsed.get("source") and (parsed.get("operands") or parsed.get("vectors")):
+            errors.append("Provide either a source file or inline operands, not both")
+        elif parsed.get("source"):
             try:
-                float(operand)
-            except (ValueError, TypeError):
-                errors.append(f"Operand {i+1} is not a valid number: {operand}")
-        
-        # Division by zero check
-        if operation == "divide" and len(operands) >= 2:
+                self._resolve_source(parsed["source"])
+            except ValueError as e:
+                errors.append(str(e))
+        elif not parsed.get("source"):
             try:
-                if float(operands[1]) == 0:
-                    errors.append("Division by zero is not allowed")
-            except (ValueError, TypeError):
-                pass
+                self._to_arrays(parsed)
+            except ValueError as e:
+                errors.append(str(e))
         
         return ValidationResult(
             is_valid=len(errors) == 0,
@@ -54,44 +85,195 @@ class MathNode:
             warnings=warnings
         )
     
+    def _validate_expression(self, parsed: Dict[str, Any]) -> List[str]:
+        """Check that an expression compiles and every variable is bound to numbers"""
+        try:
+            expression = expressions.parse(parsed.get("expression") or "")
+        except ValueError as e:
+            return [str(e)]
+        
+        variables = parsed.get("variables") or {}
+        errors = []
+        missing = [name for name in expression.variables if name not in variables]
+        if missing:
+            errors.append(f"Unbound variables: {', '.join(missing)}")
+        
+        size = 0
+        for name in expression.variables:
+            if name not in variables:
+                continue
+            try:
+                size += self._as_array(np.atleast_1d(variables[name]), f"Variable '{name}' value").size
+            except ValueError as e:
+                errors.append(str(e))
+        if size > self.max_operands:
+            errors.append(f"Too many operands: {size} (MATH_MAX_OPERANDS is {self.max_operands})")
+        return errors
+    
+    def _to_arrays(self, parsed: Dict[str, Any]) -> Tuple[Optional[np.ndarray], Optional[List[np.ndarray]]]:
+        """Convert inline operands or vectors into float arrays"""
+        if parsed.get("vectors") is not None:
+            vectors = parsed["vectors"]
+            if not isinstance(vectors, (list, tuple)) or len(vectors) != 2:
+                raise ValueError("Exactly 2 vectors are required")
+            return None, [self._as_array(vector, f"Vector {i+1}") for i, vector in enumerate(vectors)]
+        return self._as_array(parsed.get("operands", []), "Operand"), None
+    
+    @staticmethod
+    def _as_array(values: Any, label: str) -> np.ndarray:
+        """Convert a list of numbers in one pass, locating the bad element only on failure"""
+        try:
+            array = np.asarray(values, dtype=np.float64)
+        except (ValueError, TypeError):
+            for i, value in enumerate(values):
+                try:
+                    float(value)
+                except (ValueError, TypeError):
+                    raise ValueError(f"{label} {i+1} is not a valid number: {value}")
+            raise ValueError(f"{label} values must be a flat list of numbers")
+        
+        if array.ndim != 1:
+            raise ValueError(f"{label} values must be a flat list of numbers")
+        return array
+    
+    def _resolve_source(self, source: str) -> Path:
+        """Resolve an operand file, rejecting paths outside the data directory"""
+        if self.data_dir is None:
+            raise ValueError("Operand files are disabled (set MATH_DATA_DIR to enable them)")
+        path = Path(source).resolve()
+        if not path.is_relative_to(self.data_dir):
+            raise ValueError(f"Operand file must be inside {self.data_dir}: {source}")
+        return path
+    
+    def _load_source(self, source: str) -> np.ndarray:
+        """Load operands from a .npy array or a numeric CSV (an optional header row is skipped)"""
+        path = self._resolve_source(source)
+        suffix = path.suffix.lower()
+        if suffix == ".npy":
+            data = np.load(path, allow_pickle=False)
+        elif suffix == ".csv":
+            try:
+                data = np.loadtxt(path, delimiter=",", ndmin=2)
+            except ValueError:
+                data = np.loadtxt(path, delimiter=",", ndmin=2, skiprows=1)
+        else:
+            raise ValueError(f"Unsupported operand file type: {suffix or source} (expected .csv or .npy)")
+        return np.asarray(data, dtype=np.float64)
+    
+    def _split_source(self, data: np.ndarray, operation: str) -> Tuple[Optional[np.ndarray], Optional[List[np.ndarray]]]:
+        """Read two columns (or two rows) as vectors for vector ops, otherwise flatten"""
+        wants_vectors = operation in self.vector_operations or (
+            operation in self.operations and data.ndim == 2 and 2 in data.shape
+        )
+        if not wants_vectors:
+            return data.ravel(), None
+        
+        if data.ndim == 2 and data.shape[1] == 2:
+            return None, [data[:, 0], data[:, 1]]
+        if data.ndim == 2 and data.shape[0] == 2:
+            return None, [data[0], data[1]]
+        raise ValueError(f"Operation '{operation}' needs two columns or two rows, got shape {data.shape}")
+    
+    def _check_arrays(self, operation: str, operands: Optional[np.ndarray], vectors: Optional[List[np.ndarray]]):
+        """Enforce size limits and operation-specific constraints"""
+        size = operands.size if operands is not None else sum(vector.size for vector in vectors)
+        if size > self.max_operands:
+            raise ValueError(f"Too many operands: {size} (MATH_MAX_OPERANDS is {self.max_operands})")
+        if not np.all(np.isfinite(operands if operands is not None else np.concatenate(vectors))):
+            raise ValueError("Operands must be finite numbers")
+        
+        if vectors is not None:
+            if operation in self.reductions:
+                raise ValueError(f"Operation '{operation}' takes a single list of operands")
+            if vectors[0].size != vectors[1].size:
+                raise ValueError(f"Vectors must have the same length ({vectors[0].size} != {vectors[1].size})")
+            if vectors[0].size == 0:
+                raise ValueError("Vectors must not be empty")
+            divisors = vectors[1]
+        else:
+            if operation in self.vector_operations:
+                raise ValueError(f"Operation '{operation}' requires 2 vectors")
+            minimum = 1 if operation in self.reductions else 2
+            if operands.size < minimum:
+                raise ValueError(f"At least {minimum} operand{'s' if minimum > 1 else ''} required")
+            divisors = operands[1:]
+        
+        if operation in ("divide", "modulo") and np.any(divisors == 0):
+            raise ValueError("Division by zero is not allowed")
+    
+    def compute(self, operation: str, operands: Optional[np.ndarray], vectors: Optional[List[np.ndarray]]) -> Any:
+        """Run an operation over float arrays, returning a float or a list of floats"""
+        self._check_arrays(operation, operands, vectors)
+        
+        with np.errstate(over="ignore", invalid="ignore"):
+            if vectors is not None and operation in self.vector_operations:
+                result = self.vector_operations[operation](vectors[0], vectors[1])
+            elif vectors is not None:
+                result = self.operations[operation](vectors[0], vectors[1])
+            elif operation in self.reductions:
+                result = self.reductions[operation](operands)
+            else:
+                # ufunc.reduce keeps the left-fold semantics of ((a op b) op c) ...
+                result = self.operations[operation].reduce(operands)
+        
+        if np.ndim(result) == 0:
+            return float(result)
+        return result.tolist()
+    
     async def execute(self, state: AgentState) -> AgentState:
         """Execute math operation"""
         start_time = time.time()
         
         try:
             # Validate input
-            validation = self.validate_input(state)
+            with span("validate"):
+                validation = self.validate_input(state)
             state["validation_results"]["math"] = validation
             
             if not validation.is_valid:
                 raise ValueError(f"Validation failed: {', '.join(validation.errors)}")
             
             # Parse input
-            operation = state["parsed_input"]["operation"]
-            operands = [float(x) for x in state["parsed_input"]["operands"]]
+            parsed = state["parsed_input"]
+            operation = parsed["operation"]
+            if operation == "evaluate":
+                state["node_results"]["math"] = self._evaluate(parsed, state, start_time)
+                state["current_node"] = "output"
+                return state
+            if parsed.get("source"):
+                array = await asyncio.to_thread(self._load_source, parsed["source"])
+                operands, vectors = self._split_source(array, operation)
+            else:
+                operands, vectors = self._to_arrays(parsed)
             
             # Execute operation
-            result_value = operands[0]
-            for operand in operands[1:]:
-                result_value = self.operations[operation](result_value, operand)
+            result_value = self.compute(operation, operands, vectors)
             
             # Create result
             execution_time = time.time() - start_time
+            data = {
+                "operation": operation,
+                "result": result_value,
+                "expression": self._format_expression(operation, operands, vectors, result_value)
+            }
+            if vectors is not None:
+                data["vector_length"] = int(vectors[0].size)
+            else:
+                data["count"] = int(operands.size)
+                data["operands"] = operands[:PREVIEW_SIZE].tolist() if operands.size > PREVIEW_SIZE else operands.tolist()
+            if parsed.get("source"):
+                data["source"] = parsed["source"]
+            
             result = NodeResult(
                 success=True,
-                data={
-                    "operation": operation,
-                    "operands": operands,
-                    "result": result_value,
-                    "expression": self._format_expression(operation, operands, result_value)
-                },
+                data=data,
                 execution_time=execution_time,
                 context=state["execution_context"]
             )
             
             state["node_results"]["math"] = result
             state["current_node"] = "output"
-            
+        
         except Exception as e:
             execution_time = time.time() - start_time
             result = NodeResult(
@@ -105,17 +287,63 @@ class MathNode:
         
         return state
     
-    def _format_expression(self, operation: str, operands: list, result: float) -> str:
+    def _evaluate(self, parsed: Dict[str, Any], state: AgentState, start_time: float) -> NodeResult:
+        """Evaluate a compiled expression (element-wise when a variable is bound to a list)"""
+        expression = expressions.parse(parsed["expression"])
+        variables = {name: parsed["variables"][name] for name in expression.variables}
+        result_value = expression.evaluate(variables)
+        
+        result_str = f"[{self._preview(result_value)}]" if isinstance(result_value, list) else str(result_value)
+        return NodeResult(
+            success=True,
+            data={
+                "operation": "evaluate",
+                "variables": variables,
+                "result": result_value,
+                "expression": f"{expression.text} = {result_str}"
+            },
+            execution_time=time.time() - start_time,
+            context=state["execution_context"]
+        )
+    
+    @staticmethod
+    def _preview(values: Any) -> str:
+        """Render a list, eliding the middle of long ones"""
+        values = list(values)
+        if len(values) <= PREVIEW_SIZE:
+            return ", ".join(map(str, values))
+        half = PREVIEW_SIZE // 2
+        return f"{', '.join(map(str, values[:half]))}, … ({len(values) - PREVIEW_SIZE} more) …, {', '.join(map(str, values[-half:]))}"
+    
+    def _format_expression(
+        self,
+        operation: str,
+        operands: Optional[np.ndarray],
+        vectors: Optional[List[np.ndarray]],
+        result: Any
+    ) -> str:
         """Format mathematical expression for display"""
         symbols = {
             "add": "+",
-            "subtract": "-", 
+            "subtract": "-",
             "multiply": "×",
             "divide": "÷",
             "power": "^",
-            "modulo": "%"
+            "modulo": "%",
+            "dot": "·"
         }
         
         symbol = symbols.get(operation, operation)
-        operands_str = f" {symbol} ".join(map(str, operands))
-        return f"{operands_str} = {result}"
\ No newline at end of file
+        result_str = f"[{self._preview(result)}]" if isinstance(result, list) else str(result)
+        
+        if vectors is not None:
+            left, right = (f"[{self._preview(vector.tolist())}]" for vector in vectors)
+            return f"{left} {symbol} {right} = {result_str}"
+        
+        if operation in self.reductions:
+            return f"{operation}({self._preview(operands.tolist())}) = {result_str}"
+        
+        if operands.size > PREVIEW_SIZE:
+            return f"{symbol}-fold over {operands.size} operands = {result_str}"
+        operands_str = f" {symbol} ".join(map(str, operands.tolist()))
+        return f"{operands_str} = {result_str}"
\ No newline at end of file
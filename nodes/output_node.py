@@ -5,12 +5,20 @@ from state import AgentState, NodeResult
 class OutputNode:
     """Shared node for formatting final output"""
     
+    # Section order when a flow's output combines several node results
+    MERGE_ORDER = ("llm", "reader", "search", "math")
+    
     def __init__(self):
         self.formatters = {
             "search": self._format_search_output,
             "llm": self._format_llm_output,
             "math": self._format_math_output
         }
+        # Combined output also has sections for nodes no flow is named after
+        self.sections = {
+            **self.formatters,
+            "reader": self._format_reader_output
+        }
     
     async def execute(self, state: AgentState) -> AgentState:
         """Format and prepare final output"""
@@ -20,10 +28,12 @@ class OutputNode:
             flow_type = state["flow_type"]
             node_result = state["node_results"].get(flow_type.value)
             
-            if not node_result:
+            if flow_type.value not in self.formatters:
+                # Multi-node flows (research, read) combine the results of their nodes
+                state["final_output"] = self._merge_branches(state)
+            elif not node_result:
                 raise ValueError(f"No result found for flow type: {flow_type}")
-            
-            if not node_result.success:
+            elif not node_result.success:
                 state["final_output"] = f"Error in {flow_type} operation: {node_result.error}"
             else:
                 formatter = self.formatters.get(flow_type.value)
@@ -56,6 +66,26 @@ class OutputNode:
         
         return state
     
+    def _merge_branches(self, state: AgentState) -> str:
+        """Format every node result the flow produced, noting the ones that failed"""
+        sections = []
+        failures = []
+        for key in self.MERGE_ORDER:
+            result = state["node_results"].get(key)
+            if result is None:
+                continue
+            if key == "search" and "reader" in state["node_results"] and result.success:
+                # The reader's source list already covers the search results
+                continue
+            if result.success:
+                sections.append(self.sections[key](result.data))
+            else:
+                failures.append(f"⚠️ {key} unavailable: {result.error}")
+        
+        if not sections and not failures:
+            raise ValueError(f"No branch results to merge for flow type: {state['flow_type']}")
+        return "\n\n".join(sections + failures)
+    
     def _format_search_output(self, data: Dict[str, Any]) -> str:
         """Format search results for display"""
         output = [f"🔍 Search Results for: '{data['query']}'"]
@@ -74,7 +104,41 @@ class OutputNode:
         output.append("-" * 50)
         output.append(data['response'])
         output.append("-" * 50)
-        output.append(f"Model: {data['model']} | Estimated tokens: {data['tokens_estimated']}")
+        tokens = data.get("tokens")
+        if tokens:
+            counted = "" if tokens["source"] == "provider" else " (estimated)"
+            output.append(f"Model: {data['model']} | Tokens: {tokens['input']} in, {tokens['output']} out{counted}")
+        else:
+            output.append(f"Model: {data['model']}")
+        compacted = data.get("compacted")
+        if compacted:
+            dropped = f", dropping {compacted['dropped_excerpts']} source excerpts" if compacted["dropped_excerpts"] else ""
+            output.append(f"Prompt compacted from ~{compacted['before']} to ~{compacted['after']} tokens to fit the input budget{dropped}")
+        
+        match = data.get("semantic_match")
+        if data.get("grounded_on"):
+            output.append("Grounded on sources: " + ", ".join(f"[{number}]" for number in data["grounded_on"]))
+        if match:
+            output.append(f"Served from semantic cache (similarity {match['similarity']:.2f}): \"{match['prompt']}\"")
+        
+        return "\n".join(output)
+    
+    def _format_reader_output(self, data: Dict[str, Any]) -> str:
+        """Format the pages read for a grounded answer"""
+        output = [f"📄 Sources read for: '{data['query']}'"]
+        for source in data["sources"]:
+            reason = source.get("error") or ("timed out" if source.get("truncated") == "time" else "no readable text")
+            if source["used"] == "page":
+                detail = f"{source['bytes'] / 1024:.0f} KB in {source['ms']:.0f} ms"
+                if source.get("truncated"):
+                    detail += f", cut at {source['truncated']} limit"
+            elif source["used"] == "snippet":
+                detail = f"snippet only, {reason}"
+            else:
+                detail = f"unreadable, {reason}"
+            output.append(f"[{source['number']}] {source['title']}")
+            output.append(f"    🔗 {source['link']} ({detail})")
+        output.append(f"Used {len(data['chunks'])} of {data['chunks_considered']} passages")
         
         return "\n".join(output)
     
@@ -83,6 +147,20 @@ class OutputNode:
         output = ["🧮 Mathematical Calculation:"]
         output.append(f"Operation: {data['operation'].title()}")
         output.append(f"Expression: {data['expression']}")
-        output.append(f"Result: {data['result']}")
+        if data.get("source"):
+            output.append(f"Source: {data['source']}")
+        if data.get("count", 0) > 2:
+            output.append(f"Operands: {data['count']}")
+        if data.get("variables"):
+            output.append("Variables: " + ", ".join(
+                f"{name} = {value if not isinstance(value, list) or len(value) <= 10 else f'[{len(value)} values]'}"
+                for name, value in data["variables"].items()
+            ))
+        if data.get("vector_length"):
+            output.append(f"Vector Length: {data['vector_length']}")
+        if isinstance(data["result"], list) and len(data["result"]) > 10:
+            output.append(f"Result: [{len(data['result'])} values, see expression]")
+        else:
+            output.append(f"Result: {data['result']}")
         
         return "\n".join(output)
@@ -0,0 +1,408 @@
+import asyncio
+import html
+import math
+import re
+import time
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional
+import httpx
+from state import AgentState, NodeResult, ValidationResult
+from tracing import span
+from metrics import track_upstream
+from semantic_cache import STOPWORDS
+from upstream import Cassette
+
+# Elements whose text is never part of a page's main content
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "head", "nav", "header",
+    "footer", "aside", "form", "button", "select", "iframe"
+}
+
+# Elements that end the paragraph being collected
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "br", "hr", "table",
+    "tr", "td", "th", "blockquote", "pre", "dd", "dt", "figcaption",
+    "h1", "h2", "h3", "h4", "h5", "h6"
+}
+
+# Elements whose content is raw text rather than markup
+RAW_TEXT_TAGS = ("script", "style")
+RAW_TEXT_ENDS = {tag: re.compile(rf"</{tag}\s*>", re.IGNORECASE) for tag in RAW_TEXT_TAGS}
+
+# Comments and the tags that matter for extraction; other (inline) tags are
+# removed from finished paragraphs in one pass
+TOKEN = re.compile(
+    r"<(?:!--|(/?)(" + "|".join(sorted(SKIP_TAGS | BLOCK_TAGS | {"title"}, key=len, reverse=True)) + r")\b[^<>]*>)",
+    re.IGNORECASE
+)
+INLINE_TAG = re.compile(r"<[^<>]*>")
+
+TEXT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+WORD = re.compile(r"[a-z0-9]+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+class TextExtractor:
+    """Incremental HTML-to-text extraction that keeps paragraphs of running text
+    
+    Decoded chunks are fed as they arrive and scanned with one compiled regex for
+    structural tags only, so extraction keeps up with the network instead of
+    waiting for the whole page.
+    Navigation, scripts and other chrome are dropped, as are paragraphs shorter
+    than min_words (menus, captions, bylines).
+    """
+    
+    def __init__(self, min_words: int = 8):
+        self.min_words = min_words
+        self.plain = False
+        self.title = ""
+        self.paragraphs: List[str] = []
+        self.chars = 0
+        self._buffer = ""
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        self._in_title = False
+        # Closing tag that ends the script/style element being skipped
+        self._raw_end: Optional[Any] = None
+    
+    def feed(self, data: str):
+        self._buffer += data
+        if self.plain:
+            # text/plain: paragraphs are separated by blank lines
+            *complete, self._buffer = self._buffer.split("\n\n")
+            for paragraph in complete:
+                self._parts.append(paragraph)
+                self._end_paragraph()
+        else:
+            self._scan(final=False)
+    
+    def close(self):
+        if self.plain:
+            self._parts.append(self._buffer)
+            self._buffer = ""
+        else:
+            self._scan(final=True)
+        self._end_paragraph()
+    
+    def _scan(self, final: bool):
+        buffer = self._buffer
+        position = 0
+        keep_from = None
+        while True:
+            if self._raw_end is not None:
+                end = self._raw_end.search(buffer, position)
+                if end is None:
+                    # Keep just enough of the script to match its closing tag later
+                    keep_from = len(buffer) if final else max(position, len(buffer) - 16)
+                    break
+                self._raw_end = None
+                position = end.end()
+            
+            match = TOKEN.search(buffer, position)
+            if match is None:
+                break
+            if match.start() > position:
+                self._text(buffer[position:match.start()])
+            if match.group(2) is None:
+                # A comment, possibly continued in the next chunk
+                end = buffer.find("-->", match.end())
+                if end == -1:
+                    keep_from = len(buffer) if final else match.start()
+                    break
+                position = end + 3
+                continue
+            position = match.end()
+            self._tag(match.group(2).lower(), closing=bool(match.group(1)))
+        
+        if keep_from is not None:
+            self._buffer = buffer[keep_from:]
+            return
+        rest = buffer[position:]
+        # A tag cut off at the end of the chunk waits for the next one
+        cut = -1 if final else rest.rfind("<")
+        if cut == -1 or ">" in rest[cut:] or len(rest) - cut > 1024:
+            cut = len(rest)
+        self._text(rest[:cut])
+        self._buffer = rest[cut:]
+    
+    def _tag(self, tag: str, closing: bool):
+        if tag == "title":
+            self._in_title = not closing
+        elif tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth + (-1 if closing else 1))
+            if not closing and tag in RAW_TEXT_TAGS:
+                # Script and style bodies are not markup; jump to the closing tag
+                self._raw_end = RAW_TEXT_ENDS[tag]
+                self._skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self._end_paragraph()
+    
+    def _text(self, text: str):
+        if self._in_title:
+            self.title += text
+        elif not self._skip_depth and text:
+            self._parts.append(text)
+    
+    def _end_paragraph(self):
+        text = "".join(self._parts)
+        self._parts = []
+        words = (INLINE_TAG.sub(" ", text) if "<" in text else text).split()
+        if len(words) >= self.min_words:
+            text = " ".join(words)
+            if "&" in text:
+                text = html.unescape(text)
+            self.paragraphs.append(text)
+            self.chars += len(text)
+    
+    @property
+    def page_title(self) -> str:
+        return html.unescape(" ".join(INLINE_TAG.sub(" ", self.title).split()))
+
+def chunk_paragraphs(paragraphs: List[str], size: int) -> List[str]:
+    """Pack paragraphs into chunks of about size characters, splitting long ones at sentence ends"""
+    pieces: List[str] = []
+    for paragraph in paragraphs:
+        sentences = SENTENCE_END.split(paragraph) if len(paragraph) > size else [paragraph]
+        for sentence in sentences:
+            # Run-on text without sentence ends is cut hard
+            pieces.extend(sentence[i:i + size] for i in range(0, len(sentence), size))
+    
+    chunks: List[str] = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + len(piece) + 1 <= size:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+def rank_chunks(query: str, chunks: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75) -> List[Dict[str, Any]]:
+    """Order chunks by BM25 relevance to the query, earlier sources first on ties
+    
+    Query terms are counted as word prefixes with str.count, which doubles as
+    crude stemming ("cancel" matches "cancelled") and avoids tokenizing chunks.
+    """
+    terms = sorted({word for word in WORD.findall(query.lower()) if word not in STOPWORDS})
+    padded = [" " + chunk["text"].lower() for chunk in chunks]
+    counts = [{term: text.count(" " + term) for term in terms} for text in padded]
+    lengths = [text.count(" ") for text in padded]
+    average = (sum(lengths) / len(lengths) if lengths else 0.0) or 1.0
+    idf = {}
+    for term in terms:
+        containing = sum(1 for count in counts if count[term])
+        idf[term] = math.log(1 + (len(chunks) - containing + 0.5) / (containing + 0.5))
+    
+    for chunk, count, length in zip(chunks, counts, lengths):
+        score = 0.0
+        for term, frequency in count.items():
+            if frequency:
+                score += idf[term] * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average))
+        chunk["score"] = round(score, 4)
+    
+    return sorted(chunks, key=lambda chunk: (-chunk["score"], chunk["source"], chunk["position"]))
+
+class ReaderNode:
+    """Node that reads the pages behind search results and ranks their text for LLMNode"""
+    
+    cacheable = True
+    
+    def __init__(
+        self,
+        max_pages: int = 5,
+        page_timeout: float = 5.0,
+        max_page_bytes: int = 1_000_000,
+        max_page_chars: int = 40_000,
+        chunk_chars: int = 800,
+        max_chunks: int = 6,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        user_agent: str = "Mozilla/5.0 (compatible; DynamicAIAgent/1.0)",
+        cassette: Optional[Cassette] = None
+    ):
+        if max_pages < 1 or max_chunks < 1 or chunk_chars < 100:
+            raise ValueError("max_pages and max_chunks must be positive and chunk_chars at least 100")
+        self.max_pages = max_pages
+        # Per-page limits; whatever text arrived before a limit hit is still used
+        self.page_timeout = page_timeout
+        self.max_page_bytes = max_page_bytes
+        self.max_page_chars = max_page_chars
+        self.chunk_chars = chunk_chars
+        self.max_chunks = max_chunks
+        self.user_agent = user_agent
+        # One pool for all page fetches, shared by concurrent requests
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        # Records or replays extracted pages when set
+        self.cassette = cassette
+        
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, recreating it if the event loop changed"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": self.user_agent, "Accept": "text/html,text/plain;q=0.9"},
+                limits=self.limits,
+                timeout=self.page_timeout,
+                follow_redirects=True
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def shutdown(self):
+        """Close the pooled client and release its connections"""
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+    
+    def validate_input(self, state: AgentState) -> ValidationResult:
+        """Validate that there are search results to read"""
+        errors = []
+        warnings = []
+        
+        search = state["node_results"].get("search")
+        if search is None or not search.success:
+            errors.append("Reading requires successful search results")
+        elif not any(item.get("link", "").startswith(("http://", "https://")) for item in search.data["results"]):
+            errors.append("Search returned no readable links")
+        
+        return ValidationResult(
+            is_valid=len(errors) == 0,
+            errors=errors,
+            warnings=warnings
+        )
+    
+    async def execute(self, state: AgentState) -> AgentState:
+        """Fetch the result pages concurrently and keep the chunks most relevant to the query"""
+        start_time = time.time()
+        
+        try:
+            # Validate input
+            with span("validate"):
+                validation = self.validate_input(state)
+            state["validation_results"]["reader"] = validation
+            
+            if not validation.is_valid:
+                raise ValueError(f"Validation failed: {', '.join(validation.errors)}")
+            
+            search = state["node_results"]["search"].data
+            items = [
+                item for item in search["results"]
+                if item.get("link", "").startswith(("http://", "https://"))
+            ][:self.max_pages]
+            
+            # All pages at once; the shared pool bounds connections across requests
+            with span("read pages", pages=len(items)):
+                pages = await asyncio.gather(*(self._read(item) for item in items))
+            
+            chunks = []
+            sources = []
+            for number, (item, page) in enumerate(zip(items, pages), 1):
+                paragraphs = page.pop("paragraphs")
+                if not paragraphs and item.get("snippet"):
+                    # Unreadable page: its search snippet is better than nothing
+                    paragraphs = [item["snippet"]]
+                    page["used"] = "snippet"
+                for position, text in enumerate(chunk_paragraphs(paragraphs, self.chunk_chars)):
+                    chunks.append({"source": number, "position": position, "text": text})
+                sources.append({"number": number, "title": page.pop("title") or item.get("title", ""), "link": item["link"], **page})
+            
+            if not chunks:
+                raise ValueError("No text could be read from any search result")
+            
+            with span("rank chunks", chunks=len(chunks)):
+                ranked = rank_chunks(state["parsed_input"].get("query", ""), chunks)[:self.max_chunks]
+            
+            # Create result
+            execution_time = time.time() - start_time
+            result = NodeResult(
+                success=True,
+                data={
+                    "query": search["query"],
+                    "sources": sources,
+                    "chunks": ranked,
+                    "chunks_considered": len(chunks)
+                },
+                execution_time=execution_time,
+                context=state["execution_context"]
+            )
+            
+            state["node_results"]["reader"] = result
+            state["current_node"] = "llm"
+        
+        except Exception as e:
+            execution_time = time.time() - start_time
+            result = NodeResult(
+                success=False,
+                error=str(e),
+                execution_time=execution_time,
+                context=state["execution_context"]
+            )
+            state["node_results"]["reader"] = result
+            state["error_message"] = str(e)
+        
+        return state
+    
+    async def _read(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Read one page; failures are reported on the page instead of failing the request"""
+        start = time.perf_counter()
+        with span("read page", url=item["link"]) as page_span:
+            try:
+                page = await self._extract(item["link"])
+            except Exception as e:
+                page = {"title": "", "paragraphs": [], "bytes": 0, "truncated": None, "error": str(e) or type(e).__name__}
+                page_span.set(error=page["error"])
+            page["used"] = "page" if page["paragraphs"] else "none"
+            page["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            page_span.set(bytes=page["bytes"], paragraphs=len(page["paragraphs"]), truncated=page["truncated"])
+        return page
+    
+    async def _extract(self, link: str) -> Dict[str, Any]:
+        """Extracted text of a page, from the network or the cassette"""
+        if self.cassette is not None and self.cassette.replaying:
+            interaction = await self.cassette.replay("web", {"url": link})
+            return dict(interaction.response)
+        
+        recording = self.cassette is not None and self.cassette.recording
+        with self.cassette.tape("web", {"url": link}) if recording else nullcontext({}) as tape:
+            page = await self._fetch(link)
+            tape["response"] = dict(page)
+            return page
+    
+    async def _fetch(self, link: str) -> Dict[str, Any]:
+        """Stream a page through the extractor until it ends or hits a byte, text or time limit"""
+        extractor = TextExtractor()
+        page: Dict[str, Any] = {"bytes": 0, "truncated": None, "error": None}
+        
+        async def stream():
+            with track_upstream("web") as outcome:
+                async with self._get_client().stream("GET", link) as response:
+                    outcome["status"] = response.status_code
+                    response.raise_for_status()
+                    content_type = response.headers.get("content-type", "text/html").split(";")[0].strip().lower()
+                    if content_type not in TEXT_TYPES:
+                        raise ValueError(f"Unsupported content type: {content_type}")
+                    extractor.plain = content_type == "text/plain"
+                    
+                    async for text in response.aiter_text():
+                        extractor.feed(text)
+                        page["bytes"] = response.num_bytes_downloaded
+                        if page["bytes"] >= self.max_page_bytes:
+                            page["truncated"] = "bytes"
+                            break
+                        if extractor.chars >= self.max_page_chars:
+                            page["truncated"] = "chars"
+                            break
+        
+        try:
+            await asyncio.wait_for(stream(), self.page_timeout)
+        except asyncio.TimeoutError:
+            # Keep the paragraphs that arrived in time
+            page["truncated"] = "time"
+        extractor.close()
+        
+        return {"title": extractor.page_title, "paragraphs": extractor.paragraphs, **page}
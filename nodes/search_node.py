@@ -1,14 +1,110 @@
+import asyncio
+import json
 import time
+import warnings
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from state import AgentState, NodeResult, ExecutionContext, ValidationResult
+from tracing import span
+from metrics import track_upstream
+from upstream import Cassette, CircuitBreaker, Hedger, RetryPolicy, SingleFlight, UpstreamLimiter
 
 class SearchNode:
     """Node for performing web searches using Serper API"""
     
-    def __init__(self, api_key: str):
+    cacheable = True
+    
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = 30.0,
+        http2: bool = False,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        prewarm: bool = False,
+        base_url: str = "https://google.serper.dev/search",
+        cassette: Optional[Cassette] = None,
+        retry: Optional[RetryPolicy] = None,
+        hedge: Optional[Hedger] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
         self.api_key = api_key
-        self.base_url = "https://google.serper.dev/search"
+        self.base_url = base_url
+        self.timeout = timeout
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.prewarm = prewarm
+        
+        # Records or replays Serper traffic when set
+        self.cassette = cassette
+        
+        # Transient failures are retried with backoff; slow requests may be hedged
+        self.retry = retry or RetryPolicy()
+        self.hedge = hedge
+        # Rate and concurrency limits for Serper, shared process-wide
+        self.limiter = limiter or UpstreamLimiter("serper")
+        # Fails fast while Serper is unhealthy instead of waiting out timeouts
+        self.breaker = breaker or CircuitBreaker("serper")
+        
+        # Shared pooled client, bound to the event loop that created it
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Identical in-flight queries share one Serper request
+        self._inflight = SingleFlight()
+    
+    def _create_client(self) -> httpx.AsyncClient:
+        """Create the pooled keep-alive client used for all searches"""
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                warnings.warn("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+        
+        return httpx.AsyncClient(
+            headers={
+                "X-API-KEY": self.api_key,
+                "Content-Type": "application/json"
+            },
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=http2
+        )
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, recreating it if the event loop changed"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            # Connections from a previous (closed) loop cannot be reused
+            self._client = self._create_client()
+            self._client_loop = loop
+        return self._client
+    
+    async def startup(self):
+        """Open the pooled client and optionally pre-warm a connection"""
+        client = self._get_client()
+        
+        if self.prewarm and not (self.cassette and self.cassette.replaying):
+            try:
+                # Any response leaves a live TLS connection in the pool
+                await client.head(self.base_url)
+            except httpx.HTTPError:
+                pass
+    
+    async def shutdown(self):
+        """Close the pooled client and release its connections"""
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
     
     def validate_input(self, state: AgentState) -> ValidationResult:
         """Validate search input"""
@@ -33,7 +129,8 @@ class SearchNode:
         
         try:
             # Validate input
-            validation = self.validate_input(state)
+            with span("validate"):
+                validation = self.validate_input(state)
             state["validation_results"]["search"] = validation
             
             if not validation.is_valid:
@@ -41,25 +138,17 @@ class SearchNode:
             
             # Prepare search request
             query = state["parsed_input"]["query"]
-            headers = {
-                "X-API-KEY": self.api_key,
-                "Content-Type": "application/json"
-            }
             payload = {
                 "q": query,
                 "num": state["parsed_input"].get("num_results", 5)
             }
             
-            # Execute search
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.base_url,
-                    json=payload,
-                    headers=headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                results = response.json()
+            # Execute search, coalescing with any identical request in flight
+            key = json.dumps(payload, sort_keys=True)
+            results = await self._inflight.do(
+                key,
+                lambda: self.retry.run("serper", lambda: self._search(payload), self.hedge)
+            )
             
             # Format results
             formatted_results = self._format_search_results(results)
@@ -89,6 +178,32 @@ class SearchNode:
         
         return state
     
+    async def _search(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one search request if the circuit is closed and the Serper limiter admits it"""
+        async with self.breaker.guard(), self.limiter.slot():
+            return await self._search_upstream(payload)
+    
+    async def _search_upstream(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one search request over the shared connection pool"""
+        with track_upstream("serper") as outcome:
+            if self.cassette is None:
+                response = await self._get_client().post(self.base_url, json=payload)
+                outcome["status"] = response.status_code
+                response.raise_for_status()
+                return response.json()
+            
+            if self.cassette.replaying:
+                interaction = await self.cassette.replay("serper", payload)
+                outcome["status"] = interaction.status
+                return interaction.response
+            
+            with self.cassette.tape("serper", payload) as tape:
+                response = await self._get_client().post(self.base_url, json=payload)
+                outcome["status"] = tape["status"] = response.status_code
+                response.raise_for_status()
+                tape["response"] = response.json()
+                return tape["response"]
+    
     def _format_search_results(self, results: Dict[str, Any]) -> Dict[str, Any]:
         """Format search results for output"""
         organic = results.get("organic", [])
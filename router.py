@@ -0,0 +1,126 @@
+import string
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+PatternSpec = Union[str, Dict[str, Any]]
+
+# Punctuation becomes its own token; str.translate + split is several times
+# faster than a tokenizing regex on long pasted inputs
+PUNCTUATION = string.punctuation + "×÷’‘“”…–—"
+SPLIT_PUNCTUATION = {ord(char): f" {char} " for char in PUNCTUATION}
+
+def tokenize(text: str) -> List[str]:
+    """Split lowercased text into words and single punctuation marks
+
+    Patterns and inputs share this tokenizer, so word patterns can only match
+    whole words ("add" never matches "address").
+    """
+    return text.lower().translate(SPLIT_PUNCTUATION).split()
+
+class RouteMatch:
+    """A routing pattern found in the input (start/end are token offsets)"""
+
+    __slots__ = ("flow", "pattern", "start", "end", "priority")
+
+    def __init__(self, flow: str, pattern: str, start: int, end: int, priority: int):
+        self.flow = flow
+        self.pattern = pattern
+        self.start = start
+        self.end = end
+        self.priority = priority
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "flow": self.flow,
+            "pattern": self.pattern,
+            "start": self.start,
+            "end": self.end,
+            "priority": self.priority
+        }
+
+class RoutingDecision:
+    """Selected flow plus every match that was considered"""
+
+    def __init__(self, flow: str, matches: List[RouteMatch], matched: bool):
+        self.flow = flow
+        self.matches = matches
+        self.matched = matched
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "flow_type": self.flow,
+            "matched": self.matched,
+            "matches": [match.as_dict() for match in self.matches]
+        }
+
+class FlowRouter:
+    """Routing table compiled into a token-level multi-pattern automaton"""
+
+    def __init__(
+        self,
+        patterns: Dict[str, List[PatternSpec]],
+        priorities: Optional[Dict[str, int]] = None,
+        default_flow: str = "llm"
+    ):
+        self.default_flow = default_flow
+        self.flow_order = {flow: i for i, flow in enumerate(patterns)}
+
+        # Earlier flows win by default, matching the original first-match routing
+        flow_priorities = {flow: len(patterns) - i for i, flow in enumerate(patterns)}
+        flow_priorities.update(priorities or {})
+
+        # Trie over pattern tokens; each node is [children, [(pattern, flow, priority)]]
+        self.trie: Dict[str, list] = {}
+        self.pattern_count = 0
+        for flow, specs in patterns.items():
+            for spec in specs or []:
+                if isinstance(spec, dict):
+                    text, priority = spec["pattern"], spec.get("priority", flow_priorities[flow])
+                else:
+                    text, priority = spec, flow_priorities[flow]
+                self._insert(text, flow, priority)
+
+    def _insert(self, text: str, flow: str, priority: int):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+
+        children = self.trie
+        for token in tokens[:-1]:
+            children = children.setdefault(token, [{}, []])[0]
+        node = children.setdefault(tokens[-1], [{}, []])
+        node[1].append((" ".join(tokens), flow, priority))
+        self.pattern_count += 1
+
+    def matches(self, text: str) -> List[RouteMatch]:
+        """Return every pattern occurrence in the input, in position order"""
+        tokens = tokenize(text)
+        found = []
+        root = self.trie
+        count = len(tokens)
+
+        for start in range(count):
+            node = root.get(tokens[start])
+            if node is None:
+                continue
+            end = start + 1
+            while node is not None:
+                children, terminals = node
+                for pattern, flow, priority in terminals:
+                    found.append(RouteMatch(flow, pattern, start, end, priority))
+                if end == count:
+                    break
+                node = children.get(tokens[end])
+                end += 1
+        return found
+
+    def route(self, text: str) -> RoutingDecision:
+        """Pick a flow by priority, then pattern length, position and flow order"""
+        found = self.matches(text)
+        if not found:
+            return RoutingDecision(self.default_flow, [], matched=False)
+
+        best = min(found, key=self._rank)
+        return RoutingDecision(best.flow, found, matched=True)
+
+    def _rank(self, match: RouteMatch) -> Tuple[int, int, int, int]:
+        return (-match.priority, match.start - match.end, match.start, self.flow_order.get(match.flow, 0))
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# Leading phrases that carry no meaning for cache matching
+FILLER_PREFIXES = [
+    "hey", "hi", "hello", "ok", "okay", "so", "um", "quick question",
+    "please", "kindly", "can you", "could you", "would you", "will you",
+    "can u", "i want to know", "i would like to know", "i'd like to know",
+    "i was wondering", "do you know", "tell me", "let me know", "explain to me",
+    "explain", "describe", "define",
+]
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "of", "to", "in",
+    "on", "for", "and", "or", "it", "its", "this", "that", "me", "my", "i", "you",
+    "your", "do", "does", "did", "what", "whats", "what's", "about", "with", "as", "at", "by",
+}
+
+# Tokens whose presence changes the meaning even when everything else matches
+GUARD_TOKEN = re.compile(r"\d+(?:\.\d+)?|\bnot\b|\bno\b|\bnever\b|\bwithout\b")
+
+# Stopwords that still change who or what a question is about ("my name" vs "your name")
+GUARD_PRONOUNS = {
+    "i", "me", "my", "mine", "we", "us", "our", "you", "your", "yours", "he", "him", "his",
+    "she", "her", "they", "them", "their", "it", "its", "this", "these", "those",
+}
+
+# "was pluto a planet" is not "is pluto a planet"; prompts without these count as present tense
+PAST_AUXILIARIES = {"was", "were", "did", "had"}
+
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+class SemanticMatch:
+    """A stored response whose prompt is close enough to the query"""
+
+    def __init__(self, prompt: str, response: str, similarity: float):
+        self.prompt = prompt
+        self.response = response
+        self.similarity = similarity
+
+class SemanticCache:
+    """Near-duplicate prompt cache over hashed bag-of-features vectors"""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        path: Optional[str] = None,
+        max_entries: int = 5000,
+        dimensions: int = 2 ** 20,
+        max_prompt_chars: int = 2000,
+        save_every: int = 25
+    ):
+        self.threshold = threshold
+        self.path = path
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.max_prompt_chars = max_prompt_chars
+        self.save_every = save_every
+
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._postings: Dict[int, Set[int]] = defaultdict(set)
+        self._next_id = 0
+        self._unsaved = 0
+
+        if path and Path(path).exists():
+            self.load(path)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase, drop punctuation and strip filler prefixes"""
+        text = " ".join(WORD.findall(text.lower().replace("’", "'")))
+        stripped = True
+        while stripped:
+            stripped = False
+            for prefix in FILLER_PREFIXES:
+                if text == prefix or text.startswith(prefix + " "):
+                    text = text[len(prefix):].lstrip()
+                    stripped = True
+        return text
+
+    def embed(self, text: str) -> Dict[int, float]:
+        """Build an L2-normalized sparse vector of word, bigram and char-trigram features"""
+        words = [w for w in self.normalize(text).split() if w not in STOPWORDS]
+        features: Dict[int, float] = defaultdict(float)
+
+        def add(feature: str, weight: float):
+            features[zlib.crc32(feature.encode("utf-8")) % self.dimensions] += weight
+
+        for word in words:
+            add("w:" + word, 1.0)
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                add("c:" + padded[i:i + 3], 0.25)
+        for first, second in zip(words, words[1:]):
+            add(f"b:{first} {second}", 0.5)
+
+        norm = math.sqrt(sum(w * w for w in features.values()))
+        if norm == 0:
+            return {}
+        return {index: weight / norm for index, weight in features.items()}
+
+    def _guard_tokens(self, text: str) -> List[str]:
+        words = self.normalize(text).split()
+        tokens = GUARD_TOKEN.findall(text.lower()) + [w for w in words if w in GUARD_PRONOUNS]
+        if any(w in PAST_AUXILIARIES for w in words):
+            tokens.append("<past>")
+        return sorted(tokens)
+
+    @staticmethod
+    def _same_order(first: List[str], second: List[str]) -> bool:
+        """Whether the words two prompts share appear in the same order in both"""
+        shared = set(first) & set(second)
+        return [w for w in dict.fromkeys(first) if w in shared] == [w for w in dict.fromkeys(second) if w in shared]
+
+    def lookup(self, prompt: str, namespace: str = "") -> Optional[SemanticMatch]:
+        """Return the most similar stored response above the threshold"""
+        if len(prompt) > self.max_prompt_chars or not self._entries:
+            return None
+
+        vector = self.embed(prompt)
+        scores: Dict[int, float] = defaultdict(float)
+        for index, weight in vector.items():
+            for entry_id in self._postings.get(index, ()):
+                scores[entry_id] += weight * self._entries[entry_id]["vector"][index]
+
+        guard = self._guard_tokens(prompt)
+        words = self.normalize(prompt).split()
+        best: Optional[SemanticMatch] = None
+        for entry_id, score in scores.items():
+            if score < self.threshold or (best and score <= best.similarity):
+                continue
+            entry = self._entries[entry_id]
+            if entry["namespace"] != namespace or entry["guard"] != guard:
+                continue
+            # The vector barely changes when words swap places, but "30 celsius to
+            # fahrenheit" and "30 fahrenheit to celsius" ask opposite questions
+            if not self._same_order(words, self.normalize(entry["prompt"]).split()):
+                continue
+            best = SemanticMatch(entry["prompt"], entry["response"], min(score, 1.0))
+        return best
+
+    def add(self, prompt: str, response: str, namespace: str = ""):
+        """Index a prompt/response pair, evicting the oldest beyond capacity"""
+        if len(prompt) > self.max_prompt_chars:
+            return
+
+        vector = self.embed(prompt)
+        if not vector:
+            return
+
+        self._insert({
+            "prompt": prompt,
+            "response": response,
+            "namespace": namespace,
+            "guard": self._guard_tokens(prompt),
+            "vector": vector,
+            "created_at": time.time()
+        })
+
+        while len(self._entries) > self.max_entries:
+            self._remove(min(self._entries))
+
+        self._unsaved += 1
+
+    @property
+    def should_flush(self) -> bool:
+        return bool(self.path) and self._unsaved >= self.save_every
+
+    def _insert(self, entry: Dict[str, Any]):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        for index in entry["vector"]:
+            self._postings[index].add(entry_id)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for index in entry["vector"]:
+            postings = self._postings.get(index)
+            if postings is not None:
+                postings.discard(entry_id)
+                if not postings:
+                    del self._postings[index]
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "version": 1,
+            "dimensions": self.dimensions,
+            "entries": [
+                {**entry, "vector": [[index, weight] for index, weight in entry["vector"].items()]}
+                for _, entry in sorted(self._entries.items())
+            ]
+        }
+
+    @staticmethod
+    def _write(payload: Dict[str, Any], path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(payload, file)
+        os.replace(tmp_path, path)
+
+    def save(self, path: Optional[str] = None):
+        """Persist the index atomically as JSON"""
+        path = path or self.path
+        if path:
+            self._write(self._snapshot(), path)
+            self._unsaved = 0
+
+    async def flush(self):
+        """Persist the index without blocking the event loop on file I/O"""
+        if not self.path:
+            return
+        # Snapshot on the loop so concurrent inserts cannot mutate it mid-write
+        payload = self._snapshot()
+        self._unsaved = 0
+        await asyncio.to_thread(self._write, payload, self.path)
+
+    def load(self, path: str):
+        """Load a previously saved index, ignoring incompatible files"""
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                payload = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if payload.get("version") != 1 or payload.get("dimensions") != self.dimensions:
+            return
+
+        for entry in payload.get("entries", [])[-self.max_entries:]:
+            entry["vector"] = {int(index): weight for index, weight in entry["vector"]}
+            # Files from older versions hold a narrower guard
+            entry["guard"] = self._guard_tokens(entry["prompt"])
+            self._insert(entry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
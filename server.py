@@ -0,0 +1,337 @@
+import asyncio
+import json
+import os
+import signal
+import stat
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Set, Tuple
+
+import metrics
+from state import json_default
+
+if TYPE_CHECKING:
+    from agent import MultiFlowAgent
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+}
+
+class HTTPError(Exception):
+    """An error that maps directly to an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class Request:
+    """A parsed HTTP/1.1 request"""
+
+    __slots__ = ("method", "path", "query", "headers", "body", "keep_alive")
+
+    def __init__(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes, keep_alive: bool):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.keep_alive = keep_alive
+
+    def json(self) -> Dict[str, Any]:
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Request body must be valid JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return payload
+
+def _encode(payload: Any) -> bytes:
+    return json.dumps(payload, default=json_default).encode("utf-8")
+
+class AgentServer:
+    """Keeps one warm agent resident and serves it over HTTP on TCP and/or a Unix socket
+
+    Endpoints:
+        POST /run       {"input": "...", "flow": "math", "stream": false}
+                        streaming responses are chunked NDJSON events
+        GET  /flows     configured flows
+        GET  /metrics   Prometheus text format
+        GET  /healthz   liveness and request counters
+    """
+
+    def __init__(
+        self,
+        agent: "MultiFlowAgent",
+        host: Optional[str] = "127.0.0.1",
+        port: Optional[int] = 8080,
+        socket_path: Optional[str] = None,
+        max_concurrency: int = 64,
+        keepalive_timeout: float = 30.0,
+        shutdown_timeout: float = 30.0,
+        log: Callable[[str], None] = print
+    ):
+        self.agent = agent
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.keepalive_timeout = keepalive_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.log = log
+
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._servers = []
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self._busy: Set[asyncio.StreamWriter] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = asyncio.Event()
+
+        self.started_at = time.time()
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._busy)
+
+    async def run(self, warm: bool = True):
+        """Open agent resources, listen until SIGINT/SIGTERM, then drain and shut down"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stopping.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        async with self.agent:
+            if warm:
+                start = time.perf_counter()
+                skipped = self.agent.warm()
+                # Nodes built by warm() still need their pooled clients opened
+                await self.agent.startup()
+                self.log(f"Warmed {len(self.agent.graphs)} graphs and {len(self.agent.nodes)} nodes in {(time.perf_counter() - start) * 1000:.0f} ms")
+                for node_type, reason in skipped.items():
+                    self.log(f"Skipped {node_type}: {reason}")
+
+            await self.start()
+            try:
+                await self._stopping.wait()
+            finally:
+                await self.stop()
+
+    async def start(self):
+        """Bind the configured listeners"""
+        if self.port is not None:
+            server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+            self._servers.append(server)
+            self.log(f"Listening on http://{self.host}:{self.port}")
+
+        if self.socket_path:
+            self._remove_stale_socket()
+            server = await asyncio.start_unix_server(self._handle_connection, self.socket_path, limit=MAX_HEADER_BYTES)
+            self._servers.append(server)
+            self.log(f"Listening on unix:{self.socket_path}")
+
+        if not self._servers:
+            raise ValueError("Nothing to listen on: set a port and/or a socket path")
+
+    def _remove_stale_socket(self):
+        try:
+            mode = os.stat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise ValueError(f"Refusing to replace non-socket file: {self.socket_path}")
+        os.unlink(self.socket_path)
+
+    async def stop(self):
+        """Stop accepting, let in-flight requests finish, then close every connection"""
+        self.log("Shutting down...")
+        for server in self._servers:
+            server.close()
+
+        # Idle keep-alive connections can go right away
+        for writer in list(self._connections - self._busy):
+            writer.close()
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            self.log(f"Abandoning {self.in_flight} in-flight requests")
+
+        for writer in list(self._connections):
+            writer.close()
+        self._servers.clear()
+
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keepalive_timeout)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+
+                self._busy.add(writer)
+                self._idle.clear()
+                try:
+                    await self._dispatch(request, writer)
+                finally:
+                    self._busy.discard(writer)
+                    if not self._busy:
+                        self._idle.set()
+
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """Read one request; returns None when the client closed the connection"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HTTPError(400, "Incomplete request")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "Request headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise HTTPError(501, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+        path, _, query = target.partition("?")
+        return Request(method.upper(), path, query, headers, body, keep_alive)
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter):
+        self.requests += 1
+        try:
+            if request.path == "/run":
+                if request.method != "POST":
+                    raise HTTPError(405, "Use POST /run")
+                await self._run(request, writer)
+            elif request.path == "/healthz":
+                await self._send_json(writer, 200, self._health(), request.keep_alive)
+            elif request.path == "/metrics":
+                body = metrics.REGISTRY.render().encode("utf-8")
+                writer.write(self._head(200, "text/plain; version=0.0.4; charset=utf-8", request.keep_alive, [("Content-Length", len(body))]) + body)
+                await writer.drain()
+            elif request.path == "/flows":
+                flows = {name: config.get("description", "") for name, config in self.agent.flows.items()}
+                await self._send_json(writer, 200, flows, request.keep_alive)
+            else:
+                raise HTTPError(404, f"Unknown path: {request.path}")
+        except HTTPError as e:
+            self.failures += 1
+            await self._send_json(writer, e.status, {"error": e.message}, request.keep_alive)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            await self._send_json(writer, 500, {"error": str(e)}, request.keep_alive)
+
+    def _health(self) -> Dict[str, Any]:
+        upstreams = self.agent.upstream_status()
+        return {
+            "status": "degraded" if any(upstream["state"] != "closed" for upstream in upstreams.values()) else "ok",
+            "uptime": round(time.time() - self.started_at, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "graphs": sorted(self.agent.graphs),
+            "nodes": sorted(self.agent.nodes),
+            "upstreams": upstreams
+        }
+
+    async def _run(self, request: Request, writer: asyncio.StreamWriter):
+        payload = request.json()
+        user_input = payload.get("input")
+        if not isinstance(user_input, str) or not user_input.strip():
+            raise HTTPError(400, "'input' must be a non-empty string")
+        flow = payload.get("flow")
+        stream = bool(payload.get("stream")) or "stream=1" in request.query or "stream=true" in request.query
+
+        async with self._limit:
+            if stream:
+                await self._stream(writer, user_input, flow, request.keep_alive)
+                return
+            result = await self.agent.execute(user_input, flow)
+
+        if not result.get("success"):
+            self.failures += 1
+        await self._send_json(writer, 200, result, request.keep_alive)
+
+    async def _stream(self, writer: asyncio.StreamWriter, user_input: str, flow: Optional[str], keep_alive: bool):
+        """Send agent events as chunked NDJSON, one event per line"""
+        writer.write(self._head(200, "application/x-ndjson", keep_alive, [("Transfer-Encoding", "chunked")]))
+        events = self.agent.execute_stream(user_input, flow)
+        try:
+            async for event in events:
+                line = _encode(event) + b"\n"
+                writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                await writer.drain()
+        finally:
+            await events.aclose()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _head(status: int, content_type: str, keep_alive: bool, extra: Tuple = ()) -> bytes:
+        lines = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in extra)
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool):
+        body = _encode(payload)
+        writer.write(self._head(status, "application/json", keep_alive, [("Content-Length", len(body))]) + body)
+        await writer.drain()
@@ -0,0 +1,371 @@
+import asyncio
+import sqlite3
+import threading
+import uuid
+import warnings
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata
+)
+from langgraph.graph import END, START, StateGraph
+
+from tokens import TokenCounter
+
+# Folds turns into a summary: (current summary, turns to fold, token budget) -> new summary
+Summarizer = Callable[[str, List[Dict[str, str]], int], Awaitable[str]]
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """LangGraph checkpointer persisted to SQLite, keeping the newest checkpoints per thread
+
+    Older checkpoints and their pending writes are deleted as new ones are
+    saved, so the file grows with the number of threads, not with their history.
+    """
+
+    def __init__(self, path: str, keep: int = 2):
+        super().__init__()
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: Tuple[Any, ...]) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+
+        def config(checkpoint_id: str) -> Dict[str, Any]:
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+        return CheckpointTuple(
+            config=config(checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=config(parent_id) if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((kind, value))) for task_id, channel, kind, value in writes]
+        )
+
+    def get_tuple(self, config: Dict[str, Any]) -> Optional[CheckpointTuple]:
+        """The checkpoint named in config, or the thread's newest one"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = (
+            "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params: List[Any] = [thread_id, checkpoint_ns]
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        with self._lock:
+            # Checkpoint ids are time-ordered, so the newest sorts last
+            row = self._conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", params).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row is not None else None
+
+    def list(
+        self,
+        config: Optional[Dict[str, Any]],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[CheckpointTuple]:
+        """Checkpoints newest first, optionally for one thread, before a checkpoint or matching metadata"""
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config is not None:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before is not None and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY checkpoint_id DESC", params).fetchall()
+            found = []
+            for row in rows:
+                if limit is not None and len(found) >= limit:
+                    break
+                item = self._tuple(row[0], row[1], row[2:])
+                if filter and any(item.metadata.get(key) != value for key, value in filter.items()):
+                    continue
+                found.append(item)
+        yield from found
+
+    def put(
+        self,
+        config: Dict[str, Any],
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> Dict[str, Any]:
+        """Save a checkpoint and drop the thread's checkpoints older than the newest `keep`"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, payload = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_payload = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                    type_, payload, metadata_type, metadata_payload
+                )
+            )
+            oldest_kept = self._conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+                " ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+                (thread_id, checkpoint_ns, self.keep - 1)
+            ).fetchone()
+            if oldest_kept is not None:
+                for table in ("checkpoints", "writes"):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                        (thread_id, checkpoint_ns, oldest_kept[0])
+                    )
+            self._conn.commit()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: Dict[str, Any], writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = ""):
+        """Save a task's intermediate writes against the current checkpoint"""
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, payload = self.serde.dumps_typed(value)
+            rows.append((
+                configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+                task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, payload, task_path
+            ))
+        # Special writes (errors, interrupts) replace earlier ones; regular writes are saved once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+    async def aget_tuple(self, config: Dict[str, Any]) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[Dict[str, Any]],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[CheckpointTuple]:
+        found = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in found:
+            yield item
+
+    async def aput(
+        self,
+        config: Dict[str, Any],
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: Dict[str, Any], writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = ""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SessionState(TypedDict, total=False):
+    """Checkpointed memory of one session"""
+    summary: str
+    turns: List[Dict[str, str]]
+    # Turns folded into the summary so far
+    folded: int
+    # Turn being added by the current update
+    turn: Optional[Dict[str, str]]
+
+class SessionMemory:
+    """Bounded conversation memory per session, checkpointed under the session ID
+
+    The newest keep_turns turns are kept verbatim, each trimmed to turn_tokens;
+    older turns are folded into a rolling summary of about summary_tokens. The
+    context sent with a turn therefore stops growing after keep_turns turns.
+    Updates run in the background once a turn is answered, and the next turn
+    of the same session waits only if its predecessor's update is unfinished.
+    """
+
+    def __init__(
+        self,
+        checkpointer: BaseCheckpointSaver,
+        summarize: Optional[Summarizer] = None,
+        keep_turns: int = 4,
+        turn_tokens: int = 400,
+        summary_tokens: int = 300
+    ):
+        if keep_turns < 1 or turn_tokens < 1 or summary_tokens < 1:
+            raise ValueError("keep_turns, turn_tokens and summary_tokens must be positive")
+        self.checkpointer = checkpointer
+        self.summarize = summarize
+        self.keep_turns = keep_turns
+        self.turn_tokens = turn_tokens
+        self.summary_tokens = summary_tokens
+        self.tokens = TokenCounter()
+        self.last_error: Optional[str] = None
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        graph = StateGraph(SessionState)
+        graph.add_node("remember", self._remember)
+        graph.add_edge(START, "remember")
+        graph.add_edge("remember", END)
+        self.graph = graph.compile(checkpointer=checkpointer)
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def _config(session_id: str) -> Dict[str, Any]:
+        return {"configurable": {"thread_id": session_id}}
+
+    async def load(self, session_id: str) -> Dict[str, Any]:
+        """The session's summary, verbatim turns and folded turn count, after any pending update"""
+        pending = self._pending.get(session_id)
+        if pending is not None:
+            await pending
+        snapshot = await self.graph.aget_state(self._config(session_id))
+        values = snapshot.values or {}
+        return {"summary": values.get("summary", ""), "turns": values.get("turns", []), "folded": values.get("folded", 0)}
+
+    async def context(self, session_id: str) -> Optional[str]:
+        """Conversation so far as prompt text, or None for a new session"""
+        return self.render(await self.load(session_id))
+
+    @staticmethod
+    def render(memory: Dict[str, Any]) -> Optional[str]:
+        parts = []
+        if memory["summary"]:
+            parts.append(f"Summary of the earlier conversation:\n{memory['summary']}")
+        if memory["turns"]:
+            parts.append("Recent conversation:\n" + "\n".join(
+                f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in memory["turns"]
+            ))
+        return "\n\n".join(parts) or None
+
+    def remember(self, session_id: str, user_input: str, answer: str):
+        """Add a finished turn to the session in the background"""
+        turn = {
+            "user": self.tokens.trim_middle(user_input, self.turn_tokens),
+            "assistant": self.tokens.trim_middle(answer, self.turn_tokens)
+        }
+        previous = self._pending.get(session_id)
+        task = asyncio.create_task(self._update(session_id, turn, previous))
+        self._pending[session_id] = task
+        task.add_done_callback(lambda _: self._pending.pop(session_id) if self._pending.get(session_id) is task else None)
+
+    async def _update(self, session_id: str, turn: Dict[str, str], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await previous
+        try:
+            await self.graph.ainvoke({"turn": turn}, self._config(session_id))
+        except Exception as e:
+            # A lost turn only shortens the context; the session itself keeps working
+            self.last_error = str(e)
+            warnings.warn(f"Session memory update failed: {e}")
+
+    async def _remember(self, state: SessionState) -> Dict[str, Any]:
+        """Append the new turn and fold the turns beyond keep_turns into the summary"""
+        turns = list(state.get("turns") or []) + [state["turn"]]
+        folded = turns[:-self.keep_turns]
+        summary = state.get("summary", "")
+        if folded:
+            summary = await self._fold(summary, folded)
+        return {"summary": summary, "turns": turns[len(folded):], "folded": state.get("folded", 0) + len(folded), "turn": None}
+
+    async def _fold(self, summary: str, turns: List[Dict[str, str]]) -> str:
+        if self.summarize is not None:
+            try:
+                updated = (await self.summarize(summary, turns, self.summary_tokens)).strip()
+                if updated:
+                    return self.tokens.trim_middle(updated, self.summary_tokens)
+            except Exception as e:
+                self.last_error = f"summary: {e}"
+
+        # Without a model, keep each question and the opening of its answer
+        lines = [summary] if summary else []
+        for turn in turns:
+            answer = turn["assistant"].strip().split("\n", 1)[0]
+            lines.append(f"- {turn['user']}: {self.tokens.trim_middle(answer, 40)}")
+        return self.tokens.trim_middle("\n".join(lines), self.summary_tokens)
+
+    async def close(self):
+        """Finish pending updates and close the checkpointer"""
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        close = getattr(self.checkpointer, "close", None)
+        if close is not None:
+            close()
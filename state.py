@@ -1,5 +1,5 @@
-from typing import Any, Dict, List, Optional, TypedDict, Literal
-from pydantic import BaseModel, Field
+from typing import Annotated, Any, Dict, List, Optional, TypedDict, Literal
+from dataclasses import asdict, dataclass, field, is_dataclass
 from enum import Enum
 
 class FlowType(str, Enum):
@@ -7,6 +7,8 @@ class FlowType(str, Enum):
     SEARCH = "search"
     LLM = "llm" 
     MATH = "math"
+    RESEARCH = "research"
+    READ = "read"
 
 class NodeStatus(str, Enum):
     """Node execution status"""
@@ -15,26 +17,49 @@ class NodeStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
-class ExecutionContext(BaseModel):
+# Records created inside the graph are slotted dataclasses, which skip pydantic's
+# validation; MultiFlowAgent converts them to plain dicts for the public result
+
+@dataclass(slots=True)
+class ExecutionContext:
     """Shared execution context across nodes"""
     flow_id: str
     node_id: str
     timestamp: float
-    metadata: Dict[str, Any] = Field(default_factory=dict)
+    metadata: Dict[str, Any] = field(default_factory=dict)
 
-class ValidationResult(BaseModel):
+@dataclass(slots=True)
+class ValidationResult:
     """Result of input validation"""
     is_valid: bool
-    errors: List[str] = Field(default_factory=list)
-    warnings: List[str] = Field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {"is_valid": self.is_valid, "errors": self.errors, "warnings": self.warnings}
 
-class NodeResult(BaseModel):
+@dataclass(slots=True)
+class NodeResult:
     """Standard result format for all nodes"""
     success: bool
     data: Any = None
     error: Optional[str] = None
     execution_time: float = 0.0
     context: Optional[ExecutionContext] = None
+    
+    # Streaming metrics, set by nodes that stream tokens
+    time_to_first_token: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+
+def merge_dicts(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Reducer for per-node maps, so parallel branches can write them in the same step"""
+    return {**left, **right}
+
+def json_default(value: Any) -> Any:
+    """Serialize state dataclasses and other non-JSON values in JSON output"""
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    return str(value)
 
 class AgentState(TypedDict):
     """Main state object that flows through the graph"""
@@ -46,7 +71,7 @@ class AgentState(TypedDict):
     # Execution tracking
     current_node: str
     execution_context: ExecutionContext
-    node_results: Dict[str, NodeResult]
+    node_results: Annotated[Dict[str, NodeResult], merge_dicts]
     
     # Results
     final_output: Optional[str]
@@ -54,4 +79,13 @@ class AgentState(TypedDict):
     
     # Routing and validation
     routing_decision: Dict[str, Any]
-    validation_results: Dict[str, ValidationResult]
\ No newline at end of file
+    validation_results: Annotated[Dict[str, ValidationResult], merge_dicts]
+    
+    # Result cache status per node ("miss", "hit (memory)", "hit (disk)")
+    cache_status: Annotated[Dict[str, str], merge_dicts]
+    
+    # Whether nodes should stream partial output through the graph
+    stream: bool
+    
+    # Summary and recent turns of the session this request belongs to
+    conversation: Optional[str]
@@ -0,0 +1,55 @@
+import math
+import re
+
+import pytest
+
+from expressions import ExpressionError, compile_template, parse
+
+@pytest.mark.parametrize("text, value", [
+    ("15 + 25 * 3", 90.0),
+    ("(15 + 25) * 3", 120.0),
+    ("10 - 4 - 3", 3.0),
+    ("2 ^ 3 ^ 2", 512.0),
+    ("2 ** 10", 1024.0),
+    ("-2 ^ 2", -4.0),
+    ("7 % 4", 3.0),
+    ("6 ÷ 4 × 2", 3.0),
+    ("sqrt(16) + abs(-3)", 7.0),
+    ("max(3, 9, 4) - min(2, 1)", 8.0),
+    ("2 * pi", 2 * math.pi),
+    ("1.5e3 / .5", 3000.0)
+])
+def test_precedence_functions_and_constants(text, value):
+    assert parse(text).evaluate() == pytest.approx(value)
+
+def test_numbers_share_a_compiled_template():
+    first, second = parse("2 + 3 * 4"), parse("70 + 1 * 9")
+    assert first.compiled is second.compiled
+    assert (first.evaluate(), second.evaluate()) == (14.0, 79.0)
+    assert compile_template(first.compiled.template) is first.compiled
+
+def test_variables_bind_scalars_and_arrays():
+    expression = parse("a * x + b")
+    assert expression.variables == ("a", "x", "b")
+    assert expression.evaluate({"a": 2, "x": 3, "b": 1}) == 7.0
+    assert expression.evaluate({"a": [1, 2, 3], "x": 2, "b": 1}) == [3.0, 5.0, 7.0]
+
+@pytest.mark.parametrize("text, bindings, message", [
+    ("1 / 0", {}, "Division by zero"),
+    ("x + 1", {}, "Unbound variables: x"),
+    ("(5 - 2", {}, "Expected ')'"),
+    ("5 +", {}, "ended unexpectedly"),
+    ("sqrt 4", {}, "must be called with parentheses"),
+    ("2 $ 3", {}, "Unexpected character"),
+    ("10 ^ 400", {}, "too large"),
+    ("1 / x", {"x": [1, 0]}, "Math error")
+])
+def test_errors_are_expression_errors(text, bindings, message):
+    with pytest.raises(ExpressionError, match=re.escape(message)):
+        parse(text).evaluate(bindings)
+
+def test_generated_source_only_uses_validated_names():
+    # Python keywords and dunder lookups never reach the compiled lambda
+    for text in ("__import__('os')", "lambda + 1", "(1).real"):
+        with pytest.raises(ExpressionError):
+            parse(text).evaluate()
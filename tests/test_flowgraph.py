@@ -0,0 +1,77 @@
+import pytest
+import yaml
+
+from flowgraph import FlowPlan, JoinProgress
+
+def _flow(*nodes, entry=None):
+    config = {"nodes": [{"name": name, **options} for name, options in nodes]}
+    if entry is not None:
+        config["entry"] = entry
+    return config
+
+def test_configured_flows_are_valid():
+    with open("configs/flows.yaml", encoding="utf-8") as file:
+        flows = yaml.safe_load(file)["flows"]
+    plans = {name: FlowPlan(name, config) for name, config in flows.items()}
+    assert plans["research"].joins
+
+def test_fork_and_join():
+    plan = FlowPlan("test", _flow(
+        ("input", {"next": ["search", "llm"]}),
+        ("search", {"next": "rank"}),
+        ("rank", {"next": "merge"}),
+        ("llm", {"next": "merge"}),
+        ("merge", {"next": "output"}),
+        ("output", {})
+    ))
+    assert plan.entry == ["input"]
+    assert plan.joins == {"merge": 2}
+    assert plan.branches == {"search": ("merge", "search"), "rank": ("merge", "search"), "llm": ("merge", "llm")}
+    assert [name for name in plan.order if plan.is_tail(name)] == ["rank", "llm"]
+
+def test_parallel_entry_with_quorum_join():
+    plan = FlowPlan("test", _flow(
+        ("a", {"next": "merge"}),
+        ("b", {"next": "merge"}),
+        ("c", {"next": "merge"}),
+        ("merge", {"join": 2}),
+        entry=["a", "b", "c"]
+    ))
+    assert plan.joins == {"merge": 2}
+    assert set(plan.branches) == {"a", "b", "c"}
+
+@pytest.mark.parametrize("config, message", [
+    ({"nodes": []}, "has no nodes"),
+    (_flow(("a", {"next": "b"}), ("a", {})), "duplicate node names"),
+    (_flow(("a", {"next": "missing"})), "unknown node: missing"),
+    (_flow(("a", {"next": "b"}), ("b", {"next": "a"})), "cycle through node"),
+    (_flow(("a", {"next": "b"}), ("b", {"join": 1})), "only one predecessor"),
+    (_flow(("a", {"next": ["b", "c"]}), ("b", {"next": "d"}), ("c", {"next": "d"}), ("d", {"join": 3})), "join must be 'all' or 1..2"),
+    (_flow(
+        ("a", {"next": ["b", "c"]}), ("b", {"next": ["d", "e"]}), ("c", {"next": "e"}), ("d", {"next": "e"}), ("e", {})
+    ), "must be a chain ending at a join node"),
+    (_flow(
+        ("a", {"next": ["b", "c"]}), ("b", {"next": "d"}), ("c", {"next": "e"}),
+        ("x", {"next": "d"}), ("y", {"next": "e"}), ("d", {}), ("e", {})
+    ), "must meet at one join node")
+])
+def test_invalid_flows_are_rejected(config, message):
+    with pytest.raises(ValueError, match=message):
+        FlowPlan("test", config)
+
+def test_join_waits_for_every_branch():
+    progress = JoinProgress(branches=2, required=2)
+    assert not progress.racing
+    progress.finish("search")
+    assert progress.is_open("llm") and not progress.satisfied.is_set()
+    progress.finish("llm", error="timeout")
+    assert not progress.is_open("llm")
+    assert progress.error() == "1 of 2 required branches succeeded (llm: timeout)"
+
+def test_quorum_join_closes_slower_branches():
+    progress = JoinProgress(branches=3, required=1)
+    assert progress.racing
+    progress.finish("a")
+    assert progress.satisfied.is_set()
+    assert not progress.is_open("b")
+    assert progress.error() is None
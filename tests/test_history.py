@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import history
+
+def _insert(path: str, rows):
+    conn = history.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO executions VALUES (?, ?, ?, ?, ?, '', NULL, '{}')",
+            [(f"id-{i}", *row) for i, row in enumerate(rows)]
+        )
+    conn.close()
+
+@pytest.mark.parametrize("text, seconds", [("90s", 90), ("15m", 900), ("1.5h", 5400), ("7d", 604800), (" 2W ", 1209600)])
+def test_parse_duration(text, seconds):
+    assert history.parse_duration(text) == seconds
+
+@pytest.mark.parametrize("text", ["0s", "0.0h", "15", "m", "-1h", "1y"])
+def test_parse_duration_rejects(text):
+    with pytest.raises(ValueError):
+        history.parse_duration(text)
+
+def test_window_stats_match_numpy_percentiles(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    durations = [float(value) for value in np.random.default_rng(3).integers(1, 1000, 37)]
+    # Two 60s windows for math (one failure in the first) and one llm request
+    rows = [(60.0 + i, "math", int(i != 5), duration) for i, duration in enumerate(durations)]
+    rows += [(125.0, "math", 1, 10.0), (61.0, "llm", 1, 500.0)]
+    _insert(path, rows)
+
+    stats = history.window_stats(path, window=60, since=0)
+    assert [(row["window_start"], row["name"], row["requests"]) for row in stats] == [
+        (60.0, "llm", 1), (60.0, "math", 37), (120.0, "math", 1)
+    ]
+    first = stats[1]
+    assert first["errors"] == 1 and first["error_rate"] == pytest.approx(1 / 37)
+    assert first["mean_ms"] == pytest.approx(np.mean(durations))
+    for key, q in history.PERCENTILES.items():
+        assert first[key] == pytest.approx(np.percentile(durations, q * 100))
+    assert stats[2]["p99_ms"] == 10.0
+
+def test_window_stats_filters(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    _insert(path, [(100.0, "math", 1, 1.0), (200.0, "llm", 1, 2.0), (300.0, "math", 1, 3.0)])
+    assert [row["window_start"] for row in history.window_stats(path, 3600, since=150, flow="math")] == [0.0]
+    assert history.window_stats(path, 3600, since=150, flow="math")[0]["requests"] == 1
+    with pytest.raises(ValueError):
+        history.window_stats(path, 0, since=0)
+
+def test_recorded_executions_are_written_on_close(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    store = history.HistoryStore(path, flush_interval=60)
+    result = {
+        "flow_id": "abc", "success": False, "error": "boom", "cache_status": {"math": "miss"},
+        "node_results": {"math": {"success": False, "execution_time": 0.002, "error": "boom"}}
+    }
+    store.record("1 / 0", "math", result, duration=0.005)
+    store.close()
+
+    [row] = history.recent(path)
+    assert (row["flow_id"], row["flow"], row["success"], row["error"]) == ("abc", "math", False, "boom")
+    assert row["cache"] == {"math": "miss"}
+    assert [(node["node"], node["cache_status"]) for node in row["nodes"]] == [("math", "miss")]
+    assert store.written == 1
+
+    [stats] = history.window_stats(path, 60, since=0, by_node=True)
+    assert stats["name"] == "math / math" and stats["errors"] == 1
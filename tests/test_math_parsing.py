@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from agent import MultiFlowAgent
+from expressions import parse
+
+@pytest.fixture(scope="module")
+def agent():
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("AGENT_HISTORY", "false")
+        patch.setenv("AGENT_TRACE", "false")
+        yield MultiFlowAgent()
+
+@pytest.mark.parametrize("user_input, expression, result", [
+    ("calculate 6 / 2 for me", "6 / 2", 3.0),
+    ("compute 10 - 4 please", "10 - 4", 6.0),
+    ("what's 9 - 4 exactly", "9 - 4", 5.0),
+    ("calculate 100 / 7 and round", "100 / 7", 100 / 7),
+    ("what is 2 * pi roughly", "2 * pi", 2 * 3.141592653589793),
+    ("calculate 15 + 25 * 3", "15 + 25 * 3", 90.0)
+])
+def test_expression_inside_words_is_evaluated(agent, user_input, expression, result):
+    parsed = agent._parse_math_input(user_input)
+    assert parsed == {"operation": "evaluate", "expression": expression, "variables": {}}
+
+    assert parse(expression).evaluate() == pytest.approx(result)
+
+    outcome = asyncio.run(agent.execute(user_input, "math"))
+    assert outcome["success"]
+    assert f"Expression: {expression} = " in outcome["output"]
+
+@pytest.mark.parametrize("user_input", ["calculate (5-2", "calculate 5 +"])
+def test_unparseable_operator_is_an_error(agent, user_input):
+    result = asyncio.run(agent.execute(user_input, "math"))
+    assert not result["success"]
+    assert "Validation failed" in result["error"]
+
+@pytest.mark.parametrize("user_input, parsed", [
+    ("add 5 and 3", {"operation": "add", "operands": [5.0, 3.0]}),
+    ("divide 1024 by 32", {"operation": "divide", "operands": [1024.0, 32.0]}),
+    ("min of 3, -1, 5", {"operation": "min", "operands": [3.0, -1.0, 5.0]}),
+    ("mean of data-2024.csv", {"operation": "mean", "source": "data-2024.csv"}),
+    ("[1,2] dot [3,4]", {"operation": "dot", "vectors": [[1.0, 2.0], [3.0, 4.0]]})
+])
+def test_word_problems_and_reductions_keep_their_operation(agent, user_input, parsed):
+    assert agent._parse_math_input(user_input) == parsed
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from agent import MultiFlowAgent
+from nodes.math_node import MathNode
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_HISTORY", "false")
+    monkeypatch.setenv("AGENT_TRACE", "false")
+    monkeypatch.setenv("MATH_DATA_DIR", str(tmp_path))
+    (tmp_path / "header.csv").write_text("value\n1\n2\n3\n")
+    (tmp_path / "columns.csv").write_text("1,4\n2,5\n3,6\n")
+    np.save(tmp_path / "range.npy", np.arange(5.0))
+    return tmp_path
+
+def _run(user_input: str) -> dict:
+    return asyncio.run(MultiFlowAgent().execute(user_input, "math"))
+
+@pytest.mark.parametrize("user_input, expected", [
+    ("sum of {dir}/header.csv", "Expression: sum(1.0, 2.0, 3.0) = 6.0"),
+    ("mean of {dir}/range.npy", "Expression: mean(0.0, 1.0, 2.0, 3.0, 4.0) = 2.0"),
+    ("dot of {dir}/columns.csv", "Expression: [1.0, 2.0, 3.0] · [4.0, 5.0, 6.0] = 32.0"),
+    ("add {dir}/columns.csv", "Expression: [1.0, 2.0, 3.0] + [4.0, 5.0, 6.0] = [5.0, 7.0, 9.0]")
+])
+def test_operands_are_read_from_files(data_dir, user_input, expected):
+    result = _run(user_input.format(dir=data_dir))
+    assert result["success"], result["error"]
+    assert expected in result["output"]
+
+def test_missing_file_is_an_error(data_dir):
+    result = _run(f"sum of {data_dir}/missing.csv")
+    assert not result["success"]
+    assert "missing.csv not found" in result["error"]
+
+def test_operand_limit_applies_to_files(data_dir, monkeypatch):
+    monkeypatch.setenv("MATH_MAX_OPERANDS", "4")
+    result = _run(f"sum of {data_dir}/range.npy")
+    assert not result["success"]
+    assert "Too many operands: 5" in result["error"]
+
+def test_symlinks_cannot_leave_the_data_dir(tmp_path):
+    (tmp_path / "secret.csv").write_text("42\n")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "link.csv").symlink_to(tmp_path / "secret.csv")
+    node = MathNode(data_dir=str(tmp_path / "data"))
+    with pytest.raises(ValueError, match="Operand file must be inside"):
+        node._load_source(str(tmp_path / "data" / "link.csv"))
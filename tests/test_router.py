@@ -0,0 +1,55 @@
+import pytest
+import yaml
+
+from router import FlowRouter, tokenize
+
+@pytest.fixture(scope="module")
+def router():
+    with open("configs/flows.yaml", encoding="utf-8") as file:
+        routing = yaml.safe_load(file)["routing"]
+    return FlowRouter(routing["patterns"], priorities=routing["priorities"])
+
+@pytest.mark.parametrize("text, flow", [
+    ("search for latest AI news", "search"),
+    ("explain quantum computing", "llm"),
+    ("calculate 15 + 25 * 3", "math"),
+    ("what is the mean of 2 4 6", "math"),
+    ("what is the news? search for it", "search"),
+    ("research the history of rome", "research"),
+    ("read up on rust lifetimes", "read"),
+    ("hello there", "llm")
+])
+def test_configured_routes(router, text, flow):
+    assert router.route(text).flow == flow
+
+def test_words_only_match_whole_tokens(router):
+    assert tokenize("Add 2+2, please!") == ["add", "2", "+", "2", ",", "please", "!"]
+    decision = router.route("my address")
+    assert not decision.matched and decision.flow == "llm"
+
+def test_priority_beats_position_and_length():
+    router = FlowRouter({"a": ["tell me about"], "b": [{"pattern": "news", "priority": 10}]})
+    decision = router.route("tell me about the news")
+    assert decision.flow == "b"
+    assert [match.pattern for match in decision.matches] == ["tell me about", "news"]
+
+@pytest.mark.parametrize("text, flow", [
+    # Equal priorities: the longer pattern wins, then the earlier one, then flow order
+    ("look up the weather", "long"),
+    ("weather and look", "early"),
+    ("shared", "first")
+])
+def test_priority_ties(text, flow):
+    patterns = {
+        "first": ["shared"],
+        "early": ["weather"],
+        "long": ["look up the"],
+        "late": ["look", "shared"]
+    }
+    router = FlowRouter(patterns, priorities={flow: 1 for flow in patterns})
+    assert router.route(text).flow == flow
+
+def test_earlier_flows_win_by_default():
+    router = FlowRouter({"first": ["x"], "second": ["x"]})
+    assert router.route("x").flow == "first"
+    assert [match.priority for match in router.route("x").matches] == [2, 1]
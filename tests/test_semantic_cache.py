@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from semantic_cache import SemanticCache
+
+@pytest.mark.parametrize("cached, query", [
+    ("convert 30 celsius to fahrenheit", "convert 30 fahrenheit to celsius"),
+    ("is a larger than b", "is b larger than a"),
+    ("difference between tcp and udp", "difference between udp and tcp")
+])
+def test_reversed_prompt_is_not_served(cached, query):
+    # Below the default threshold, so only the word order check rejects them
+    cache = SemanticCache(threshold=0.9)
+    cache.add(cached, "cached answer")
+    assert cache.lookup(query) is None
+
+@pytest.mark.parametrize("cached, query", [
+    ("what is quantum computing", "Explain quantum computing?"),
+    ("tell me about the history of rome", "what is the history of rome"),
+    ("convert 30 celsius to fahrenheit", "Could you convert 30 celsius to fahrenheit?")
+])
+def test_near_duplicate_prompt_is_served(cached, query):
+    cache = SemanticCache()
+    cache.add(cached, "cached answer")
+    match = cache.lookup(query)
+    assert match is not None and match.response == "cached answer"
+
+def test_numbers_and_negations_must_match():
+    cache = SemanticCache()
+    cache.add("is 17 a prime number", "yes")
+    cache.add("should i use threads", "maybe")
+    assert cache.lookup("is 18 a prime number") is None
+    assert cache.lookup("should i not use threads") is None
+
+@pytest.mark.parametrize("cached, query", [
+    ("is pluto a planet", "was pluto a planet"),
+    ("who is the president of the us", "who was the president of the us"),
+    ("what is my name", "what is your name"),
+    ("what did i say", "what did you say"),
+    ("convert this to json", "convert it to json")
+])
+def test_tense_and_pronouns_must_match(cached, query):
+    # These differ only in stopwords, so their vectors are identical
+    cache = SemanticCache(threshold=0.5)
+    cache.add(cached, "cached answer")
+    assert cache.lookup(query) is None
+
+def test_loaded_entries_use_the_current_guard(tmp_path):
+    path = tmp_path / "semantic_cache.json"
+    cache = SemanticCache(path=str(path))
+    cache.add("was pluto a planet", "yes")
+    cache.save()
+    # Files written before tense was guarded stored an empty guard here
+    payload = json.loads(path.read_text())
+    payload["entries"][0]["guard"] = []
+    path.write_text(json.dumps(payload))
+
+    loaded = SemanticCache(path=str(path))
+    assert loaded.lookup("is pluto a planet") is None
+    assert loaded.lookup("was pluto a planet").response == "yes"
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from agent import MultiFlowAgent
+from server import AgentServer, _encode
+from state import NodeResult
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_HISTORY", "false")
+    monkeypatch.setenv("AGENT_TRACE", "false")
+    monkeypatch.setenv("MATH_DATA_DIR", str(tmp_path / "data"))
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "values.csv").write_text("1\n2\n3\n")
+    (tmp_path / "secret.csv").write_text("40\n2\n")
+    return tmp_path / "data"
+
+async def _exchange(raw: bytes):
+    """Send one raw request to a fresh server and return the status and JSON body"""
+    server = AgentServer(MultiFlowAgent(), port=0, log=lambda message: None)
+    await server.start()
+    try:
+        port = server._servers[0].sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+    finally:
+        await server.stop()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(body)
+
+def _post(payload) -> bytes:
+    body = json.dumps(payload).encode("utf-8")
+    return b"POST /run HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+def test_healthz(data_dir):
+    status, body = asyncio.run(_exchange(b"GET /healthz HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert status == 200
+    assert body["status"] == "ok" and body["requests"] == 1
+
+@pytest.mark.parametrize("raw, message", [
+    (b"POST /run HTTP/1.1\r\nContent-Length: -1\r\n\r\n", "Invalid Content-Length"),
+    (b"POST /run HTTP/1.1\r\nConnection: close\r\nContent-Length: 2\r\n\r\n[]", "must be a JSON object"),
+    (b"GET /run HTTP/1.1\r\nConnection: close\r\n\r\n", "Use POST /run"),
+    (b"GET /nope HTTP/1.1\r\nConnection: close\r\n\r\n", "Unknown path")
+])
+def test_bad_requests_are_rejected(data_dir, raw, message):
+    status, body = asyncio.run(_exchange(raw))
+    assert status in (400, 404, 405)
+    assert message in body["error"]
+
+def test_run_reads_files_inside_the_data_dir(data_dir):
+    status, body = asyncio.run(_exchange(_post({"input": f"sum of {data_dir / 'values.csv'}", "flow": "math"})))
+    assert status == 200 and body["success"]
+    assert "6" in body["output"]
+
+@pytest.mark.parametrize("source", ["{root}/secret.csv", "{data}/../secret.csv", "{relative}"])
+def test_run_rejects_files_outside_the_data_dir(data_dir, source):
+    # Relative paths resolve against the working directory
+    relative = os.path.relpath(data_dir.parent / "secret.csv")
+    source = source.format(root=data_dir.parent, data=data_dir, relative=relative)
+    status, body = asyncio.run(_exchange(_post({"input": f"max of {source}", "flow": "math"})))
+    assert status == 200 and not body["success"]
+    assert "Operand file must be inside" in body["error"]
+    assert "40" not in body.get("output", "")
+
+def test_empty_data_dir_disables_files(data_dir, monkeypatch):
+    monkeypatch.setenv("MATH_DATA_DIR", "")
+    status, body = asyncio.run(_exchange(_post({"input": f"sum of {data_dir / 'values.csv'}", "flow": "math"})))
+    assert not body["success"]
+    assert "Operand files are disabled" in body["error"]
+
+def test_state_dataclasses_are_serialized():
+    payload = json.loads(_encode({"result": NodeResult(success=True, data={"value": 6})}))
+    assert payload["result"]["success"] is True
+    assert payload["result"]["data"] == {"value": 6}
@@ -0,0 +1,178 @@
+import asyncio
+import random
+from typing import Optional
+
+import pytest
+
+from upstream import CircuitBreaker, CircuitOpenError, Hedger, RetryPolicy, UpstreamLimiter
+from upstream.limits import AdaptiveConcurrency, TokenBucket
+
+class StatusError(Exception):
+    """An upstream error carrying an HTTP status, like httpx.HTTPStatusError"""
+
+    def __init__(self, status_code: int, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+class Flaky:
+    """An upstream call that raises the given errors in turn, then succeeds"""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+def _policy(**options) -> RetryPolicy:
+    return RetryPolicy(base_delay=0.001, max_delay=0.002, rng=random.Random(7), **options)
+
+# Retries
+
+@pytest.mark.parametrize("error, retryable", [
+    (StatusError(503), True),
+    (StatusError(429), True),
+    (StatusError(400), False),
+    (StatusError(404), False),
+    (ConnectionResetError(), True),
+    (asyncio.TimeoutError(), True),
+    (ValueError("bad input"), False)
+])
+def test_only_transient_errors_are_retried(error, retryable):
+    assert RetryPolicy().is_retryable(error) is retryable
+
+def test_backoff_has_full_jitter_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0, rng=random.Random(1))
+    for retry in range(6):
+        assert 0 <= policy.backoff(retry) <= min(5.0, 2.0 ** retry)
+    assert policy.backoff(0, StatusError(429, retry_after="3")) >= 3.0
+    assert policy.backoff(0, StatusError(429, retry_after="60")) <= 5.0
+
+def test_transient_failures_are_retried_until_success():
+    attempt = Flaky(StatusError(503), ConnectionResetError())
+    assert asyncio.run(_policy().run("test", attempt)) == "ok"
+    assert attempt.calls == 3
+
+@pytest.mark.parametrize("policy, errors, calls", [
+    (_policy(max_retries=2), [StatusError(503)] * 5, 3),
+    (_policy(), [StatusError(400)], 1),
+    (_policy(max_elapsed=0), [StatusError(503)] * 5, 1)
+])
+def test_retries_stop(policy, errors, calls):
+    attempt = Flaky(*errors)
+    with pytest.raises(StatusError):
+        asyncio.run(policy.run("test", attempt))
+    assert attempt.calls == calls
+
+def test_slow_calls_are_hedged():
+    hedger = Hedger(min_samples=1, min_delay=0.01, max_ratio=1.0)
+    hedger.latencies.append(0.01)
+    delays = [0.5, 0.0]
+
+    async def attempt():
+        await asyncio.sleep(delays.pop(0))
+        return "ok"
+
+    assert asyncio.run(hedger.run("test", attempt)) == "ok"
+    assert (hedger.hedged, hedger.hedge_wins) == (1, 1)
+
+# Limits
+
+def test_token_bucket_allows_bursts_then_spaces_calls():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+def test_concurrency_limit_queues_in_arrival_order():
+    async def scenario():
+        limit = AdaptiveConcurrency(initial=1, max_limit=1)
+        order = []
+
+        async def call(name):
+            await limit.acquire()
+            order.append(name)
+            await asyncio.sleep(0)
+            limit.release(0.01, False)
+
+        await asyncio.gather(*(call(name) for name in "abc"))
+        return order, limit.in_flight
+
+    assert asyncio.run(scenario()) == (["a", "b", "c"], 0)
+
+def test_concurrency_limit_is_aimd():
+    limit = AdaptiveConcurrency(initial=4, min_limit=1, max_limit=8)
+    limit.in_flight = 4
+    limit.release(0.01, False)
+    assert limit.limit == pytest.approx(4.25)
+    limit.in_flight = 1
+    limit.release(0.01, True)
+    assert limit.limit == pytest.approx(2.125)
+    assert limit.decreases == 1
+
+def test_limiter_backs_off_on_overload_statuses():
+    limiter = UpstreamLimiter("test", concurrency={"initial": 8})
+
+    async def overloaded():
+        async with limiter.slot():
+            raise StatusError(429)
+
+    with pytest.raises(StatusError):
+        asyncio.run(overloaded())
+    assert limiter.stats()["concurrency_limit"] == 4
+    assert limiter.stats()["in_flight"] == 0
+
+# Circuit breaker
+
+def _call(breaker: CircuitBreaker, error: Optional[Exception] = None):
+    async def guarded():
+        async with breaker.guard():
+            if error is not None:
+                raise error
+    return asyncio.run(guarded())
+
+def test_breaker_opens_after_consecutive_failures_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=3, min_calls=100)
+    for _ in range(3):
+        with pytest.raises(StatusError):
+            _call(breaker, StatusError(503))
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError, match="3 consecutive failures"):
+        _call(breaker)
+    assert breaker.rejected == 1
+
+def test_breaker_opens_on_failure_rate():
+    breaker = CircuitBreaker("test", failure_threshold=100, failure_rate=0.5, window=4, min_calls=4)
+    # The rate is checked when a failure is recorded
+    for error in (None, StatusError(503), None, StatusError(503)):
+        try:
+            _call(breaker, error)
+        except StatusError:
+            pass
+    assert breaker.state == "open" and breaker.reason == "2 failures in 4 calls"
+
+def test_client_errors_do_not_open_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(StatusError):
+        _call(breaker, StatusError(404))
+    assert breaker.state == "closed"
+
+def test_half_open_probe_closes_or_reopens_with_longer_timeout():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=1.0, max_reset_timeout=3.0)
+    with pytest.raises(StatusError):
+        _call(breaker, StatusError(500))
+
+    # Let the reset timeout lapse; the next call is a probe
+    breaker.opened_at -= 1.0
+    with pytest.raises(StatusError):
+        _call(breaker, StatusError(500))
+    assert breaker.state == "open" and breaker.open_for == 2.0
+
+    breaker.opened_at -= 2.0
+    _call(breaker)
+    assert breaker.state == "closed" and breaker.open_for == 1.0
@@ -0,0 +1,85 @@
+import math
+import re
+from typing import Any, Optional, Tuple
+
+# Pieces a subword tokenizer rarely merges across: ASCII letter runs, single
+# letters of other scripts, single digits and single symbols. Whitespace is
+# folded into the neighbouring piece, as SentencePiece does.
+PIECE = re.compile(r"[A-Za-z]+|[^\W\d_]|\d|[^\w\s]")
+
+# Letter runs up to this length are usually one token; longer ones split
+# into pieces of roughly LETTERS_PER_TOKEN characters
+WHOLE_WORD_LETTERS = 7
+LETTERS_PER_TOKEN = 5
+
+OMITTED = "\n\n[... {tokens} tokens omitted ...]\n\n"
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate for text, without any model's vocabulary"""
+    count = 0
+    for piece in PIECE.findall(text):
+        length = len(piece)
+        count += 1 if length <= WHOLE_WORD_LETTERS else -(-length // LETTERS_PER_TOKEN)
+    return count
+
+def usage_tokens(usage: Any) -> Optional[Tuple[int, int]]:
+    """(input, output) tokens from a LangChain usage_metadata dict, when the provider reported both"""
+    if not usage:
+        return None
+    input_tokens, output_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+    if not isinstance(input_tokens, int) or not isinstance(output_tokens, int):
+        return None
+    return input_tokens, output_tokens
+
+class TokenCounter:
+    """Token estimates for one model, corrected by the usage the provider reports
+
+    Every response that carries usage metadata updates a running ratio of the
+    provider's input token count to the local estimate for the same prompt, so
+    budgets follow the model's real tokenizer after a few calls.
+    """
+
+    def __init__(self, smoothing: float = 0.2, min_ratio: float = 0.5, max_ratio: float = 2.0):
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing must be between 0 and 1")
+        self.smoothing = smoothing
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.ratio = 1.0
+        self.observed = 0
+
+    def estimate(self, text: str) -> int:
+        return math.ceil(estimate_tokens(text) * self.ratio)
+
+    def observe(self, text: str, input_tokens: int):
+        """Calibrate against the provider's input token count for a prompt"""
+        raw = estimate_tokens(text)
+        if raw <= 0 or input_tokens <= 0:
+            return
+        sample = min(self.max_ratio, max(self.min_ratio, input_tokens / raw))
+        self.ratio = sample if self.observed == 0 else self.ratio + self.smoothing * (sample - self.ratio)
+        self.observed += 1
+
+    def trim_middle(self, text: str, budget: int) -> str:
+        """Cut the middle out of text so its estimate fits budget, keeping the head and the tail"""
+        tokens = self.estimate(text)
+        if tokens <= budget:
+            return text
+        keep = budget - self.estimate(OMITTED.format(tokens=tokens))
+        if keep <= 0:
+            raise ValueError(f"Token budget {budget} is too small to hold any of the text")
+
+        # Start from the average characters per token and shrink until the estimate fits
+        allowance = int(len(text) * keep / tokens)
+        while allowance > 0:
+            head = text[:allowance // 2]
+            tail = text[len(text) - (allowance - len(head)):]
+            # Cut at whitespace so no word is split
+            head = head[:head.rfind(" ") + 1] if " " in head else head
+            tail = tail[tail.find(" "):] if " " in tail else tail
+            kept = self.estimate(head) + self.estimate(tail)
+            trimmed = head.rstrip() + OMITTED.format(tokens=max(1, tokens - kept)) + tail.lstrip()
+            if self.estimate(trimmed) <= budget:
+                return trimmed
+            allowance = int(allowance * 0.9)
+        raise ValueError(f"Token budget {budget} is too small to hold any of the text")
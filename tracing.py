@@ -0,0 +1,242 @@
+import atexit
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+class Span:
+    """One timed operation within a trace; times are monotonic offsets from the trace start"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "status", "attributes")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "ok"
+        self.attributes = attributes
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def fail(self, message: Optional[str]):
+        self.status = "error"
+        self.attributes.setdefault("error", message)
+
+    def as_dict(self) -> Dict[str, Any]:
+        offset_ms = (self.start_ns - self.trace.start_ns) / 1e6
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "timestamp": self.trace.wall_start + offset_ms / 1000,
+            "start_ms": round(offset_ms, 3),
+            "duration_ms": round(((self.end_ns or self.start_ns) - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+class _NoopSpan:
+    """Stand-in used when no trace is active"""
+
+    span_id = None
+
+    def set(self, **attributes: Any):
+        pass
+
+    def fail(self, message: Optional[str]):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    """All spans of one request, written together when the root span ends"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.wall_start = time.time()
+        self.start_ns = time.perf_counter_ns()
+        self.spans: List[Span] = []
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+class Tracer:
+    """Collects spans per request and appends them to an NDJSON file
+
+    Finished traces are queued and a writer thread appends them, so requests
+    never wait on the file. When the queue is full, traces are dropped and
+    counted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = "data/traces.ndjson",
+        max_bytes: int = 50 * 1024 * 1024,
+        sink: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        max_queue: int = 10000
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        # Receives each finished trace instead of the file (used by the benchmark suite)
+        self.sink = sink
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=max_queue)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) or self.sink is not None
+
+    @contextmanager
+    def trace(self, trace_id: str, name: str = "request", **attributes: Any) -> Iterator[Any]:
+        """Open the root span of a new trace; nested span() calls attach to it"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        trace = Trace(trace_id)
+        with _open_span(trace, name, None, attributes) as root:
+            yield root
+        if self.sink is not None:
+            self.sink([span.as_dict() for span in trace.spans])
+        else:
+            self._write(trace.spans)
+
+    def _write(self, spans: List[Span]):
+        self._start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._writer.start()
+                # Flush what is queued even if the process exits without close()
+                atexit.register(self.close)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            traces = [self._queue.get()]
+            # Append everything already waiting with one open()
+            while len(traces) < 1000:
+                try:
+                    traces.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in traces:
+                stopping = True
+                traces = [spans for spans in traces if spans is not None]
+            if not traces:
+                continue
+            try:
+                self._append(traces)
+            except Exception as e:
+                self.dropped += len(traces)
+                warnings.warn(f"Writing traces to {self.path} failed: {e}")
+
+    def _append(self, traces: List[List[Span]]):
+        lines = "".join(json.dumps(span.as_dict(), default=str) + "\n" for spans in traces for span in spans)
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self.max_bytes and path.exists() and path.stat().st_size > self.max_bytes:
+            os.replace(path, path.with_name(path.name + ".1"))
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+    def close(self, timeout: float = 5.0):
+        """Write everything queued and stop the writer, waiting at most timeout seconds"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is None or not writer.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        writer.join(timeout)
+
+@contextmanager
+def _open_span(trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Iterator[Span]:
+    current = Span(trace, name, parent_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end_ns = time.perf_counter_ns()
+        trace.spans.append(current)
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Reset from a different context (e.g. an async generator closed elsewhere)
+            _current.set(None)
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Time a block as a child of the current span (a no-op outside a trace)"""
+    parent = _current.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    with _open_span(parent.trace, name, parent.span_id, attributes) as child:
+        yield child
+
+def current_span() -> Any:
+    return _current.get() or NOOP_SPAN
+
+def mark_error(message: str):
+    """Flag the current span as failed without raising (nodes report errors in state)"""
+    current_span().fail(message)
+
+def load_trace(path: str, trace_id: str) -> List[Dict[str, Any]]:
+    """Read the spans of one trace (a unique prefix of the id is enough)"""
+    spans = []
+    for candidate in (path + ".1", path):
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, "r", encoding="utf-8") as file:
+            for line in file:
+                if trace_id in line[:64]:
+                    record = json.loads(line)
+                    if record["trace_id"].startswith(trace_id):
+                        spans.append(record)
+
+    trace_ids = {record["trace_id"] for record in spans}
+    if len(trace_ids) > 1:
+        raise ValueError(f"Trace id prefix '{trace_id}' is ambiguous ({len(trace_ids)} traces)")
+    return sorted(spans, key=lambda record: record["start_ms"])
+
+def last_trace_id(path: str) -> Optional[str]:
+    """Return the id of the most recently written trace"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        file.seek(max(0, file.tell() - 64 * 1024))
+        lines = file.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return json.loads(line)["trace_id"]
+        except (ValueError, KeyError):
+            continue
+    return None
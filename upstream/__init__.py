@@ -0,0 +1,10 @@
+from .breaker import CircuitBreaker, CircuitOpenError, breaker_for
+from .cassette import Cassette, CassetteError
+from .limits import UpstreamLimiter, limiter_for
+from .retry import Hedger, RetryPolicy
+from .singleflight import SingleFlight
+
+__all__ = [
+    "Cassette", "CassetteError", "CircuitBreaker", "CircuitOpenError", "Hedger", "RetryPolicy",
+    "SingleFlight", "UpstreamLimiter", "breaker_for", "limiter_for"
+]
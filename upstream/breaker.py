@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Optional
+
+import metrics
+import tracing
+from .retry import is_transient
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Exported as agent_upstream_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Failures that say the upstream is unhealthy; 429 is left to the limiter and a
+# 4xx says nothing about the upstream's health
+DEFAULT_FAILURE_STATUSES = (408, 500, 502, 503, 504)
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, upstream: str, reason: str, retry_in: float):
+        super().__init__(
+            f"{upstream} is unavailable (circuit open after {reason}); failing fast, next probe in {retry_in:.1f}s"
+        )
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit for one upstream
+
+    Closed: calls go through. The circuit opens after failure_threshold
+    consecutive failures, or once failure_rate of the last window calls failed
+    (with at least min_calls seen). Open: calls fail at once with
+    CircuitOpenError for reset_timeout seconds. Half-open: up to half_open_calls
+    probes go through; a success closes the circuit and a failure reopens it
+    with the timeout doubled, up to max_reset_timeout.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_timeout: float = 10.0,
+        max_reset_timeout: float = 120.0,
+        half_open_calls: int = 1,
+        failure_statuses: Iterable[int] = DEFAULT_FAILURE_STATUSES
+    ):
+        if failure_threshold < 1 or half_open_calls < 1:
+            raise ValueError("failure_threshold and half_open_calls must be at least 1")
+        if not 0 < failure_rate <= 1:
+            raise ValueError("Circuit failure_rate must be between 0 and 1")
+        if reset_timeout <= 0 or max_reset_timeout < reset_timeout:
+            raise ValueError("Circuit reset_timeout must be positive and not above max_reset_timeout")
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_calls = half_open_calls
+        self.failure_statuses = {str(status) for status in failure_statuses}
+
+        self.state = CLOSED
+        self.reason: Optional[str] = None
+        self.opened_at = 0.0
+        self.open_for = reset_timeout
+        self.consecutive_failures = 0
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.opens = 0
+        self.rejected = 0
+        self._probes = 0
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the next probe is allowed (0 unless open)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_for - time.monotonic())
+
+    @property
+    def degraded(self) -> bool:
+        return self.state != CLOSED
+
+    def _enter(self, state: str):
+        self.state = state
+        metrics.UPSTREAM_CIRCUIT_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def _open(self, reason: str):
+        # A failed probe waits twice as long as the previous open period
+        self.open_for = min(self.max_reset_timeout, self.open_for * 2) if self.state == HALF_OPEN else self.reset_timeout
+        self.reason = reason
+        self.opened_at = time.monotonic()
+        self.opens += 1
+        self._enter(OPEN)
+
+    def _close(self):
+        self.reason = None
+        self.consecutive_failures = 0
+        self.outcomes.clear()
+        self.open_for = self.reset_timeout
+        self._enter(CLOSED)
+
+    def _admit(self) -> bool:
+        """Let a call through, returning whether it is a half-open probe; raises CircuitOpenError otherwise"""
+        if self.state == OPEN and self.retry_in <= 0:
+            self._probes = 0
+            self._enter(HALF_OPEN)
+        if self.state == CLOSED:
+            return False
+        if self.state == HALF_OPEN and self._probes < self.half_open_calls:
+            self._probes += 1
+            return True
+
+        self.rejected += 1
+        metrics.UPSTREAM_REJECTED.inc(upstream=self.name)
+        tracing.current_span().set(circuit=self.state)
+        raise CircuitOpenError(self.name, self.reason or "failures", self.retry_in)
+
+    def _record(self, failed: bool, probe: bool):
+        if probe:
+            self._probes -= 1
+            if failed:
+                self._open("a failed probe")
+            elif self.state == HALF_OPEN:
+                self._close()
+            return
+        if self.state != CLOSED:
+            # Calls admitted before the circuit opened carry no new information
+            return
+
+        self.outcomes.append(failed)
+        if not failed:
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        failures = sum(self.outcomes)
+        if self.consecutive_failures >= self.failure_threshold:
+            self._open(f"{self.consecutive_failures} consecutive failures")
+        elif len(self.outcomes) >= self.min_calls and failures >= self.failure_rate * len(self.outcomes):
+            self._open(f"{failures} failures in {len(self.outcomes)} calls")
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """Run the enclosed upstream call if the circuit allows it and record its outcome"""
+        probe = self._admit()
+        try:
+            yield
+        except asyncio.CancelledError:
+            if probe:
+                # Abandoned probes free their slot without deciding anything
+                self._probes -= 1
+            raise
+        except Exception as e:
+            self._record(is_transient(e, self.failure_statuses), probe)
+            raise
+        else:
+            self._record(False, probe)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "upstream": self.name,
+            "state": self.state,
+            "reason": self.reason,
+            "retry_in": round(self.retry_in, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "recent_failures": sum(self.outcomes),
+            "recent_calls": len(self.outcomes),
+            "opens": self.opens,
+            "rejected": self.rejected
+        }
+
+# One breaker per upstream for the whole process
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def breaker_for(upstream: str, config: Optional[Dict[str, Any]] = None) -> CircuitBreaker:
+    """Return the process-wide breaker for an upstream, creating it from config on first use"""
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        breaker = _breakers[upstream] = CircuitBreaker(upstream, **(config or {}))
+    return breaker
+
+def _collect():
+    for breaker in _breakers.values():
+        if breaker.state == OPEN and breaker.retry_in <= 0:
+            # Report the state the next call will find
+            metrics.UPSTREAM_CIRCUIT_STATE.set(STATE_VALUES[HALF_OPEN], upstream=breaker.name)
+        else:
+            metrics.UPSTREAM_CIRCUIT_STATE.set(STATE_VALUES[breaker.state], upstream=breaker.name)
+
+metrics.REGISTRY.add_collector(_collect)
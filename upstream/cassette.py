@@ -0,0 +1,232 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+CASSETTE_VERSION = 1
+
+# Records buffered before the file is flushed (gzip compresses better in larger blocks)
+FLUSH_EVERY = 100
+
+class CassetteError(ValueError):
+    """Raised for unreadable cassettes and requests with no recorded response"""
+
+class ReplayedError(RuntimeError):
+    """An upstream failure reproduced from a cassette"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+def request_key(upstream: str, request: Dict[str, Any]) -> str:
+    """Stable identity of an upstream request"""
+    canonical = json.dumps([upstream, request], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:20]
+
+class Interaction:
+    """One recorded upstream call"""
+
+    __slots__ = ("upstream", "status", "response", "error", "duration", "chunks")
+
+    def __init__(self, record: Dict[str, Any]):
+        self.upstream = record["upstream"]
+        self.status = record.get("status")
+        self.response = record.get("response")
+        self.error = record.get("error")
+        self.duration = float(record.get("duration", 0.0))
+        # Streamed calls: [[seconds since call start, text], ...]
+        self.chunks: List[Tuple[float, str]] = [tuple(chunk) for chunk in record.get("chunks") or []]
+
+class Cassette:
+    """Captures upstream request/response pairs to a compact NDJSON file, or serves them back
+
+    In record mode every call made through tape() is appended, together with the
+    agent-level requests that caused it. In replay mode replay()/replay_stream()
+    answer from the file without touching the network, sleeping for the recorded
+    duration divided by speed (speed 0 returns immediately). Files ending in .gz
+    are gzip-compressed.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', got '{mode}'")
+        if speed < 0:
+            raise ValueError("Cassette replay speed must not be negative")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.started = time.perf_counter()
+
+        self.interactions: Dict[str, Deque[Interaction]] = {}
+        self.requests: List[Dict[str, Any]] = []
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+        self._file = None
+        self._created = False
+        self._pending = 0
+        if self.replaying:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def _load(self):
+        try:
+            with self._open("r") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            raise CassetteError(f"Cassette not found: {self.path}")
+        except (OSError, EOFError) as e:
+            raise CassetteError(f"Cannot read cassette {self.path}: {e}")
+
+        for number, line in enumerate(lines, 1):
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CassetteError(f"{self.path}:{number}: invalid JSON")
+            kind = record.get("type")
+            if kind == "cassette" and record.get("version") != CASSETTE_VERSION:
+                raise CassetteError(f"{self.path}: unsupported cassette version {record.get('version')!r}")
+            if kind == "call":
+                self.interactions.setdefault(record["key"], deque()).append(Interaction(record))
+            elif kind == "request":
+                self.requests.append(record)
+
+    def _write(self, record: Dict[str, Any]):
+        if self._file is None:
+            # A new recording replaces the file; writes after close() append to it
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._file = self._open("a" if self._created else "w")
+            if not self._created:
+                self._file.write(json.dumps({"type": "cassette", "version": CASSETTE_VERSION, "created": time.time()}) + "\n")
+                self._created = True
+        self._file.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record_request(self, user_input: str, flow: Optional[str], flow_id: str):
+        """Remember an agent-level request so replays can reproduce the arrival pattern"""
+        if self.recording:
+            self._write({
+                "type": "request",
+                "flow_id": flow_id,
+                "input": user_input,
+                "flow": flow,
+                "start": round(time.perf_counter() - self.started, 6)
+            })
+
+    @contextmanager
+    def tape(self, upstream: str, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Record the enclosed call; set ["response"] (and optionally ["status"], ["chunks"]) inside"""
+        entry: Dict[str, Any] = {"status": 200}
+        if not self.recording:
+            yield entry
+            return
+
+        start = time.perf_counter()
+        error = None
+        try:
+            yield entry
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            error = e
+            raise
+        finally:
+            if error is not None or "response" in entry:
+                status = entry["status"]
+                if error is not None:
+                    status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status_code", None)
+                record = {
+                    "type": "call",
+                    "upstream": upstream,
+                    "key": request_key(upstream, request),
+                    "request": request,
+                    "status": status,
+                    "start": round(start - self.started, 6),
+                    "duration": round(time.perf_counter() - start, 6)
+                }
+                if error is not None:
+                    record["error"] = f"{type(error).__name__}: {error}"
+                else:
+                    record["response"] = entry["response"]
+                if entry.get("chunks"):
+                    record["chunks"] = [[round(offset, 6), text] for offset, text in entry["chunks"]]
+                self._write(record)
+                self.recorded += 1
+
+    def _next(self, upstream: str, request: Dict[str, Any]) -> Interaction:
+        queue = self.interactions.get(request_key(upstream, request))
+        if not queue:
+            self.misses += 1
+            raise CassetteError(f"No recorded {upstream} response for this request in {self.path}")
+        # Identical requests are served in recorded order, cycling when exhausted
+        interaction = queue[0]
+        queue.rotate(-1)
+        self.replayed += 1
+        return interaction
+
+    async def _sleep(self, seconds: float):
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    async def replay(self, upstream: str, request: Dict[str, Any]) -> Interaction:
+        """Serve a recorded response after its (scaled) recorded latency"""
+        interaction = self._next(upstream, request)
+        await self._sleep(interaction.duration)
+        if interaction.error is not None:
+            raise ReplayedError(f"{interaction.error} (replayed)", interaction.status)
+        return interaction
+
+    async def replay_stream(self, upstream: str, request: Dict[str, Any]) -> AsyncIterator[str]:
+        """Yield recorded text chunks at their (scaled) recorded offsets"""
+        interaction = self._next(upstream, request)
+        chunks = interaction.chunks or [(interaction.duration, str((interaction.response or {}).get("content", "")))]
+        elapsed = 0.0
+        for offset, text in chunks:
+            await self._sleep(offset - elapsed)
+            elapsed = max(elapsed, offset)
+            yield text
+        if interaction.error is not None:
+            await self._sleep(interaction.duration - elapsed)
+            raise ReplayedError(f"{interaction.error} (replayed)", interaction.status)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "mode": self.mode,
+            "speed": self.speed,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses
+        }
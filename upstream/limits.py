@@ -0,0 +1,219 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Optional
+
+import metrics
+import tracing
+
+# Responses that mean "slow down" rather than "this request is bad"
+DEFAULT_OVERLOAD_STATUSES = (429, 503)
+
+class TokenBucket:
+    """Requests-per-second limit with bursts up to capacity
+
+    Callers reserve a token up front and sleep off any deficit, so waiters are
+    served in arrival order without a lock.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = rate
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        if self.capacity < 1:
+            raise ValueError("Token bucket burst must be at least 1")
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token; returns how long to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Give the unused reservation back
+                self.tokens += 1
+                raise
+        return wait
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit driven by overload responses and latency
+
+    Each success while the limit is in use raises it by 1/limit (about +1 per
+    round of requests). A 429/503, or smoothed latency above latency_tolerance
+    times the best recent latency, multiplies it by backoff, at most once per
+    typical request time so that one burst of failures counts as one signal.
+    """
+
+    def __init__(
+        self,
+        initial: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        backoff: float = 0.5,
+        latency_tolerance: Optional[float] = None
+    ):
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("Concurrency limits must satisfy 1 <= min_limit <= initial <= max_limit")
+        if not 0 < backoff < 1:
+            raise ValueError("Concurrency backoff must be between 0 and 1")
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.smoothed: Optional[float] = None
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release(None, False)
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: Optional[float], overloaded: bool):
+        """Return a slot; latency is None when the call was abandoned (no signal)"""
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        if latency is not None:
+            self._adjust(latency, overloaded, saturated)
+        self._wake()
+
+    def _adjust(self, latency: float, overloaded: bool, saturated: bool):
+        self.smoothed = latency if self.smoothed is None else self.smoothed * 0.9 + latency * 0.1
+        if not overloaded:
+            # Track the no-load latency: follow drops at once, drift up slowly
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.01
+
+        # Compare smoothed latency so single tail samples do not count as congestion
+        slow = (
+            self.latency_tolerance is not None
+            and self.baseline is not None
+            and self.smoothed > self.baseline * self.latency_tolerance
+        )
+        if overloaded or slow:
+            now = time.monotonic()
+            if now - self._last_decrease >= (self.smoothed or 0.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif saturated:
+            # Only grow when the current limit is actually being used
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+class UpstreamLimiter:
+    """Rate and concurrency limits for one upstream provider, shared by every node that calls it"""
+
+    def __init__(
+        self,
+        name: str,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        concurrency: Optional[Dict[str, Any]] = None,
+        overload_statuses: Iterable[int] = DEFAULT_OVERLOAD_STATUSES
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AdaptiveConcurrency(**concurrency) if concurrency else None
+        self.overload_statuses = {str(status) for status in overload_statuses}
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a token and a concurrency slot, then report the call's outcome on exit"""
+        if self.bucket is None and self.concurrency is None:
+            yield
+            return
+
+        queued = time.perf_counter()
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        if self.concurrency is not None:
+            await self.concurrency.acquire()
+        start = time.perf_counter()
+        if start - queued > 0.001:
+            metrics.UPSTREAM_THROTTLE.observe(start - queued, upstream=self.name)
+            tracing.current_span().set(throttled_ms=round((start - queued) * 1000, 3))
+
+        latency: Optional[float] = None
+        overloaded = False
+        try:
+            yield
+            latency = time.perf_counter() - start
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            latency = time.perf_counter() - start
+            overloaded = metrics.upstream_status(e) in self.overload_statuses
+            raise
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.release(latency, overloaded)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"upstream": self.name}
+        if self.bucket is not None:
+            stats.update(rate=self.bucket.rate, burst=self.bucket.capacity)
+        if self.concurrency is not None:
+            stats.update(
+                concurrency_limit=round(self.concurrency.limit, 2),
+                in_flight=self.concurrency.in_flight,
+                waiting=self.concurrency.waiting,
+                decreases=self.concurrency.decreases
+            )
+        return stats
+
+# One limiter per upstream for the whole process
+_limiters: Dict[str, UpstreamLimiter] = {}
+
+def limiter_for(upstream: str, config: Optional[Dict[str, Any]] = None) -> UpstreamLimiter:
+    """Return the process-wide limiter for an upstream, creating it from config on first use"""
+    limiter = _limiters.get(upstream)
+    if limiter is None:
+        limiter = _limiters[upstream] = UpstreamLimiter(upstream, **(config or {}))
+    return limiter
+
+def _collect():
+    for limiter in _limiters.values():
+        if limiter.concurrency is not None:
+            metrics.UPSTREAM_CONCURRENCY_LIMIT.set(limiter.concurrency.limit, upstream=limiter.name)
+            metrics.UPSTREAM_WAITING.set(limiter.concurrency.waiting, upstream=limiter.name)
+
+metrics.REGISTRY.add_collector(_collect)
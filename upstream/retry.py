@@ -0,0 +1,216 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional
+
+import metrics
+import tracing
+
+# Statuses worth retrying: rate limited, or a server-side failure that may be transient
+DEFAULT_RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# Exception classes (matched by name anywhere in the MRO, so httpx and google
+# client libraries need not be imported here) that indicate a transient failure
+TRANSIENT_ERRORS = {
+    "TransportError",
+    "TimeoutException",
+    "RemoteProtocolError",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "ResourceExhausted",
+    "InternalServerError",
+    "TooManyRequests",
+}
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+def is_transient(error: BaseException, statuses: Iterable[str]) -> bool:
+    """Whether an upstream error is likely to go away: one of the given statuses, or a timeout/connection failure"""
+    if isinstance(error, asyncio.CancelledError):
+        return False
+    status = metrics.upstream_status(error)
+    if status != "error":
+        return status in statuses
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for transient upstream failures
+
+    The n-th retry (starting at 0) waits a random time between 0 and
+    min(max_delay, base_delay * multiplier ** n), or longer if the upstream
+    sent Retry-After. Retries stop once max_elapsed seconds have been spent.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 5.0,
+        multiplier: float = 2.0,
+        max_elapsed: float = 60.0,
+        retry_on_status: Iterable[int] = DEFAULT_RETRY_STATUSES,
+        rng: Optional[random.Random] = None
+    ):
+        if max_retries < 0:
+            raise ValueError("max_retries must not be negative")
+        if base_delay < 0 or max_delay < 0 or multiplier < 1:
+            raise ValueError("Retry delays must not be negative and multiplier must be at least 1")
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_elapsed = max_elapsed
+        self.retry_on_status = {str(status) for status in retry_on_status}
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], max_retries: Optional[int] = None) -> "RetryPolicy":
+        """Build from an upstreams.<name>.retry block; max_retries (AGENT_MAX_RETRIES) overrides it"""
+        config = dict(config or {})
+        if max_retries is not None:
+            config["max_retries"] = max_retries
+        return cls(**config)
+
+    def is_retryable(self, error: BaseException) -> bool:
+        return is_transient(error, self.retry_on_status)
+
+    def backoff(self, retry: int, error: Optional[BaseException] = None) -> float:
+        """Delay before the given retry (0-based)"""
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** retry))
+        requested = _retry_after(error) if error is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        return delay
+
+    def next_delay(self, retry: int, error: BaseException, started: float) -> Optional[float]:
+        """Delay before retrying after error, or None when the call should fail now"""
+        if retry >= self.max_retries or not self.is_retryable(error):
+            return None
+        delay = self.backoff(retry, error)
+        if time.perf_counter() - started + delay > self.max_elapsed:
+            return None
+        return delay
+
+    async def pause(self, upstream: str, retry: int, error: BaseException, started: float) -> bool:
+        """Sleep before the given retry; False when error should be raised instead"""
+        delay = self.next_delay(retry, error, started)
+        if delay is None:
+            return False
+        metrics.UPSTREAM_RETRIES.inc(upstream=upstream, status=metrics.upstream_status(error))
+        tracing.current_span().set(retries=retry + 1)
+        await asyncio.sleep(delay)
+        return True
+
+    async def run(self, upstream: str, attempt: Callable[[], Awaitable[Any]], hedge: Optional["Hedger"] = None) -> Any:
+        """Call attempt() until it succeeds, retrying transient failures; each attempt may be hedged"""
+        started = time.perf_counter()
+        retry = 0
+        while True:
+            try:
+                if hedge is not None:
+                    return await hedge.run(upstream, attempt)
+                return await attempt()
+            except Exception as e:
+                if not await self.pause(upstream, retry, e, started):
+                    raise
+                retry += 1
+
+class Hedger:
+    """Sends a second copy of a slow request and keeps whichever finishes first
+
+    The hedge fires after the given quantile of recent successful latencies
+    (never sooner than min_delay), once min_samples latencies have been seen.
+    At most max_ratio of calls are hedged, which bounds the extra upstream load.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_delay: float = 0.05,
+        min_samples: int = 20,
+        window: int = 500,
+        max_ratio: float = 0.1
+    ):
+        if not 0 < quantile < 1:
+            raise ValueError("Hedge quantile must be between 0 and 1")
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["Hedger"]:
+        """Build from an upstreams.<name>.hedge block; None unless enabled"""
+        config = dict(config or {})
+        if not config.pop("enabled", False):
+            return None
+        return cls(**config)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))])
+
+    async def _timed(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        result = await attempt()
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def _start(self, attempt: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(self._timed(attempt))
+        # The losing copy's outcome is never awaited; mark it retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+
+    async def run(self, upstream: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        delay = self.delay()
+        if delay is None or self.hedged >= self.max_ratio * self.calls:
+            return await self._timed(attempt)
+
+        tasks = [self._start(attempt)]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+
+            self.hedged += 1
+            metrics.UPSTREAM_HEDGES.inc(upstream=upstream, outcome="sent")
+            tracing.current_span().set(hedged=True)
+            tasks.append(self._start(attempt))
+
+            pending = set(tasks)
+            errors: Dict[int, BaseException] = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self.hedge_wins += 1
+                            metrics.UPSTREAM_HEDGES.inc(upstream=upstream, outcome="won")
+                        return task.result()
+                    errors[tasks.index(task)] = task.exception()
+            # Both copies failed: report the primary's error
+            raise errors[0]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()